@@ -6,35 +6,49 @@ except ImportError:
     def load_dotenv():
         pass
 
-from flask import Flask, request, session
+from flask import Flask, request, session, g
 from flask_migrate import Migrate
 from flask_babel import Babel
 from app.models import db
 
 
+def get_current_user():
+    """Usuario de la petición actual, cargado una sola vez por petición en g"""
+    if 'current_user' not in g:
+        user = None
+        if 'user_id' in session:
+            from app.models import Usuario
+            user = Usuario.query.get(session['user_id'])
+            if user:
+                cache_user_session(user)
+        g.current_user = user
+    return g.current_user
+
+
+def cache_user_session(user):
+    """Guardar el idioma del usuario en la sesión firmada (solo si cambia)"""
+    language = getattr(user, 'preferred_language', None) or ''
+    if session.get('user_language') != language:
+        session['user_language'] = language
+
+
 def get_locale():
     """Determine the best language to use for the request"""
     try:
-        # Debug logging
-        # print(f"DEBUG: get_locale called. Session: {list(session.keys())}")
-        
         # 1. Check if user is authenticated and has a language preference
+        # (cached in the session, so no query per call)
         if 'user_id' in session:
-            from app.models import Usuario
-            user = Usuario.query.get(session['user_id'])
-            if user:
-                # print(f"DEBUG: User found: {user.username}, Pref: {getattr(user, 'preferred_language', 'N/A')}")
-                if getattr(user, 'preferred_language', None):
-                    return user.preferred_language
+            if 'user_language' not in session:
+                get_current_user()
+            if session.get('user_language'):
+                return session['user_language']
         
         # 2. Check session for temporary language selection
         if 'language' in session:
-            # print(f"DEBUG: Language in session: {session['language']}")
             return session['language']
         
         # 3. Fall back to browser's accept_languages
         best_match = request.accept_languages.best_match(['es', 'en'])
-        # print(f"DEBUG: Browser best match: {best_match}")
         return best_match or 'es'
     except Exception as e:
         # Fallback to Spanish if any error occurs
@@ -96,6 +110,19 @@ def create_app():
         # Inicializar storage de compatibilidad
         from app.models import storage, TableroStorage
     
+    # Las importaciones interrumpidas NO se retoman aquí: create_app también corre en
+    # el paso de migraciones del deploy, en los comandos `flask` y en los tests.
+    # Las retoma el proceso web (run.py, ver IMPORT_RESUME_ON_START) o el comando
+    # `flask reanudar-importaciones`.
+    app.config['IMPORT_RESUME_ON_START'] = os.getenv('IMPORT_RESUME_ON_START', 'true').lower() == 'true'
+    
+    @app.cli.command('reanudar-importaciones')
+    def reanudar_importaciones_command():
+        """Procesar ahora (en primer plano) las importaciones pendientes o interrumpidas"""
+        from app.utils.importacion import reanudar_importaciones
+        total = reanudar_importaciones(app, background=False)
+        print(f"✓ {total} importaciones retomadas")
+    
     @app.route('/health')
     def health_check():
         return "OK", 200
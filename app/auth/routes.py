@@ -1,4 +1,5 @@
 from flask import Blueprint, flash, redirect, render_template, request, session, url_for
+from app import cache_user_session
 from app.models import UserStorage
 
 auth_bp = Blueprint("auth", __name__)
@@ -29,6 +30,7 @@ def login():
             session["user_id"] = user.id
             session["username"] = user.username
             session["rol"] = user.rol
+            cache_user_session(user)
             session.permanent = remember
             
             flash(f"¡Bienvenido de nuevo, {user.nombre_completo or user.username}!", "success")
@@ -1,4 +1,4 @@
-from flask import Blueprint, redirect, render_template, session, url_for, current_app
+from flask import Blueprint, redirect, render_template, request, session, url_for, current_app
 from app.models import storage
 
 main_bp = Blueprint("main", __name__)
@@ -65,16 +65,69 @@ def recordatorios():
     if "user_id" not in session:
         return redirect(url_for("auth.login"))
     
-    # Datos que el template espera
+    from datetime import datetime
+    hoy = datetime.now().date()
+    filtro = request.args.get('filtro', 'todos')
+    
+    # Próximos cumpleaños (rango sobre cumple_ordinal indexado, con vuelta de año)
+    todos = []
+    for p in storage.get_upcoming_birthdays(limit=50):
+        proximo = _proximo_cumpleanos(p.fecha_nacimiento, hoy)
+        dias = (proximo - hoy).days
+        if dias == 0:
+            urgencia = 'hoy'
+        elif dias == 1:
+            urgencia = 'mañana'
+        else:
+            urgencia = 'pronto'
+        
+        todos.append({
+            'id': p.id,
+            'lista_id': p.lista_id,
+            'nombre': f"Cumpleaños de {p.nombre} {p.apellido or ''}".strip(),
+            'tablero_nombre': p.lista.tablero.nombre if p.lista and p.lista.tablero else "General",
+            'lista_nombre': p.lista.nombre if p.lista else "Sin lista",
+            'telefono': p.telefono,
+            'direccion': p.direccion,
+            'proximo_seguimiento': proximo.strftime('%d/%m/%Y'),
+            'estado_discipulado': 'Líder' if p.es_lider else ('Creciendo' if p.bautizado else 'Nuevo'),
+            'urgencia': urgencia
+        })
+    
+    # Los cumpleaños no vencen: siempre apuntan a la próxima fecha
     contadores = {
-        'todos': 12,
-        'vencidos': 3,
-        'hoy': 5,
-        'proximos': 4
+        'todos': len(todos),
+        'vencidos': 0,
+        'hoy': sum(1 for r in todos if r['urgencia'] == 'hoy'),
+        'proximos': sum(1 for r in todos if r['urgencia'] != 'hoy')
     }
-    recordatorios = []  # Lista vacía por ahora
     
-    return render_template("main/recordatorios.html", contadores=contadores, recordatorios=recordatorios)
+    if filtro == 'vencidos':
+        recordatorios = []
+    elif filtro == 'hoy':
+        recordatorios = [r for r in todos if r['urgencia'] == 'hoy']
+    elif filtro == 'proximos':
+        recordatorios = [r for r in todos if r['urgencia'] != 'hoy']
+    else:
+        filtro = 'todos'
+        recordatorios = todos
+    
+    return render_template("main/recordatorios.html", contadores=contadores, recordatorios=recordatorios,
+                           filtro_actual=filtro)
+
+
+def _proximo_cumpleanos(fecha_nacimiento, hoy):
+    """Próxima fecha de cumpleaños a partir de hoy (29/02 cae en 28/02 los años no bisiestos)"""
+    for anio in (hoy.year, hoy.year + 1):
+        try:
+            proximo = fecha_nacimiento.replace(year=anio)
+        except ValueError:
+            proximo = fecha_nacimiento.replace(year=anio, day=28)
+        if proximo >= hoy:
+            return proximo
+    return proximo
+
+
 @main_bp.route("/personas")
 def personas():
     if "user_id" not in session:
@@ -182,12 +235,14 @@ def set_language(language):
     
     # If user is authenticated, save to database
     if 'user_id' in session:
-        from app.models import Usuario, db
-        user = Usuario.query.get(session['user_id'])
+        from app import get_current_user, cache_user_session
+        from app.models import db
+        user = get_current_user()
         if user:
             print(f"DEBUG: Updating user {user.username} pref to {language}")
             user.preferred_language = language
             db.session.commit()
+            cache_user_session(user)
             print("DEBUG: Commit successful")
     
     # Redirect back to referrer or dashboard
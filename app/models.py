@@ -1,9 +1,11 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from datetime import datetime, timedelta
+import time
 import uuid
 from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy.dialects.postgresql import JSON
-from sqlalchemy import extract, func
+from sqlalchemy import func, or_, and_, bindparam, event, insert, select, update
+from sqlalchemy.orm import selectinload, Session
 
 db = SQLAlchemy()
 
@@ -19,7 +21,7 @@ class Usuario(db.Model):
     activo = db.Column(db.Boolean, default=True)
     rol = db.Column(db.String(20), default='user')
     suscripcion_activa = db.Column(db.Boolean, default=False)
-    stripe_customer_id = db.Column(db.String(120))
+    stripe_customer_id = db.Column(db.String(120), index=True)
     preferred_language = db.Column(db.String(5), default='es')
 
     
@@ -51,8 +53,8 @@ class Tablero(db.Model):
     icono = db.Column(db.String(10), default="👥")
     tipo = db.Column(db.String(50), default="ministerio")
     activo = db.Column(db.Boolean, default=True)
-    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
-    creador_id = db.Column(db.String(36), db.ForeignKey('usuarios.id'), nullable=False)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    creador_id = db.Column(db.String(36), db.ForeignKey('usuarios.id'), nullable=False, index=True)
     
     # Relaciones
     listas = db.relationship('Lista', backref='tablero', lazy=True, cascade="all, delete-orphan")
@@ -69,15 +71,17 @@ class Tablero(db.Model):
         return colors[sum(ord(c) for c in self.nombre) % len(colors)]
 
     def to_dict(self):
-        total_tarjetas = sum(len(l.tarjetas) for l in self.listas)
+        # Serializar las listas una sola vez y contar sobre el resultado
+        listas = [l.to_dict() for l in self.listas]
+        total_tarjetas = sum(len(l['tarjetas']) for l in listas)
         return {
             'id': self.id,
             'nombre': self.nombre,
             'descripcion': self.descripcion,
             'icono': self.icono,
             'tipo': self.tipo,
-            'listas': [l.to_dict() for l in self.listas],
-            'total_listas': len(self.listas),
+            'listas': listas,
+            'total_listas': len(listas),
             'total_tarjetas': total_tarjetas,
             'undo_stack': getattr(self, 'undo_stack', []),
             'historial': getattr(self, 'historial', [])
@@ -159,7 +163,7 @@ class Lista(db.Model):
     descripcion = db.Column(db.String(200))
     orden = db.Column(db.Integer, default=0)
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
-    tablero_id = db.Column(db.String(36), db.ForeignKey('tableros.id'), nullable=False)
+    tablero_id = db.Column(db.String(36), db.ForeignKey('tableros.id'), nullable=False, index=True)
     
     # Relaciones
     tarjetas = db.relationship('Tarjeta', backref='lista', lazy=True, cascade="all, delete-orphan")
@@ -175,8 +179,7 @@ class Lista(db.Model):
 
     def agregar_persona(self, **kwargs):
         # Filter kwargs to only match Tarjeta columns to avoid errors
-        valid_columns = [c.key for c in Tarjeta.__table__.columns]
-        filtered_kwargs = {k: v for k, v in kwargs.items() if k in valid_columns}
+        filtered_kwargs = {k: v for k, v in kwargs.items() if k in COLUMNAS_TARJETA}
         
         tarjeta = Tarjeta(lista_id=self.id, **filtered_kwargs)
         db.session.add(tarjeta)
@@ -192,17 +195,23 @@ class Lista(db.Model):
 
 class Tarjeta(db.Model):
     __tablename__ = 'tarjetas'
+    __table_args__ = (
+        # Carga de tarjetas por lista y búsqueda de personas sin coordenadas.
+        # lista_id es la primera columna, así que no hace falta un índice aparte.
+        db.Index('ix_tarjetas_lista_coords', 'lista_id', 'latitud', 'longitud'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     nombre = db.Column(db.String(100), nullable=False)
     apellido = db.Column(db.String(100))
     direccion = db.Column(db.String(200))
     telefono = db.Column(db.String(50))
-    email = db.Column(db.String(120))
+    email = db.Column(db.String(120), index=True)
     
     # Datos demográficos
     edad = db.Column(db.Integer)
-    fecha_nacimiento = db.Column(db.Date)
+    fecha_nacimiento = db.Column(db.Date, index=True)
+    cumple_ordinal = db.Column(db.Integer, index=True) # mes*100 + día, para buscar cumpleaños por rango
     estado_civil = db.Column(db.String(50))
     ocupacion = db.Column(db.String(100))
     
@@ -226,7 +235,7 @@ class Tarjeta(db.Model):
     
     # Metadatos
     orden = db.Column(db.Integer, default=0)
-    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     lista_id = db.Column(db.String(36), db.ForeignKey('listas.id'), nullable=False)
     
@@ -238,6 +247,10 @@ class Tarjeta(db.Model):
     def nombre_completo(self):
         return f"{self.nombre} {self.apellido or ''}".strip()
 
+    @staticmethod
+    def calcular_cumple_ordinal(fecha):
+        return fecha.month * 100 + fecha.day if fecha else None
+
     @property
     def tiene_hijos(self):
         return self.numero_hijos is not None and self.numero_hijos > 0
@@ -273,6 +286,222 @@ class Tarjeta(db.Model):
             'tiene_hijos': self.tiene_hijos
         }
 
+# Columnas válidas de Tarjeta, calculadas una sola vez (para filtrar datos de importación/undo)
+COLUMNAS_TARJETA = frozenset(c.key for c in Tarjeta.__table__.columns)
+
+class GeocodeCache(db.Model):
+    """Caché persistente de geocodificación, indexada por dirección normalizada"""
+    __tablename__ = 'geocode_cache'
+    
+    direccion_normalizada = db.Column(db.String(300), primary_key=True)
+    direccion = db.Column(db.String(300)) # Primera forma original vista
+    latitud = db.Column(db.Float) # None = el servicio no encontró la dirección
+    longitud = db.Column(db.Float)
+    hits = db.Column(db.Integer, default=0, nullable=False)
+    misses = db.Column(db.Integer, default=0, nullable=False)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def expirado(self, ttl_days):
+        if not ttl_days or not self.fecha_actualizacion:
+            return False
+        return (datetime.utcnow() - self.fecha_actualizacion).days >= ttl_days
+
+    @classmethod
+    def registrar_hit(cls, clave):
+        cls.query.filter_by(direccion_normalizada=clave).update(
+            {cls.hits: cls.hits + 1}, synchronize_session=False
+        )
+        db.session.commit()
+
+    @classmethod
+    def guardar(cls, clave, direccion, lat, lng):
+        """Guardar (o refrescar) el resultado remoto de una dirección y contar el miss"""
+        entrada = db.session.get(cls, clave)
+        if entrada is None:
+            entrada = cls(direccion_normalizada=clave, direccion=direccion, hits=0, misses=0)
+            db.session.add(entrada)
+        entrada.latitud = lat
+        entrada.longitud = lng
+        entrada.misses = (entrada.misses or 0) + 1
+        entrada.fecha_actualizacion = datetime.utcnow()
+        db.session.commit()
+        return entrada
+
+    @classmethod
+    def guardar_lote(cls, resultados):
+        """
+        Guardar (o refrescar) muchos resultados remotos: una consulta de las claves
+        que ya existen y un UPDATE / INSERT executemany para el resto. Cuenta un miss
+        por dirección. resultados: lista de dicts {'clave', 'direccion', 'lat', 'lng'}.
+        No hace commit.
+        """
+        if not resultados:
+            return 0
+        ahora = datetime.utcnow()
+        existentes = {clave for (clave,) in db.session.query(cls.direccion_normalizada).filter(
+            cls.direccion_normalizada.in_([r['clave'] for r in resultados])
+        )}
+        tabla = cls.__table__
+
+        actualizar = [
+            {'b_clave': r['clave'], 'b_lat': r['lat'], 'b_lng': r['lng'], 'b_fecha': ahora}
+            for r in resultados if r['clave'] in existentes
+        ]
+        if actualizar:
+            stmt = tabla.update().where(tabla.c.direccion_normalizada == bindparam('b_clave')).values(
+                latitud=bindparam('b_lat'),
+                longitud=bindparam('b_lng'),
+                misses=tabla.c.misses + 1,
+                fecha_actualizacion=bindparam('b_fecha')
+            )
+            db.session.execute(stmt, actualizar)
+
+        nuevas = [
+            {'direccion_normalizada': r['clave'], 'direccion': r['direccion'], 'latitud': r['lat'],
+             'longitud': r['lng'], 'hits': 0, 'misses': 1, 'fecha_creacion': ahora, 'fecha_actualizacion': ahora}
+            for r in resultados if r['clave'] not in existentes
+        ]
+        if nuevas:
+            db.session.execute(insert(tabla), nuevas)
+        return len(resultados)
+
+    @classmethod
+    def purgar_expirados(cls, ttl_days):
+        limite = datetime.utcnow() - timedelta(days=ttl_days)
+        borrados = cls.query.filter(cls.fecha_actualizacion < limite).delete(synchronize_session=False)
+        db.session.commit()
+        return borrados
+
+    @classmethod
+    def stats(cls):
+        total, hits, misses = db.session.query(
+            func.count(cls.direccion_normalizada), func.sum(cls.hits), func.sum(cls.misses)
+        ).one()
+        return {'entradas': total or 0, 'hits': hits or 0, 'misses': misses or 0}
+
+class ImportJob(db.Model):
+    """Trabajo de importación de Excel/CSV procesado en segundo plano"""
+    __tablename__ = 'import_jobs'
+
+    # Límite de mensajes de error guardados por trabajo
+    MAX_ERRORES = 50
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    lista_id = db.Column(db.String(36), db.ForeignKey('listas.id', ondelete='CASCADE'), nullable=False)
+    usuario_id = db.Column(db.String(36), db.ForeignKey('usuarios.id'))
+    filename = db.Column(db.String(255), nullable=False)
+    ruta_archivo = db.Column(db.String(500), nullable=False) # Copia del upload mientras se procesa
+    estado = db.Column(db.String(20), default='pendiente', nullable=False, index=True) # pendiente, en_proceso, completado, error
+    filas_leidas = db.Column(db.Integer, default=0, nullable=False)
+    procesadas = db.Column(db.Integer, default=0, nullable=False) # Filas ya enviadas al insert (para reanudar)
+    insertadas = db.Column(db.Integer, default=0, nullable=False)
+    fallidas = db.Column(db.Integer, default=0, nullable=False)
+    accion_duplicados = db.Column(db.String(20), default='omitir', nullable=False) # omitir, combinar, marcar
+    duplicados = db.Column(db.Integer, default=0, nullable=False) # Filas no insertadas por ser duplicados (omitidas o combinadas)
+    marcadas = db.Column(db.Integer, default=0, nullable=False) # Duplicados insertados igual (accion 'marcar')
+    avisos = db.Column(db.Text) # JSON con los primeros MAX_ERRORES avisos de posible duplicado
+    total_errores = db.Column(db.Integer, default=0, nullable=False)
+    errores = db.Column(db.Text) # JSON con los primeros MAX_ERRORES mensajes
+    columnas_faltantes = db.Column(db.Text) # JSON
+    mensaje = db.Column(db.Text)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow) # Latido mientras está en proceso
+    fecha_fin = db.Column(db.DateTime)
+
+    def to_dict(self):
+        import json
+        return {
+            'job_id': self.id,
+            'lista_id': self.lista_id,
+            'filename': self.filename,
+            'estado': self.estado,
+            'filas_leidas': self.filas_leidas,
+            'insertadas': self.insertadas,
+            'fallidas': self.fallidas,
+            'accion_duplicados': self.accion_duplicados,
+            'duplicados': self.duplicados,
+            'marcadas': self.marcadas,
+            'avisos': json.loads(self.avisos) if self.avisos else [],
+            'total_errores': self.total_errores,
+            'errores': json.loads(self.errores) if self.errores else [],
+            'columnas_faltantes': json.loads(self.columnas_faltantes) if self.columnas_faltantes else [],
+            'mensaje': self.mensaje,
+            'fecha_creacion': self.fecha_creacion.isoformat() if self.fecha_creacion else None,
+            'fecha_fin': self.fecha_fin.isoformat() if self.fecha_fin else None
+        }
+
+class GeocodingJob(db.Model):
+    """Trabajo de geocodificación en lote de un tablero, procesado en segundo plano"""
+    __tablename__ = 'geocoding_jobs'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    tablero_id = db.Column(db.String(36), db.ForeignKey('tableros.id', ondelete='CASCADE'), nullable=False)
+    usuario_id = db.Column(db.String(36), db.ForeignKey('usuarios.id'))
+    estado = db.Column(db.String(20), default='pendiente', nullable=False, index=True) # pendiente, en_proceso, completado, error
+    total = db.Column(db.Integer, default=0, nullable=False)
+    procesadas = db.Column(db.Integer, default=0, nullable=False)
+    geocodificadas = db.Column(db.Integer, default=0, nullable=False)
+    desde_cache = db.Column(db.Integer, default=0, nullable=False)
+    fallidas = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow) # Latido mientras está en proceso
+    fecha_inicio = db.Column(db.DateTime)
+    fecha_fin = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'tablero_id': self.tablero_id,
+            'estado': self.estado,
+            'total': self.total,
+            'procesadas': self.procesadas,
+            'geocodificadas': self.geocodificadas,
+            'desde_cache': self.desde_cache,
+            'fallidas': self.fallidas,
+            'error': self.error,
+            'inicio': self.fecha_inicio.isoformat() if self.fecha_inicio else None,
+            'fin': self.fecha_fin.isoformat() if self.fecha_fin else None
+        }
+
+class DeteccionDuplicados(db.Model):
+    """Búsqueda de personas duplicadas entre tarjetas, procesada en segundo plano"""
+    __tablename__ = 'deteccion_duplicados'
+
+    # Límite de pares candidatos guardados (los de mayor puntaje)
+    MAX_PARES = 500
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    usuario_id = db.Column(db.String(36), db.ForeignKey('usuarios.id'))
+    tablero_id = db.Column(db.String(36), db.ForeignKey('tableros.id', ondelete='CASCADE')) # None = todas las tarjetas
+    estado = db.Column(db.String(20), default='pendiente', nullable=False, index=True) # pendiente, en_proceso, completado, error
+    tarjetas = db.Column(db.Integer, default=0, nullable=False)
+    bloques = db.Column(db.Integer, default=0, nullable=False)
+    comparaciones = db.Column(db.Integer, default=0, nullable=False)
+    total_pares = db.Column(db.Integer, default=0, nullable=False)
+    pares = db.Column(db.Text) # JSON con los primeros MAX_PARES pares, de mayor a menor puntaje
+    mensaje = db.Column(db.Text)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow) # Latido mientras está en proceso
+    fecha_fin = db.Column(db.DateTime)
+
+    def to_dict(self):
+        import json
+        return {
+            'job_id': self.id,
+            'tablero_id': self.tablero_id,
+            'estado': self.estado,
+            'tarjetas': self.tarjetas,
+            'bloques': self.bloques,
+            'comparaciones': self.comparaciones,
+            'total_pares': self.total_pares,
+            'pares': json.loads(self.pares) if self.pares else [],
+            'mensaje': self.mensaje,
+            'fecha_creacion': self.fecha_creacion.isoformat() if self.fecha_creacion else None,
+            'fecha_fin': self.fecha_fin.isoformat() if self.fecha_fin else None
+        }
+
 # Clases de compatibilidad para no romper el código existente
 class UserStorage:
     def get_user(self, user_id):
@@ -310,8 +539,11 @@ class UserStorage:
 
 
 class TableroStorage:
+    STATS_TTL_SECONDS = 60
+
     def __init__(self):
         self._runtime_data = {} # Cache for transient data (undo_stack, history) keyed by tablero_id
+        self._stats_cache = None
 
     def get_all_tableros(self):
         return Tablero.query.all()
@@ -319,19 +551,63 @@ class TableroStorage:
     def get_tablero(self, tablero_id):
         tablero = Tablero.query.get(tablero_id)
         if tablero:
-            # Ensure runtime data storage exists for this tablero
-            if tablero_id not in self._runtime_data:
-                self._runtime_data[tablero_id] = {
-                    'undo_stack': [],
-                    'historial': []
-                }
-            
-            # Attach the persistent list objects to the transient tablero instance
-            # This works because lists are mutable references
-            tablero.undo_stack = self._runtime_data[tablero_id]['undo_stack']
-            tablero.historial = self._runtime_data[tablero_id]['historial']
-            
+            self._attach_runtime_data(tablero)
+        return tablero
+
+    def get_tablero_completo(self, tablero_id):
+        """
+        Cargar un tablero con todas sus listas y tarjetas en consultas acotadas.
+        Usa selectinload: 1 consulta para el tablero, 1 para sus listas y 1 para
+        todas las tarjetas, sin importar cuántas listas tenga. Pensado para
+        serializar el tablero completo (to_dict) sin N+1.
+        """
+        tablero = Tablero.query.options(
+            selectinload(Tablero.listas).selectinload(Lista.tarjetas)
+        ).filter_by(id=tablero_id).first()
+        if tablero:
+            self._attach_runtime_data(tablero)
         return tablero
+
+    def resolver(self, lista_id=None, tarjeta_id=None):
+        """
+        Resolver un lista_id o tarjeta_id a su (tablero, lista, tarjeta) con un
+        único JOIN sobre las claves foráneas, en vez de recorrer todos los tableros.
+        Retorna (None, None, None) si no existe.
+        """
+        if tarjeta_id:
+            fila = db.session.query(Tablero, Lista, Tarjeta).join(
+                Lista, Lista.tablero_id == Tablero.id
+            ).join(
+                Tarjeta, Tarjeta.lista_id == Lista.id
+            ).filter(Tarjeta.id == tarjeta_id).first()
+        elif lista_id:
+            fila = db.session.query(Tablero, Lista).join(
+                Lista, Lista.tablero_id == Tablero.id
+            ).filter(Lista.id == lista_id).first()
+            if fila:
+                fila = (fila[0], fila[1], None)
+        else:
+            fila = None
+
+        if not fila:
+            return None, None, None
+
+        tablero, lista, tarjeta = fila
+        self._attach_runtime_data(tablero)
+        return tablero, lista, tarjeta
+
+    def _attach_runtime_data(self, tablero):
+        # Ensure runtime data storage exists for this tablero
+        if tablero.id not in self._runtime_data:
+            self._runtime_data[tablero.id] = {
+                'undo_stack': [],
+                'historial': []
+            }
+        
+        # Attach the persistent list objects to the transient tablero instance
+        # This works because lists are mutable references
+        tablero.undo_stack = self._runtime_data[tablero.id]['undo_stack']
+        tablero.historial = self._runtime_data[tablero.id]['historial']
         
     def crear_tablero(self, nombre, descripcion, icono, creador_id):
         tablero = Tablero(nombre=nombre, descripcion=descripcion, icono=icono, creador_id=creador_id)
@@ -340,32 +616,62 @@ class TableroStorage:
         return tablero
         
     def get_stats(self):
+        """
+        Estadísticas del dashboard, cacheadas STATS_TTL_SECONDS e invalidadas al
+        crear/eliminar tableros, listas o tarjetas. Los conteos salen en una sola
+        consulta y el filtro del mes es un rango sobre fecha_creacion (usa el índice).
+        """
         now = datetime.now()
-        nuevos_mes = Tarjeta.query.filter(
-            extract('year', Tarjeta.fecha_creacion) == now.year,
-            extract('month', Tarjeta.fecha_creacion) == now.month
-        ).count()
+        clave = (now.year, now.month)
+        cache = self._stats_cache
+        if cache and cache['clave'] == clave and time.monotonic() - cache['momento'] < self.STATS_TTL_SECONDS:
+            return dict(cache['stats'])
         
-        return {
-            "total_tableros": Tablero.query.count(),
-            "total_listas": Lista.query.count(),
-            "total_personas": Tarjeta.query.count(),
+        inicio_mes = datetime(now.year, now.month, 1)
+        inicio_mes_siguiente = datetime(now.year + now.month // 12, now.month % 12 + 1, 1)
+        
+        total_tableros, total_listas, total_personas, nuevos_mes = db.session.query(
+            select(func.count(Tablero.id)).scalar_subquery(),
+            select(func.count(Lista.id)).scalar_subquery(),
+            select(func.count(Tarjeta.id)).scalar_subquery(),
+            select(func.count(Tarjeta.id)).where(
+                Tarjeta.fecha_creacion >= inicio_mes,
+                Tarjeta.fecha_creacion < inicio_mes_siguiente
+            ).scalar_subquery()
+        ).one()
+        
+        stats = {
+            "total_tableros": total_tableros,
+            "total_listas": total_listas,
+            "total_personas": total_personas,
             "nuevos_mes": nuevos_mes,
             "recordatorios_pendientes": 0 # Placeholder, will be calculated in route or separate method
         }
+        self._stats_cache = {'clave': clave, 'momento': time.monotonic(), 'stats': stats}
+        return dict(stats)
+
+    def invalidar_stats(self):
+        self._stats_cache = None
 
     def get_recent_tableros(self, limit=4):
         return Tablero.query.order_by(Tablero.fecha_creacion.desc()).limit(limit).all()
 
-    def get_upcoming_birthdays(self, limit=5):
-        # Simple implementation: get birthdays in current month
-        # A more complex implementation would handle year wrapping
-        now = datetime.now()
-        return Tarjeta.query.filter(
-            Tarjeta.fecha_nacimiento != None,
-            extract('month', Tarjeta.fecha_nacimiento) == now.month,
-            extract('day', Tarjeta.fecha_nacimiento) >= now.day
-        ).order_by(extract('day', Tarjeta.fecha_nacimiento)).limit(limit).all()
+    def get_upcoming_birthdays(self, limit=5, desde=None):
+        """
+        Próximos `limit` cumpleaños a partir de hoy, dando la vuelta al fin de año.
+        Dos rangos sobre cumple_ordinal (mes*100+día) indexado: [hoy, fin] y [inicio, hoy).
+        """
+        hoy = Tarjeta.calcular_cumple_ordinal(desde or datetime.now())
+        query = Tarjeta.query.options(selectinload(Tarjeta.lista).selectinload(Lista.tablero))
+        resultado = query.filter(
+            Tarjeta.cumple_ordinal >= hoy
+        ).order_by(Tarjeta.cumple_ordinal).limit(limit).all()
+        
+        if len(resultado) < limit:
+            resultado += query.filter(
+                Tarjeta.cumple_ordinal < hoy
+            ).order_by(Tarjeta.cumple_ordinal).limit(limit - len(resultado)).all()
+        return resultado
         
     def save_to_disk(self):
         db.session.commit()
@@ -378,12 +684,287 @@ class TableroStorage:
             if tablero_id in self._runtime_data:
                 del self._runtime_data[tablero_id]
 
+    # Geocodificación
+    def _query_sin_coordenadas(self, tablero_id, *columnas):
+        """Tarjetas del tablero con dirección pero sin coordenadas (nulas o 0,0)"""
+        query = db.session.query(*columnas) if columnas else Tarjeta.query
+        return query.join(Lista, Tarjeta.lista_id == Lista.id).filter(
+            Lista.tablero_id == tablero_id,
+            Tarjeta.direccion != None,
+            func.trim(Tarjeta.direccion) != '',
+            or_(
+                Tarjeta.latitud == None,
+                and_(Tarjeta.latitud == 0, Tarjeta.longitud == 0)
+            )
+        )
+
+    def get_tarjetas_sin_coordenadas(self, tablero_id):
+        return self._query_sin_coordenadas(tablero_id).all()
+
+    def contar_tarjetas_sin_coordenadas(self, tablero_id):
+        return self._query_sin_coordenadas(tablero_id, func.count(Tarjeta.id)).scalar()
+
+    def get_pagina_sin_coordenadas(self, tablero_id, limit=500, after_id=None):
+        """
+        Página (keyset por id) de personas sin coordenadas, solo con las columnas
+        necesarias para geocodificar. Retorna (filas, siguiente_cursor).
+        """
+        query = self._query_sin_coordenadas(
+            tablero_id, Tarjeta.id, Tarjeta.nombre, Tarjeta.apellido, Tarjeta.direccion
+        )
+        if after_id:
+            query = query.filter(Tarjeta.id > after_id)
+        filas = query.order_by(Tarjeta.id).limit(limit + 1).all()
+        siguiente = filas[limit - 1].id if len(filas) > limit else None
+        return filas[:limit], siguiente
+
+    def actualizar_coordenadas(self, coordenadas):
+        """
+        Escribir coordenadas de muchas tarjetas con un único UPDATE ejecutado como
+        executemany. coordenadas: lista de dicts {'id', 'lat', 'lng'}.
+        No hace commit.
+        """
+        if not coordenadas:
+            return 0
+        tabla = Tarjeta.__table__
+        stmt = tabla.update().where(tabla.c.id == bindparam('b_id')).values(
+            latitud=bindparam('b_lat'),
+            longitud=bindparam('b_lng')
+        )
+        db.session.execute(stmt, [
+            {'b_id': c['id'], 'b_lat': c['lat'], 'b_lng': c['lng']} for c in coordenadas
+        ])
+        return len(coordenadas)
+
+    def actualizar_coordenadas_tablero(self, tablero_id, coordenadas):
+        """
+        Validar en una consulta que las tarjetas pertenecen al tablero y escribir sus
+        coordenadas con un único UPDATE executemany. No hace commit.
+        Retorna (cantidad actualizada, lista de entradas rechazadas con motivo).
+        """
+        validas = []
+        rechazadas = []
+        for c in coordenadas:
+            try:
+                validas.append({'id': c['id'], 'lat': float(c['lat']), 'lng': float(c['lng'])})
+            except (KeyError, TypeError, ValueError):
+                rechazadas.append({'id': c.get('id') if isinstance(c, dict) else None, 'error': 'Datos inválidos'})
+
+        if validas:
+            ids_tablero = {tarjeta_id for (tarjeta_id,) in db.session.query(Tarjeta.id).join(
+                Lista, Tarjeta.lista_id == Lista.id
+            ).filter(
+                Lista.tablero_id == tablero_id,
+                Tarjeta.id.in_({c['id'] for c in validas})
+            )}
+            rechazadas.extend({'id': c['id'], 'error': 'Persona no encontrada'} for c in validas if c['id'] not in ids_tablero)
+            validas = [c for c in validas if c['id'] in ids_tablero]
+
+        return self.actualizar_coordenadas(validas), rechazadas
+
+    # Operaciones masivas (bulk) basadas en conjuntos
+    def get_tarjetas_tablero(self, tablero_id, tarjeta_ids):
+        """
+        Cargar con un solo IN (...) las tarjetas pedidas que pertenecen al tablero.
+        Retorna dict tarjeta_id -> tarjeta (las ajenas o inexistentes no aparecen).
+        """
+        ids = list(dict.fromkeys(tarjeta_ids))
+        if not ids:
+            return {}
+        return {t.id: t for t in Tarjeta.query.join(Lista, Tarjeta.lista_id == Lista.id).filter(
+            Lista.tablero_id == tablero_id,
+            Tarjeta.id.in_(ids)
+        )}
+
+    def _cargar_tarjetas_bulk(self, tablero_id, tarjeta_ids):
+        """
+        Cargar las tarjetas pedidas que pertenecen al tablero y calcular en una
+        pasada su posición original dentro de su lista.
+        Retorna lista de (tarjeta, index) en el orden en que se pidieron.
+        """
+        ids = list(dict.fromkeys(tarjeta_ids))
+        por_id = self.get_tarjetas_tablero(tablero_id, ids)
+        if not por_id:
+            return []
+        tarjetas = list(por_id.values())
+
+        # Posiciones: solo ids, una consulta para todas las listas afectadas
+        listas_ids = {t.lista_id for t in tarjetas}
+        posiciones = {}
+        contadores = {}
+        for tarjeta_id, lista_id in db.session.query(Tarjeta.id, Tarjeta.lista_id).filter(
+            Tarjeta.lista_id.in_(listas_ids)
+        ):
+            posiciones[tarjeta_id] = contadores.get(lista_id, 0)
+            contadores[lista_id] = posiciones[tarjeta_id] + 1
+
+        return [(por_id[i], posiciones.get(i, -1)) for i in ids if i in por_id]
+
+    def bulk_move_tarjetas(self, tablero_id, tarjeta_ids, lista_destino_id):
+        """
+        Mover varias tarjetas a lista_destino_id con un único UPDATE.
+        Retorna la lista de movimientos para Undo (mismo formato que bulk_move).
+        """
+        moves = []
+        for tarjeta, index in self._cargar_tarjetas_bulk(tablero_id, tarjeta_ids):
+            # Si ya está en la lista destino, saltar
+            if tarjeta.lista_id == lista_destino_id:
+                continue
+            moves.append({
+                'tarjeta_id': tarjeta.id,
+                'lista_origen_id': tarjeta.lista_id,
+                'lista_destino_id': lista_destino_id,
+                'index': index
+            })
+
+        if moves:
+            Tarjeta.query.filter(
+                Tarjeta.id.in_([m['tarjeta_id'] for m in moves])
+            ).update({Tarjeta.lista_id: lista_destino_id}, synchronize_session=False)
+            db.session.expire_all()
+        return moves
+
+    def bulk_delete_tarjetas(self, tablero_id, tarjeta_ids):
+        """
+        Eliminar varias tarjetas del tablero con un único DELETE.
+        Retorna las tarjetas eliminadas serializadas para Undo.
+        """
+        deleted_cards = [{
+            'tarjeta_data': tarjeta.to_dict(),
+            'lista_id': tarjeta.lista_id,
+            'index': index
+        } for tarjeta, index in self._cargar_tarjetas_bulk(tablero_id, tarjeta_ids)]
+
+        if deleted_cards:
+            Tarjeta.query.filter(
+                Tarjeta.id.in_([c['tarjeta_data']['id'] for c in deleted_cards])
+            ).delete(synchronize_session=False)
+            db.session.expire_all()
+            self.invalidar_stats()
+        return deleted_cards
+
+    # Importación
+    def importar_personas(self, lista_id, personas, chunk_size=500, on_progress=None):
+        """
+        Insertar personas (dicts de extract_person_data) en la lista con INSERTs
+        multi-fila de Core, confirmando cada `chunk_size` filas. No crea objetos
+        ORM, así que los listeners de Tarjeta no corren: cumple_ordinal se
+        calcula aquí y las estadísticas se invalidan al final.
+        on_progress(insertadas, errores) se llama después de cada bloque.
+        Retorna (insertadas, errores).
+        """
+        insertadas = 0
+        errores = []
+        bloque = []
+
+        def escribir(bloque):
+            nonlocal insertadas
+            columnas = set().union(*bloque)
+            filas = [{c: fila.get(c) for c in columnas} for fila in bloque]
+            try:
+                db.session.execute(insert(Tarjeta.__table__), filas)
+                db.session.commit()
+                insertadas += len(filas)
+            except Exception:
+                db.session.rollback()
+                # Reintentar fila por fila para aislar las que fallan
+                for fila in bloque:
+                    try:
+                        db.session.execute(insert(Tarjeta.__table__), [fila])
+                        db.session.commit()
+                        insertadas += 1
+                    except Exception as e:
+                        db.session.rollback()
+                        errores.append(f'Error creando persona: {str(e)}')
+            print(f"📥 Importadas {insertadas} personas en lista {lista_id}")
+            if on_progress:
+                on_progress(insertadas, errores)
+
+        for persona in personas:
+            fila = {k: v for k, v in persona.items() if k in COLUMNAS_TARJETA}
+            fila['lista_id'] = lista_id
+            fila['cumple_ordinal'] = Tarjeta.calcular_cumple_ordinal(fila.get('fecha_nacimiento'))
+            bloque.append(fila)
+            if len(bloque) >= chunk_size:
+                escribir(bloque)
+                bloque = []
+        if bloque:
+            escribir(bloque)
+
+        if insertadas:
+            self.invalidar_stats()
+        return insertadas, errores
+
+    def combinar_personas(self, combinaciones):
+        """
+        Completar tarjetas existentes con datos importados: cada campo vacío de la
+        tarjeta toma el valor importado y los que ya tienen dato no se tocan.
+        `combinaciones` es una lista de (tarjeta_id, persona); se aplica con un
+        solo UPDATE executemany. Retorna la cantidad de tarjetas combinadas.
+        """
+        if not combinaciones:
+            return 0
+        tabla = Tarjeta.__table__
+        campos = sorted(
+            set().union(*(persona.keys() for _, persona in combinaciones)) & COLUMNAS_TARJETA
+            - {'id', 'lista_id', 'orden', 'cumple_ordinal', 'fecha_creacion', 'fecha_actualizacion'}
+        )
+        valores = {}
+        for campo in campos:
+            columna = tabla.c[campo]
+            # En columnas de texto '' también cuenta como vacío
+            actual = func.nullif(columna, '') if isinstance(columna.type, db.String) else columna
+            valores[campo] = func.coalesce(actual, bindparam(f'v_{campo}'), columna)
+        stmt = update(tabla).where(tabla.c.id == bindparam('b_id')).values(valores)
+        filas = [
+            {'b_id': tarjeta_id, **{f'v_{c}': persona.get(c) if persona.get(c) != '' else None for c in campos}}
+            for tarjeta_id, persona in combinaciones
+        ]
+        db.session.execute(stmt, filas)
+        db.session.commit()
+        print(f"🔗 Combinadas {len(filas)} personas con tarjetas existentes")
+        return len(filas)
+
+    # Duplicados
+    def iter_datos_duplicados(self, tablero_id=None, chunk_size=1000):
+        """
+        Datos de contacto de las tarjetas (todas, o las de un tablero) para buscar
+        duplicados, con un cursor del lado del servidor y sin objetos ORM.
+        """
+        stmt = select(
+            Tarjeta.id, Tarjeta.nombre, Tarjeta.apellido, Tarjeta.email, Tarjeta.telefono,
+            Tarjeta.direccion, Tarjeta.latitud, Tarjeta.longitud
+        ).execution_options(yield_per=chunk_size)
+        if tablero_id:
+            stmt = stmt.join(Lista, Tarjeta.lista_id == Lista.id).where(Lista.tablero_id == tablero_id)
+        for fila in db.session.execute(stmt):
+            yield fila._mapping
+
+    # Exportación
+    def tiene_tarjetas(self, tablero_id):
+        return db.session.query(Tarjeta.id).join(Lista, Tarjeta.lista_id == Lista.id).filter(
+            Lista.tablero_id == tablero_id
+        ).first() is not None
+
+    def iter_filas_exportacion(self, tablero_id, campos, chunk_size=1000):
+        """
+        Recorrer las tarjetas del tablero (con el nombre de su lista) como filas
+        planas, con un cursor del lado del servidor (yield_per). Solo se piden las
+        columnas de `campos` y no se crean objetos ORM, así la memoria no depende
+        del tamaño del tablero.
+        """
+        columnas = [Lista.nombre.label('lista_nombre')] + [getattr(Tarjeta, c) for c in campos]
+        stmt = select(*columnas).select_from(Tarjeta).join(Lista, Tarjeta.lista_id == Lista.id).where(
+            Lista.tablero_id == tablero_id
+        ).order_by(Lista.orden, Lista.id, Tarjeta.orden, Tarjeta.id).execution_options(yield_per=chunk_size)
+        for fila in db.session.execute(stmt):
+            yield fila._mapping
+
     # Helper methods for Undo/Redo
     def _deserialize_tarjeta(self, data):
         # Create a new Tarjeta instance from dict data
         # Filter keys that match Tarjeta columns
-        valid_keys = [c.key for c in Tarjeta.__table__.columns]
-        filtered_data = {k: v for k, v in data.items() if k in valid_keys}
+        filtered_data = {k: v for k, v in data.items() if k in COLUMNAS_TARJETA}
         return Tarjeta(**filtered_data)
 
     def _deserialize_lista(self, data):
@@ -392,4 +973,19 @@ class TableroStorage:
         return Lista(**filtered_data)
 
 # Instancia global para compatibilidad
-storage = TableroStorage()
\ No newline at end of file
+storage = TableroStorage()
+
+
+@event.listens_for(Tarjeta, 'before_insert')
+@event.listens_for(Tarjeta, 'before_update')
+def _actualizar_cumple_ordinal(mapper, connection, tarjeta):
+    tarjeta.cumple_ordinal = Tarjeta.calcular_cumple_ordinal(tarjeta.fecha_nacimiento)
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidar_stats_en_cambios(session, flush_context):
+    # Altas o bajas de tableros, listas o tarjetas cambian los conteos del dashboard
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, (Tablero, Lista, Tarjeta)):
+            storage.invalidar_stats()
+            break
\ No newline at end of file
@@ -107,7 +107,7 @@ export class MapManager {
     loadMarkers() {
         // Obtener todas las tarjetas que tienen dirección
         const cards = document.querySelectorAll('.person-card');
-        const geocoder = new google.maps.Geocoder();
+        let sinCoordenadas = 0;
 
         // Limpiar marcadores existentes
         this.clearMarkers();
@@ -139,12 +139,19 @@ export class MapManager {
                 // Usar coordenadas existentes
                 this.addMarker({ lat, lng }, personData);
             } else if (personData.address && personData.address.trim()) {
-                console.log(`Geocoding address: ${personData.address}`);
-                // Geocodificar si no hay coordenadas
-                this.geocodeAndAddMarker(geocoder, personData.address, personData);
+                sinCoordenadas++;
             }
         });
 
+        // Las direcciones sin coordenadas se geocodifican en el servidor (una vez por carga de página)
+        if (sinCoordenadas > 0 && !this.geocodingStarted) {
+            console.log(`${sinCoordenadas} addresses without coordinates, starting server geocoding`);
+            this.geocodingStarted = true;
+            this.runGeocodingJob()
+                .then(progreso => { if (progreso && progreso.geocodificadas > 0) this.loadMarkers(); })
+                .catch(err => console.error('Error geocoding on server:', err));
+        }
+
         // Ajustar vista para mostrar todos los marcadores
         console.log(`Total markers: ${this.markers.length}`);
         if (this.markers.length > 0) {
@@ -238,82 +245,6 @@ export class MapManager {
         this.markers = [];
     }
 
-    geocodeAndAddMarker(geocoder, address, personData) {
-        geocoder.geocode({ 'address': address }, (results, status) => {
-            if (status === 'OK') {
-                // Crear icono SVG personalizado con el color de la lista
-                const svgMarker = {
-                    path: "M12 2C8.13 2 5 5.13 5 9c0 5.25 7 13 7 13s7-7.75 7-13c0-3.87-3.13-7-7-7zm0 9.5c-1.38 0-2.5-1.12-2.5-2.5s1.12-2.5 2.5-2.5 2.5 1.12 2.5 2.5-1.12 2.5-2.5 2.5z",
-                    fillColor: personData.color,
-                    fillOpacity: 1,
-                    strokeWeight: 1,
-                    strokeColor: "#FFFFFF",
-                    rotation: 0,
-                    scale: 2,
-                    anchor: new google.maps.Point(12, 22),
-                };
-
-                const marker = new google.maps.Marker({
-                    position: results[0].geometry.location,
-                    title: personData.name,
-                    icon: svgMarker,
-                    animation: google.maps.Animation.DROP
-                });
-
-                // Contenido enriquecido del InfoWindow
-                const contentString = `
-                    <div class="map-info-window" style="min-width: 250px; padding: 5px;">
-                        <div style="display: flex; align-items: center; margin-bottom: 10px; border-bottom: 2px solid ${personData.color}; padding-bottom: 8px;">
-                            <div style="background-color: ${personData.color}; color: white; width: 32px; height: 32px; border-radius: 50%; display: flex; align-items: center; justify-content: center; font-weight: bold; margin-right: 10px;">
-                                ${personData.initials}
-                            </div>
-                            <div>
-                                <h3 style="margin: 0; font-size: 16px; font-weight: bold;">${personData.name}</h3>
-                                <span style="font-size: 12px; color: #666; background-color: ${personData.color}20; padding: 2px 6px; border-radius: 4px;">
-                                    ${personData.listName}
-                                </span>
-                            </div>
-                        </div>
-                        
-                        <div style="margin-bottom: 12px; font-size: 13px;">
-                            <div style="margin-bottom: 4px;"><i class="fas fa-map-marker-alt" style="width: 16px; color: #666;"></i> ${personData.address}</div>
-                            ${personData.codigoPostal ? `<div style="margin-bottom: 4px;"><i class="fas fa-mail-bulk" style="width: 16px; color: #666;"></i> CP: ${personData.codigoPostal}</div>` : ''}
-                            ${personData.phone ? `<div style="margin-bottom: 4px;"><i class="fas fa-phone" style="width: 16px; color: #666;"></i> ${personData.phone}</div>` : ''}
-                            ${personData.email ? `<div style="margin-bottom: 4px;"><i class="fas fa-envelope" style="width: 16px; color: #666;"></i> ${personData.email}</div>` : ''}
-                            
-                            ${personData.conyuge ? `
-                            <div style="margin-top: 8px; padding-top: 8px; border-top: 1px dashed #eee;">
-                                <div style="font-weight: 600; margin-bottom: 2px;">Cónyuge:</div>
-                                <div><i class="fas fa-user-friends" style="width: 16px; color: #666;"></i> ${personData.conyuge} ${personData.edadConyuge ? `(${personData.edadConyuge} años)` : ''}</div>
-                            </div>
-                            ` : ''}
-                        </div>
-
-                        <button onclick="window.scrollToCard('${personData.listId}', '${personData.id}')" 
-                                style="width: 100%; background-color: ${personData.color}; color: white; border: none; padding: 8px; border-radius: 4px; cursor: pointer; font-weight: 500; display: flex; align-items: center; justify-content: center;">
-                            <i class="fas fa-list-ul" style="margin-right: 6px;"></i> Ver en Lista
-                        </button>
-                    </div>
-                `;
-
-                const infoWindow = new google.maps.InfoWindow({
-                    content: contentString
-                });
-
-                marker.addListener('click', () => {
-                    // Cerrar otros infoWindows si es necesario (opcional)
-                    infoWindow.open(this.map, marker);
-                });
-
-                this.markers.push(marker);
-                marker.setMap(this.map);
-
-                // Store data for filtering
-                marker.personData = personData;
-            }
-        });
-    }
-
     filterMarkers(filter) {
         console.log('Filtering map markers by:', filter);
         this.markers.forEach(marker => {
@@ -422,108 +353,100 @@ export class MapManager {
         }
     }
 
+    getTableroId() {
+        // Obtener ID del tablero de la URL de forma robusta
+        const pathParts = window.location.pathname.split('/');
+        let tableroId = pathParts.pop();
+        if (!tableroId) tableroId = pathParts.pop(); // Manejar trailing slash
+        return tableroId;
+    }
+
+    /**
+     * Lanzar la geocodificación en lote del tablero en el servidor y esperar a que termine,
+     * consultando su progreso. Al terminar, copia las coordenadas nuevas a las tarjetas.
+     */
+    async runGeocodingJob(onProgress = null) {
+        const tableroId = this.getTableroId();
+        if (!tableroId) {
+            throw new Error('No se pudo identificar el tablero');
+        }
+
+        const response = await fetch('/tableros/api/geocoding/batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ tablero_id: tableroId })
+        });
+        const data = await response.json();
+        if (!data.success) {
+            throw new Error(data.error || 'No se pudo iniciar la geocodificación');
+        }
+
+        let progreso = data.progreso;
+        while (progreso.estado === 'pendiente' || progreso.estado === 'en_proceso') {
+            if (onProgress) onProgress(progreso);
+            await new Promise(r => setTimeout(r, 1500));
+            const res = await fetch(`/tableros/api/geocoding/batch/${data.job_id}`);
+            const estado = await res.json();
+            if (!estado.success) {
+                throw new Error(estado.error || 'Trabajo no encontrado');
+            }
+            progreso = estado.progreso;
+        }
+
+        if (progreso.estado === 'error') {
+            throw new Error(progreso.error || 'Error en la geocodificación');
+        }
+        if (progreso.geocodificadas > 0) {
+            await this.refreshCardCoords(tableroId);
+        }
+        return progreso;
+    }
+
+    async refreshCardCoords(tableroId) {
+        // Copiar a las tarjetas del DOM las coordenadas guardadas por el servidor
+        const res = await fetch(`/tableros/api/tablero/${tableroId}/data`);
+        const tablero = await res.json();
+        (tablero.listas || []).forEach(lista => {
+            (lista.tarjetas || []).forEach(tarjeta => {
+                if (tarjeta.latitud == null || tarjeta.longitud == null) return;
+                const card = document.querySelector(`.person-card[data-id="${tarjeta.id}"]`);
+                if (card) {
+                    card.dataset.lat = tarjeta.latitud;
+                    card.dataset.lng = tarjeta.longitud;
+                }
+            });
+        });
+    }
+
     async batchGeocode() {
         const btn = document.getElementById('btnGeocodeBatch');
         const originalText = btn.innerHTML;
         btn.innerHTML = '<i class="fas fa-spinner fa-spin mr-2"></i>Iniciando...';
         btn.disabled = true;
+        this.geocodingStarted = true;
 
         try {
-            // Obtener ID del tablero de la URL de forma robusta
-            const pathParts = window.location.pathname.split('/');
-            let tableroId = pathParts.pop();
-            if (!tableroId) tableroId = pathParts.pop(); // Manejar trailing slash
-
-            console.log('Starting batch geocode for tablero:', tableroId);
-
-            if (!tableroId) {
-                throw new Error('No se pudo identificar el tablero');
-            }
-
-            // 1. Obtener personas que necesitan geocodificación
-            console.log('Fetching uncoded people...');
-            const response = await fetch('/tableros/api/geocoding/get_uncoded', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ tablero_id: tableroId })
+            const progreso = await this.runGeocodingJob(p => {
+                btn.innerHTML = `<i class="fas fa-spinner fa-spin mr-2"></i>${p.procesadas}/${p.total}`;
             });
 
-            console.log('Response status:', response.status);
-            const data = await response.json();
-            console.log('Response data:', data);
-
-            if (!data.success || data.count === 0) {
-                console.log('No uncoded people found or error:', data);
+            if (progreso.total === 0) {
                 alert('No hay direcciones nuevas para procesar.');
-                btn.innerHTML = originalText;
-                btn.disabled = false;
                 return;
             }
 
-            const total = data.count;
-            let processed = 0;
-            let successCount = 0;
-            const geocoder = new google.maps.Geocoder();
-
-            btn.innerHTML = `<i class="fas fa-spinner fa-spin mr-2"></i>0/${total}`;
-
-            // 2. Procesar cada persona (secuencialmente para no saturar API)
-            for (const persona of data.personas) {
-                try {
-                    const result = await this.geocodeAddress(geocoder, persona.direccion);
-                    if (result) {
-                        // 3. Guardar coordenadas
-                        await fetch('/tableros/api/personas/update_coords', {
-                            method: 'POST',
-                            headers: { 'Content-Type': 'application/json' },
-                            body: JSON.stringify({
-                                tablero_id: tableroId,
-                                persona_id: persona.id,
-                                lat: result.lat,
-                                lng: result.lng
-                            })
-                        });
-                        successCount++;
-                    }
-                } catch (err) {
-                    console.error(`Error geocoding ${persona.nombre}:`, err);
-                }
-
-                processed++;
-                btn.innerHTML = `<i class="fas fa-spinner fa-spin mr-2"></i>${processed}/${total}`;
-
-                // Pequeña pausa para respetar rate limits
-                await new Promise(r => setTimeout(r, 300));
-            }
-
-            alert(`Proceso completado. Se actualizaron ${successCount} de ${total} personas.`);
+            alert(`Proceso completado. Se actualizaron ${progreso.geocodificadas} de ${progreso.total} personas.`);
             this.loadMarkers();
 
         } catch (error) {
             console.error('Error batch geocoding:', error);
-            alert('Error de conexión al iniciar el proceso.');
+            alert('Error al geocodificar: ' + error.message);
         } finally {
             btn.innerHTML = originalText;
             btn.disabled = false;
         }
     }
 
-    geocodeAddress(geocoder, address) {
-        return new Promise((resolve, reject) => {
-            geocoder.geocode({ 'address': address }, (results, status) => {
-                if (status === 'OK' && results[0]) {
-                    resolve({
-                        lat: results[0].geometry.location.lat(),
-                        lng: results[0].geometry.location.lng()
-                    });
-                } else {
-                    console.warn(`Geocode failed for ${address}: ${status}`);
-                    resolve(null); // No fallar todo el proceso, solo retornar null
-                }
-            });
-        });
-    }
-
     async previewClusters() {
         const btn = document.getElementById('btnPreviewClusters');
         const previewDiv = document.getElementById('clusterPreview');
@@ -1,12 +1,11 @@
 from flask import Blueprint, render_template, session, redirect, url_for, flash, request, jsonify, send_file, current_app
 from io import BytesIO
 from datetime import datetime
-import pandas as pd
 import json
-from app.models import storage, UserStorage
+from app import get_current_user
+from app.models import storage
 
 tableros_bp = Blueprint("tableros", __name__)
-user_storage = UserStorage()
 
 @tableros_bp.before_request
 def check_subscription():
@@ -17,7 +16,8 @@ def check_subscription():
     if 'user_id' not in session:
         return redirect(url_for('auth.login'))
         
-    user = user_storage.get_user(session['user_id'])
+    # Usuario cargado una vez por petición (compartido con get_locale)
+    user = get_current_user()
     if not user:
         session.clear()
         return redirect(url_for('auth.login'))
@@ -138,7 +138,7 @@ def ver(tablero_id):
     if "user_id" not in session:
         return redirect(url_for("auth.login"))
 
-    tablero = storage.get_tablero(tablero_id)
+    tablero = storage.get_tablero_completo(tablero_id)
     if not tablero:
         flash("Tablero no encontrado", "error")
         return redirect(url_for("tableros.lista"))
@@ -160,7 +160,7 @@ def get_tablero_data(tablero_id):
     if "user_id" not in session:
         return jsonify({'error': 'No autorizado'}), 401
         
-    tablero = storage.get_tablero(tablero_id)
+    tablero = storage.get_tablero_completo(tablero_id)
     if not tablero:
         return jsonify({'error': 'Tablero no encontrado'}), 404
         
@@ -275,42 +275,11 @@ def agregar_tarjeta():
         if not lista_id:
             return jsonify({'error': 'Lista ID es requerido'}), 400
         
-        # Buscar la lista en todos los tableros
-        lista_encontrada = None
-        tablero_encontrado = None
-        
-        # Optimización: Si viene el tablero_id, buscar directamente
-        tablero_id = data.get('tablero_id')
-        if tablero_id:
-            tablero = storage.get_tablero(tablero_id)
-            if tablero:
-                lista = tablero.get_lista(lista_id)
-                if lista:
-                    lista_encontrada = lista
-                    tablero_encontrado = tablero
+        # Resolver la lista y su tablero con una sola consulta
+        tablero_encontrado, lista_encontrada, _ = storage.resolver(lista_id=lista_id)
         
-        # Si no se encontró (o no venía tablero_id), buscar en todos
         if not lista_encontrada:
-            for tablero in storage.get_all_tableros():
-                lista = tablero.get_lista(lista_id)
-                if lista:
-                    lista_encontrada = lista
-                    tablero_encontrado = tablero
-                    break
-        
-        if not lista_encontrada:
-            # Intentar buscar lista_id en el body si no vino en args
-            if not lista_id and data.get('lista_id'):
-                lista_id = data.get('lista_id')
-                for tablero in storage.get_all_tableros():
-                    lista = tablero.get_lista(lista_id)
-                    if lista:
-                        lista_encontrada = lista
-                        tablero_encontrado = tablero
-                        break
-            
-            if not lista_encontrada:
-                return jsonify({'error': 'Lista no encontrada'}), 404
+            return jsonify({'error': 'Lista no encontrada'}), 404
         
         # Extraer datos de la persona
         nombre = data.get('nombre', '').strip()
@@ -543,17 +512,10 @@ def importar_excel(lista_id):
     if "user_id" not in session:
         return redirect(url_for("auth.login"))
     
+    tablero_encontrado = None
     try:
-        # Buscar la lista en todos los tableros
-        lista_encontrada = None
-        tablero_encontrado = None
-        
-        for tablero in storage.get_all_tableros():
-            lista = tablero.get_lista(lista_id)
-            if lista:
-                lista_encontrada = lista
-                tablero_encontrado = tablero
-                break
+        # Resolver la lista y su tablero con una sola consulta
+        tablero_encontrado, lista_encontrada, _ = storage.resolver(lista_id=lista_id)
         
         if not lista_encontrada:
             flash('Lista no encontrada', 'error')
@@ -583,44 +545,38 @@ def importar_excel(lista_id):
             file_size = archivo.tell()
             archivo.seek(0)
 
-            if file_size > 10 * 1024 * 1024:  # 10MB
-                flash('❌ El archivo es demasiado grande. Máximo 10MB permitido.', 'error')
+            # La lectura es por streaming, así que el límite es configurable
+            max_bytes = current_app.config.get('IMPORT_MAX_BYTES', 10 * 1024 * 1024)
+            if file_size > max_bytes:
+                flash(f'❌ El archivo es demasiado grande. Máximo {max_bytes // (1024 * 1024)}MB permitido.', 'error')
                 return redirect(request.url)
             
-            # Usar el excel_handler para procesar el archivo
-            from app.utils.excel_handler import process_import_file
-            
-            personas_data, errores, file_type, columnas_faltantes = process_import_file(archivo, archivo.filename)
-            
-            if columnas_faltantes:
-                flash(f'⚠️ Advertencia: No se encontraron las siguientes columnas: {", ".join(columnas_faltantes)}. Verifica los encabezados de tu archivo.', 'warning')
-            
-            # Importar personas a la lista
-            tarjetas_importadas = 0
-            for persona_data in personas_data:
-                try:
-                    lista_encontrada.agregar_persona(
-                        responsable=session.get('username', 'Usuario'),
-                        **persona_data
-                    )
-                    tarjetas_importadas += 1
-                except Exception as e:
-                    errores.append(f'Error creando persona: {str(e)}')
-            
-            # Guardar cambios a disco
-            storage.save_to_disk()
-            
-            # Mostrar resultados
-            if tarjetas_importadas > 0:
-                flash(f'✅ Se importaron {tarjetas_importadas} personas exitosamente', 'success')
-            
-            if errores:
-                flash(f'⚠️ Se encontraron {len(errores)} errores: {"; ".join(errores[:3])}{"..." if len(errores) > 3 else ""}', 'warning')
+            # Qué hacer con las personas que ya están en el tablero
+            from app.utils.duplicados import ACCIONES_DUPLICADOS
+            accion_duplicados = request.form.get('duplicados', 'omitir')
+            if accion_duplicados not in ACCIONES_DUPLICADOS:
+                accion_duplicados = 'omitir'
+            
+            # Procesar en segundo plano: el trabajo queda en la BD y se consulta su progreso
+            from app.utils.importacion import encolar_importacion
+            job = encolar_importacion(
+                current_app._get_current_object(),
+                lista_encontrada.id,
+                archivo,
+                usuario_id=session.get('user_id'),
+                background=not current_app.config.get('TESTING', False),
+                accion_duplicados=accion_duplicados
+            )
             
-            if tarjetas_importadas == 0:
-                flash('❌ No se importó ninguna persona. Verifica el formato del archivo.', 'error')
-                return redirect(request.url)
+            if request.accept_mimetypes.best == 'application/json':
+                return jsonify({
+                    'success': True,
+                    'job_id': job.id,
+                    'status_url': url_for('tableros.estado_importacion', job_id=job.id),
+                    'progreso': job.to_dict()
+                }), 202
             
+            flash('🕒 Importación en proceso. Las personas aparecerán en la lista en unos momentos.', 'info')
             return redirect(url_for('tableros.ver', tablero_id=tablero_encontrado.id))
                     
     except Exception as e:
@@ -630,6 +586,62 @@ def importar_excel(lista_id):
         return redirect(url_for('tableros.lista'))
 
 
+@tableros_bp.route("/api/importaciones/<job_id>")
+def estado_importacion(job_id):
+    """Consultar el progreso de un trabajo de importación"""
+    if "user_id" not in session:
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    from app.utils.importacion import get_importacion
+    job = get_importacion(job_id)
+    if not job or job.usuario_id != session.get('user_id'):
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    
+    return jsonify({'success': True, 'progreso': job.to_dict()})
+
+
+@tableros_bp.route("/api/duplicados", methods=["POST"])
+def detectar_duplicados():
+    """
+    Lanzar la búsqueda de personas duplicadas en segundo plano. Con tablero_id
+    en el cuerpo JSON se limita a ese tablero; si no, revisa todas las tarjetas.
+    """
+    if "user_id" not in session:
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    tablero_id = data.get('tablero_id')
+    if tablero_id and not storage.get_tablero(tablero_id):
+        return jsonify({'error': 'Tablero no encontrado'}), 404
+    
+    from app.utils.duplicados import lanzar_deteccion
+    job = lanzar_deteccion(
+        current_app._get_current_object(),
+        usuario_id=session.get('user_id'),
+        tablero_id=tablero_id,
+        background=not current_app.config.get('TESTING', False)
+    )
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status_url': url_for('tableros.estado_duplicados', job_id=job.id)
+    }), 202
+
+
+@tableros_bp.route("/api/duplicados/<job_id>")
+def estado_duplicados(job_id):
+    """Consultar el estado y los pares candidatos de una detección de duplicados"""
+    if "user_id" not in session:
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    from app.utils.duplicados import get_deteccion
+    job = get_deteccion(job_id)
+    if not job or job.usuario_id != session.get('user_id'):
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    
+    return jsonify({'success': True, 'deteccion': job.to_dict()})
+
+
 @tableros_bp.route("/descargar_plantilla")
 def descargar_plantilla_excel():
     """Descargar template de Excel REAL para importación con campos del cónyuge"""
@@ -639,65 +651,37 @@ def descargar_plantilla_excel():
     try:
         # Intentar generar Excel real
         try:
-            import pandas as pd
-            
-            # Crear datos de ejemplo (igual estructura que tu CSV actual)
-            data = {
-                'Nombre': ['Juan Pérez', 'María García', 'Carlos López', 'Ana Martínez', 'Pedro Sánchez'],
-                'Dirección': ['Calle 123 Col. Centro', 'Av. Principal 456', 'Blvd. Sur 789', 'Col. Norte 321', 'Calle Centro 654'],
-                'Teléfono': ['555-0123', '555-0124', '555-0125', '555-0126', '555-0127'],
-                'Email': ['juan@example.com', 'maria@example.com', '', 'ana@example.com', ''],
-                'Edad': [35, 28, 42, 31, 29],
-                'Estado Civil': ['Casado', 'Soltera', 'Casado', 'Casada', 'Soltero'],
-                'Num Hijos': [2, 0, 3, 1, 0],
-                'Edades Hijos': ['5, 8', '', '10, 12, 15', '7', ''],
-                'Nombre Cónyuge': ['María Pérez', '', 'Ana López', 'Roberto Martínez', ''],
-                'Edad Cónyuge': [32, '', 38, 33, ''],
-                'Teléfono Cónyuge': ['555-0130', '', '555-0131', '555-0132', ''],
-                'Email Cónyuge': ['maria.perez@example.com', '', 'ana.lopez@example.com', '', ''],
-                'Trabajo Cónyuge': ['Maestra', '', 'Doctora', 'Ingeniero', ''],
-                'Fecha Matrimonio': ['2018-06-15', '', '2005-03-20', '2015-09-10', '']
-            }
-            
-            # Crear DataFrame
-            df = pd.DataFrame(data)
-            
-            # Crear archivo Excel en memoria
-            output = BytesIO()
-            
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name='Plantilla', index=False)
-                
-                # Ajustar ancho de columnas
-                workbook = writer.book
-                worksheet = writer.sheets['Plantilla']
-                
-                for column in worksheet.columns:
-                    max_length = 0
-                    column_letter = column[0].column_letter
-                    
-                    for cell in column:
-                        try:
-                            if len(str(cell.value)) > max_length:
-                                max_length = len(str(cell.value))
-                        except:
-                            pass
-                    
-                    adjusted_width = min(max_length + 2, 50)
-                    worksheet.column_dimensions[column_letter].width = adjusted_width
-            
-            output.seek(0)
+            from app.utils.excel_export import escribir_xlsx, XLSX_MIMETYPE
+            
+            # Datos de ejemplo (igual estructura que tu CSV actual)
+            encabezados = ['Nombre', 'Dirección', 'Teléfono', 'Email', 'Edad', 'Estado Civil', 'Num Hijos',
+                           'Edades Hijos', 'Nombre Cónyuge', 'Edad Cónyuge', 'Teléfono Cónyuge',
+                           'Email Cónyuge', 'Trabajo Cónyuge', 'Fecha Matrimonio']
+            filas = [
+                ['Juan Pérez', 'Calle 123 Col. Centro', '555-0123', 'juan@example.com', 35, 'Casado', 2,
+                 '5, 8', 'María Pérez', 32, '555-0130', 'maria.perez@example.com', 'Maestra', '2018-06-15'],
+                ['María García', 'Av. Principal 456', '555-0124', 'maria@example.com', 28, 'Soltera', 0,
+                 '', '', '', '', '', '', ''],
+                ['Carlos López', 'Blvd. Sur 789', '555-0125', '', 42, 'Casado', 3,
+                 '10, 12, 15', 'Ana López', 38, '555-0131', 'ana.lopez@example.com', 'Doctora', '2005-03-20'],
+                ['Ana Martínez', 'Col. Norte 321', '555-0126', 'ana@example.com', 31, 'Casada', 1,
+                 '7', 'Roberto Martínez', 33, '555-0132', '', 'Ingeniero', '2015-09-10'],
+                ['Pedro Sánchez', 'Calle Centro 654', '555-0127', '', 29, 'Soltero', 0,
+                 '', '', '', '', '', '', ''],
+            ]
+            
+            output = escribir_xlsx(encabezados, filas, titulo='Plantilla')
             
             return send_file(
                 output,
                 as_attachment=True,
                 download_name='plantilla_personas_con_conyuge.xlsx',
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+                mimetype=XLSX_MIMETYPE
             )
             
         except ImportError:
-            # Fallback a CSV si pandas no está disponible
-            flash('⚠️ Generando CSV (pandas no disponible)', 'warning')
+            # Fallback a CSV si openpyxl no está disponible
+            flash('⚠️ Generando CSV (openpyxl no disponible)', 'warning')
             
             # Tu contenido CSV original exacto
             contenido_csv = """Nombre,Dirección,Teléfono,Email,Edad,Estado Civil,Num Hijos,Edades Hijos,Nombre Cónyuge,Edad Cónyuge,Teléfono Cónyuge,Email Cónyuge,Trabajo Cónyuge,Fecha Matrimonio
@@ -732,54 +716,53 @@ def eliminar_lista(lista_id):
         return jsonify({'error': 'No autorizado'}), 401
     
     try:
-        # Buscar la lista en todos los tableros
-        for tablero in storage.get_all_tableros():
-            lista = tablero.get_lista(lista_id)
-            if lista:
-                # Verificar que la lista no tenga tarjetas
-                if len(lista.tarjetas) > 0:
-                    return jsonify({
-                        'error': 'No se puede eliminar una lista que contiene tarjetas'
-                    }), 400
-                
-                # Eliminar lista usando el método existente
-                nombre_lista = lista.nombre
-                
-                # Guardar datos para Undo
-                posicion = -1
-                try:
-                    posicion = tablero.orden_listas.index(lista_id)
-                except ValueError:
-                    pass
-                
-                lista_data = lista.to_dict()
-                
-                tablero.eliminar_lista(lista_id)
-                
-                # Registrar en historial
-                tablero.registrar_accion(
-                    session.get('username', 'Usuario'),
-                    'Eliminar Lista',
-                    f'Se eliminó la lista "{nombre_lista}"'
-                )
-                
-                # Registrar Undo
-                tablero.registrar_undo(
-                    'eliminar_lista',
-                    {
-                        'lista_data': lista_data,
-                        'posicion': posicion
-                    }
-                )
-                
-                storage.save_to_disk()
-                
-                return jsonify({
-                    'success': True,
-                    'message': 'Lista eliminada exitosamente'
-                }), 200
+        # Resolver la lista y su tablero con una sola consulta
+        tablero, lista, _ = storage.resolver(lista_id=lista_id)
+        if not lista:
+            return jsonify({'error': 'Lista no encontrada'}), 404
+        
+        # Verificar que la lista no tenga tarjetas
+        if len(lista.tarjetas) > 0:
+            return jsonify({
+                'error': 'No se puede eliminar una lista que contiene tarjetas'
+            }), 400
+        
+        # Eliminar lista usando el método existente
+        nombre_lista = lista.nombre
+        
+        # Guardar datos para Undo
+        posicion = -1
+        try:
+            posicion = tablero.orden_listas.index(lista_id)
+        except ValueError:
+            pass
+        
+        lista_data = lista.to_dict()
+        
+        tablero.eliminar_lista(lista_id)
+        
+        # Registrar en historial
+        tablero.registrar_accion(
+            session.get('username', 'Usuario'),
+            'Eliminar Lista',
+            f'Se eliminó la lista "{nombre_lista}"'
+        )
+        
+        # Registrar Undo
+        tablero.registrar_undo(
+            'eliminar_lista',
+            {
+                'lista_data': lista_data,
+                'posicion': posicion
+            }
+        )
         
-        return jsonify({'error': 'Lista no encontrada'}), 404
+        storage.save_to_disk()
+        
+        return jsonify({
+            'success': True,
+            'message': 'Lista eliminada exitosamente'
+        }), 200
         
     except Exception as e:
         return jsonify({'error': f'Error interno: {str(e)}'}), 500
@@ -792,48 +775,46 @@ def eliminar_tarjeta(tarjeta_id):
         return jsonify({'error': 'No autorizado'}), 401
     
     try:
-        # Buscar la tarjeta en todos los tableros y listas
-        for tablero in storage.get_all_tableros():
-            for lista in tablero.listas:
-                tarjeta = lista.get_tarjeta(tarjeta_id)
-                if tarjeta:
-                    # Guardar datos para Undo
-                    posicion = -1
-                    try:
-                        posicion = lista.tarjetas.index(tarjeta)
-                    except ValueError:
-                        pass
-                    
-                    tarjeta_data = tarjeta.to_dict()
-                    
-                    # Eliminar tarjeta usando el método existente
-                    nombre_tarjeta = tarjeta.nombre_completo
-                    lista.eliminar_tarjeta(tarjeta_id)
-                    
-                    # Registrar Undo
-                    tablero.registrar_undo(
-                        'eliminar_tarjeta',
-                        {
-                            'tarjeta_data': tarjeta_data,
-                            'lista_id': lista.id,
-                            'posicion': posicion
-                        }
-                    )
-                    
-                    # Registrar en historial
-                    tablero.registrar_accion(
-                        session.get('username', 'Usuario'),
-                        'Eliminar Tarjeta',
-                        f'Se eliminó a "{nombre_tarjeta}" de la lista "{lista.nombre}"'
-                    )
-                    storage.save_to_disk()
-                    
-                    return jsonify({
-                        'success': True,
-                        'message': 'Tarjeta eliminada exitosamente'
-                    }), 200
+        # Resolver tarjeta, lista y tablero con una sola consulta
+        tablero, lista, tarjeta = storage.resolver(tarjeta_id=tarjeta_id)
+        if not tarjeta:
+            return jsonify({'error': 'Tarjeta no encontrada'}), 404
+        
+        # Guardar datos para Undo
+        posicion = -1
+        try:
+            posicion = lista.tarjetas.index(tarjeta)
+        except ValueError:
+            pass
+        
+        tarjeta_data = tarjeta.to_dict()
+        
+        # Eliminar tarjeta usando el método existente
+        nombre_tarjeta = tarjeta.nombre_completo
+        lista.eliminar_tarjeta(tarjeta_id)
+        
+        # Registrar Undo
+        tablero.registrar_undo(
+            'eliminar_tarjeta',
+            {
+                'tarjeta_data': tarjeta_data,
+                'lista_id': lista.id,
+                'posicion': posicion
+            }
+        )
         
-        return jsonify({'error': 'Tarjeta no encontrada'}), 404
+        # Registrar en historial
+        tablero.registrar_accion(
+            session.get('username', 'Usuario'),
+            'Eliminar Tarjeta',
+            f'Se eliminó a "{nombre_tarjeta}" de la lista "{lista.nombre}"'
+        )
+        storage.save_to_disk()
+        
+        return jsonify({
+            'success': True,
+            'message': 'Tarjeta eliminada exitosamente'
+        }), 200
         
     except Exception as e:
         return jsonify({'error': f'Error interno: {str(e)}'}), 500
@@ -941,16 +922,8 @@ def editar_lista(lista_id):
     if "user_id" not in session:
         return redirect(url_for("auth.login"))
     
-    # Buscar la lista en todos los tableros
-    lista_encontrada = None
-    tablero_encontrado = None
-    
-    for tablero in storage.get_all_tableros():
-        lista = tablero.get_lista(lista_id)
-        if lista:
-            lista_encontrada = lista
-            tablero_encontrado = tablero
-            break
+    # Resolver la lista y su tablero con una sola consulta
+    tablero_encontrado, lista_encontrada, _ = storage.resolver(lista_id=lista_id)
     
     if not lista_encontrada:
         flash('Lista no encontrada', 'error')
@@ -985,21 +958,8 @@ def editar_tarjeta(lista_id, tarjeta_id):
     if "user_id" not in session:
         return redirect(url_for("auth.login"))
     
-    # Buscar la tarjeta en todos los tableros
-    tarjeta_encontrada = None
-    lista_encontrada = None
-    tablero_encontrado = None
-    
-    for tablero in storage.get_all_tableros():
-        for lista in tablero.listas:
-            tarjeta = lista.get_tarjeta(tarjeta_id)
-            if tarjeta:
-                tarjeta_encontrada = tarjeta
-                lista_encontrada = lista
-                tablero_encontrado = tablero
-                break
-        if tarjeta_encontrada:
-            break
+    # Resolver tarjeta, lista y tablero con una sola consulta
+    tablero_encontrado, lista_encontrada, tarjeta_encontrada = storage.resolver(tarjeta_id=tarjeta_id)
     
     if not tarjeta_encontrada:
         flash('Tarjeta no encontrada', 'error')
@@ -1074,46 +1034,71 @@ def get_uncoded_people():
         if not tablero:
             return jsonify({'error': 'Tablero no encontrado'}), 404
             
-        personas_to_code = []
-        personas = tablero.get_todas_las_personas()
+        # Consulta filtrada y paginada (keyset) sobre el índice de coordenadas
+        limit = min(max(int(data.get('limit', 500)), 1), 1000)
+        cursor = data.get('cursor')
         
-        print(f"DEBUG: Checking {len(personas)} people for geocoding in tablero {tablero.nombre}")
+        filas, next_cursor = storage.get_pagina_sin_coordenadas(tablero.id, limit=limit, after_id=cursor)
+        personas_to_code = [{
+            'id': f.id,
+            'nombre': f"{f.nombre} {f.apellido or ''}".strip(),
+            'direccion': f.direccion
+        } for f in filas]
         
-        for p_dict in personas:
-            # Buscar la tarjeta real
-            tarjeta = None
-            for lista in tablero.listas:
-                t = lista.get_tarjeta(p_dict['id'])
-                if t:
-                    tarjeta = t
-                    break
-            
-            if tarjeta:
-                # Debug info for each person with address
-                if tarjeta.direccion:
-                    print(f"DEBUG: Person {tarjeta.nombre_completo} has address: '{tarjeta.direccion}'. Lat: {tarjeta.latitud}, Lng: {tarjeta.longitud}")
-                
-                # Check if needs geocoding (address exists, and coords are missing or 0)
-                has_address = bool(tarjeta.direccion and tarjeta.direccion.strip())
-                needs_coords = (tarjeta.latitud == 0 and tarjeta.longitud == 0) or tarjeta.latitud is None
-                
-                if has_address and needs_coords:
-                    print(f"DEBUG: Adding {tarjeta.nombre_completo} to geocode list")
-                    personas_to_code.append({
-                        'id': tarjeta.id,
-                        'nombre': tarjeta.nombre_completo,
-                        'direccion': tarjeta.direccion
-                    })
-        
-        return jsonify({
-            'success': True, 
+        respuesta = {
+            'success': True,
             'personas': personas_to_code,
-            'count': len(personas_to_code)
-        })
+            'count': len(personas_to_code),
+            'next_cursor': next_cursor
+        }
+        if not cursor:
+            respuesta['total'] = storage.contar_tarjetas_sin_coordenadas(tablero.id)
+        
+        return jsonify(respuesta)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@tableros_bp.route("/api/geocoding/batch", methods=["POST"])
+def iniciar_geocodificacion():
+    """Lanzar geocodificación en lote del tablero en el servidor"""
+    if "user_id" not in session:
+        return jsonify({'error': 'No autorizado'}), 401
+        
+    try:
+        data = request.json
+        tablero_id = data.get('tablero_id')
+        
+        tablero = storage.get_tablero(tablero_id)
+        if not tablero:
+            return jsonify({'error': 'Tablero no encontrado'}), 404
+        
+        from app.utils.geocoding import iniciar_trabajo
+        job = iniciar_trabajo(
+            current_app._get_current_object(),
+            tablero.id,
+            usuario_id=session.get('user_id'),
+            background=not current_app.config.get('TESTING', False)
+        )
+        
+        return jsonify({'success': True, 'job_id': job.id, 'progreso': job.to_dict()}), 202
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@tableros_bp.route("/api/geocoding/batch/<job_id>")
+def estado_geocodificacion(job_id):
+    """Consultar el progreso de un trabajo de geocodificación"""
+    if "user_id" not in session:
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    from app.utils.geocoding import get_trabajo
+    job = get_trabajo(job_id)
+    if not job or job.usuario_id != session.get('user_id'):
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    
+    return jsonify({'success': True, 'progreso': job.to_dict()})
+
 @tableros_bp.route("/api/personas/update_coords", methods=["POST"])
 def update_person_coords():
     """Actualizar coordenadas de una persona específica"""
@@ -1131,21 +1116,46 @@ def update_person_coords():
         if not tablero:
             return jsonify({'error': 'Tablero no encontrado'}), 404
             
-        # Buscar persona
-        tarjeta_encontrada = None
-        for lista in tablero.listas:
-            t = lista.get_tarjeta(persona_id)
-            if t:
-                tarjeta_encontrada = t
-                break
-        
-        if tarjeta_encontrada:
-            tarjeta_encontrada.latitud = float(lat)
-            tarjeta_encontrada.longitud = float(lng)
-            storage.save_to_disk()
-            return jsonify({'success': True})
-        else:
-            return jsonify({'error': 'Persona no encontrada'}), 404
+        actualizadas, rechazadas = storage.actualizar_coordenadas_tablero(
+            tablero.id, [{'id': persona_id, 'lat': lat, 'lng': lng}]
+        )
+        if not actualizadas:
+            error = rechazadas[0]['error']
+            return jsonify({'error': error}), 404 if error == 'Persona no encontrada' else 400
+        
+        storage.save_to_disk()
+        return jsonify({'success': True})
+            
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@tableros_bp.route("/api/personas/update_coords_bulk", methods=["POST"])
+def update_people_coords_bulk():
+    """Actualizar coordenadas de muchas personas en una sola petición"""
+    if "user_id" not in session:
+        return jsonify({'error': 'No autorizado'}), 401
+        
+    try:
+        data = request.json
+        tablero_id = data.get('tablero_id')
+        coordenadas = data.get('coords', [])
+        
+        if not isinstance(coordenadas, list) or not coordenadas:
+            return jsonify({'error': 'Datos incompletos'}), 400
+        
+        tablero = storage.get_tablero(tablero_id)
+        if not tablero:
+            return jsonify({'error': 'Tablero no encontrado'}), 404
+        
+        # Validación en una consulta, un UPDATE executemany y un solo commit
+        actualizadas, rechazadas = storage.actualizar_coordenadas_tablero(tablero.id, coordenadas)
+        storage.save_to_disk()
+        
+        return jsonify({
+            'success': True,
+            'updated': actualizadas,
+            'rejected': rechazadas
+        })
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1238,6 +1248,12 @@ def apply_clustering():
             "#C026D3"  # Fuchsia Dark
         ]
         
+        # Cargar de una vez todas las tarjetas a mover (solo las de este tablero)
+        tarjetas = storage.get_tarjetas_tablero(tablero.id, [
+            member['id'] for cluster in clusters if not cluster.get('is_outlier')
+            for member in cluster['members']
+        ])
+        
         for i, cluster in enumerate(clusters):
             if cluster.get('is_outlier'):
                 continue
@@ -1250,25 +1266,13 @@ def apply_clustering():
             
             # Mover personas a la nueva lista
             for member in cluster['members']:
-                # Buscar persona en su lista actual
-                tarjeta_mover = None
-                lista_origen = None
-                
-                for lista in tablero.listas:
-                    t = lista.get_tarjeta(member['id'])
-                    if t:
-                        tarjeta_mover = t
-                        lista_origen = lista
-                        break
-                
-                if tarjeta_mover and lista_origen:
-                    # Mover actualizando la foreign key
-                    tarjeta_mover.lista_id = nueva_lista.id
+                tarjeta_mover = tarjetas.get(member['id'])
+                if tarjeta_mover:
+                    # Mover reasignando la lista (su id aún no existe: se genera al hacer flush)
+                    tarjeta_mover.lista = nueva_lista
                     moved_people += 1
-            
-            # Guardar cambios por cada cluster
-            storage.save_to_disk()
         
+        # Un solo commit: las tarjetas cargadas no se expiran entre grupos
         storage.save_to_disk()
         
         return jsonify({
@@ -1292,6 +1296,65 @@ def descargar_datos(formato):
     return redirect(url_for("tableros.lista"))
 
 
+# Columnas exportadas: (encabezado, campo de Tarjeta).
+# IMPORTANTE: Los nombres de columnas deben coincidir con excel_handler.py
+COLUMNAS_EXPORTACION = [
+    ('Lista', 'lista_nombre'),
+    ('Nombre', 'nombre_completo'),
+    ('Dirección', 'direccion'),
+    ('Teléfono', 'telefono'),
+    ('Edad', 'edad'),
+    ('Estado Civil', 'estado_civil'),
+    ('Num Hijos', 'numero_hijos'),
+    ('Edades Hijos', 'edades_hijos'),
+    ('Nombre Cónyuge', 'nombre_conyuge'),
+    ('Edad Cónyuge', 'edad_conyuge'),
+    ('Teléfono Cónyuge', 'telefono_conyuge'),
+    ('Trabajo Cónyuge', 'trabajo_conyuge'),
+    ('Fecha Matrimonio', 'fecha_matrimonio'),
+    ('Ocupación', 'ocupacion'),
+    ('Email', 'email'),
+    ('Responsable', None),
+    ('Notas', 'notas'),
+]
+_CAMPOS_EXPORTACION = ['nombre', 'apellido'] + [
+    campo for _, campo in COLUMNAS_EXPORTACION if campo not in (None, 'lista_nombre', 'nombre_completo')
+]
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def _iter_personas_exportacion(tablero_id):
+    """Generador de diccionarios {encabezado: valor}, una tarjeta a la vez"""
+    for fila in storage.iter_filas_exportacion(tablero_id, _CAMPOS_EXPORTACION):
+        persona = {}
+        for encabezado, campo in COLUMNAS_EXPORTACION:
+            if campo == 'nombre_completo':
+                persona[encabezado] = f"{fila['nombre']} {fila['apellido'] or ''}".strip()
+            elif campo is None:
+                persona[encabezado] = ''
+            else:
+                valor = fila[campo]
+                persona[encabezado] = '' if valor is None else valor
+        yield persona
+
+
+def _nombre_descarga(nombre_tablero, extension):
+    return f"{nombre_tablero}_datos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+
+def _respuesta_streaming(generador, filename, mimetype):
+    """Response que envía el generador por partes, con el contexto de la petición activo"""
+    from flask import Response, stream_with_context
+    from urllib.parse import quote
+
+    response = Response(stream_with_context(generador), mimetype=mimetype)
+    ascii_name = filename.encode('ascii', 'ignore').decode('ascii') or f"datos.{filename.rsplit('.', 1)[-1]}"
+    response.headers['Content-Disposition'] = (
+        f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
+    )
+    return response
+
+
 @tableros_bp.route("/exportar_datos/<tablero_id>/<formato>")
 def exportar_datos(tablero_id, formato):
     """Exportar datos del tablero en diferentes formatos"""
@@ -1305,44 +1368,20 @@ def exportar_datos(tablero_id, formato):
             flash('Tablero no encontrado', 'error')
             return redirect(url_for('tableros.lista'))
         
-        # Recopilar todos los datos
-        datos_exportacion = []
-        for lista in tablero.listas.values():
-            for tarjeta in lista.tarjetas:
-                # Convertir tarjeta a diccionario con información completa
-                # IMPORTANTE: Los nombres de columnas deben coincidir con excel_handler.py
-                persona_data = {
-                    'Lista': lista.nombre,
-                    'Nombre': getattr(tarjeta, 'nombre_completo', tarjeta.titulo or ''),
-                    'Dirección': getattr(tarjeta, 'direccion', tarjeta.descripcion or ''),
-                    'Teléfono': getattr(tarjeta, 'telefono', ''),
-                    'Edad': getattr(tarjeta, 'edad', ''),
-                    'Estado Civil': getattr(tarjeta, 'estado_civil', ''),
-                    'Num Hijos': getattr(tarjeta, 'numero_hijos', ''),
-                    'Edades Hijos': getattr(tarjeta, 'edades_hijos', ''),
-                    'Nombre Cónyuge': getattr(tarjeta, 'nombre_conyuge', ''),
-                    'Edad Cónyuge': getattr(tarjeta, 'edad_conyuge', ''),
-                    'Teléfono Cónyuge': getattr(tarjeta, 'telefono_conyuge', ''),
-                    'Trabajo Cónyuge': getattr(tarjeta, 'trabajo_conyuge', ''),
-                    'Fecha Matrimonio': getattr(tarjeta, 'fecha_matrimonio', ''),
-                    'Ocupación': getattr(tarjeta, 'ocupacion', ''),
-                    'Email': getattr(tarjeta, 'email', ''),
-                    'Responsable': getattr(tarjeta, 'responsable', ''),
-                    'Notas': getattr(tarjeta, 'notas', ''),
-                }
-                datos_exportacion.append(persona_data)
-        
-        if not datos_exportacion:
+        if not storage.tiene_tarjetas(tablero_id):
             flash('No hay datos para exportar en este tablero', 'warning')
             return redirect(url_for('tableros.ver', tablero_id=tablero_id))
         
-        # Generar archivo según formato
+        # Generar archivo según formato. Las filas salen de un cursor y nunca
+        # se arma la lista completa en memoria.
         if formato == 'csv':
-            return _generar_csv(datos_exportacion, tablero.nombre)
+            return _generar_csv(_iter_personas_exportacion(tablero_id), tablero.nombre)
         elif formato == 'excel':
-            return _generar_excel(datos_exportacion, tablero.nombre)
+            return _generar_excel(_iter_personas_exportacion(tablero_id), tablero.nombre)
         elif formato == 'json':
-            return _generar_json(datos_exportacion, tablero.nombre)
+            return _generar_json(_iter_personas_exportacion(tablero_id), tablero.nombre)
+        elif formato == 'ndjson':
+            return _generar_ndjson(_iter_personas_exportacion(tablero_id), tablero.nombre)
         else:
             flash('Formato no soportado', 'error')
             return redirect(url_for('tableros.ver', tablero_id=tablero_id))
@@ -1353,101 +1392,84 @@ def exportar_datos(tablero_id, formato):
 
 
 def _generar_csv(datos, nombre_tablero):
-    """Generar archivo CSV"""
+    """Generar archivo CSV en streaming (datos puede ser cualquier iterable de dicts)"""
     import csv
     from io import StringIO
-    
-    output = StringIO()
-    if datos:
-        fieldnames = datos[0].keys()
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(datos)
-    
-    # Convertir a bytes
-    csv_bytes = BytesIO()
-    csv_bytes.write(output.getvalue().encode('utf-8'))
-    csv_bytes.seek(0)
-    
-    filename = f"{nombre_tablero}_datos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    
-    return send_file(
-        csv_bytes,
-        as_attachment=True,
-        download_name=filename,
-        mimetype='text/csv'
-    )
 
+    def generar():
+        buffer = StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=[encabezado for encabezado, _ in COLUMNAS_EXPORTACION])
+        writer.writeheader()
+        for persona in datos:
+            writer.writerow(persona)
+            if buffer.tell() >= EXPORT_CHUNK_SIZE:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
 
-def _generar_excel(datos, nombre_tablero):
-    """Generar archivo Excel"""
-    try:
-        import pandas as pd
-        
-        # Crear DataFrame
-        df = pd.DataFrame(datos)
-        
-        # Crear archivo Excel en memoria
-        output = BytesIO()
-        
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Datos', index=False)
-            
-            # Ajustar ancho de columnas
-            worksheet = writer.sheets['Datos']
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
-        
-        output.seek(0)
-        
-        filename = f"{nombre_tablero}_datos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        
-        return send_file(
-            output,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        
-    except ImportError:
-        # Si pandas no está disponible, generar CSV con extensión xlsx
-        return _generar_csv(datos, nombre_tablero)
+    return _respuesta_streaming(generar(), _nombre_descarga(nombre_tablero, 'csv'), 'text/csv')
 
 
-def _generar_json(datos, nombre_tablero):
-    """Generar archivo JSON"""
-    import json
-    
-    output_data = {
-        'tablero': nombre_tablero,
-        'fecha_exportacion': datetime.now().isoformat(),
-        'total_personas': len(datos),
-        'datos': datos
-    }
-    
-    json_bytes = BytesIO()
-    json_bytes.write(json.dumps(output_data, indent=2, ensure_ascii=False).encode('utf-8'))
-    json_bytes.seek(0)
-    
-    filename = f"{nombre_tablero}_datos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+def _generar_excel(datos, nombre_tablero):
+    """Generar archivo Excel (write-only de openpyxl, datos puede ser un generador)"""
+    from app.utils.excel_export import escribir_xlsx, XLSX_MIMETYPE
+
+    encabezados = [encabezado for encabezado, _ in COLUMNAS_EXPORTACION]
+    output = escribir_xlsx(
+        encabezados,
+        ([persona[e] for e in encabezados] for persona in datos),
+        titulo='Datos'
+    )
     
     return send_file(
-        json_bytes,
+        output,
         as_attachment=True,
-        download_name=filename,
-        mimetype='application/json'
+        download_name=_nombre_descarga(nombre_tablero, 'xlsx'),
+        mimetype=XLSX_MIMETYPE
     )
 
 
+def _generar_json(datos, nombre_tablero):
+    """
+    Generar archivo JSON en streaming. Mismo documento que antes ({tablero,
+    fecha_exportacion, datos, total_personas}), escrito persona a persona;
+    total_personas va al final porque recién se conoce al terminar.
+    """
+    def generar():
+        cabecera = json.dumps({'tablero': nombre_tablero, 'fecha_exportacion': datetime.now().isoformat()},
+                              ensure_ascii=False)
+        yield (cabecera[:-1] + ', "datos": [').encode('utf-8')
+        total = 0
+        partes = []
+        for persona in datos:
+            partes.append(('' if total == 0 else ', ') + json.dumps(persona, ensure_ascii=False, default=str))
+            total += 1
+            if len(partes) >= 500:
+                yield ''.join(partes).encode('utf-8')
+                partes = []
+        partes.append(f'], "total_personas": {total}}}')
+        yield ''.join(partes).encode('utf-8')
+
+    return _respuesta_streaming(generar(), _nombre_descarga(nombre_tablero, 'json'), 'application/json')
+
+
+def _generar_ndjson(datos, nombre_tablero):
+    """Generar NDJSON en streaming: una persona por línea"""
+    def generar():
+        partes = []
+        for persona in datos:
+            partes.append(json.dumps(persona, ensure_ascii=False, default=str) + '\n')
+            if len(partes) >= 500:
+                yield ''.join(partes).encode('utf-8')
+                partes = []
+        if partes:
+            yield ''.join(partes).encode('utf-8')
+
+    return _respuesta_streaming(generar(), _nombre_descarga(nombre_tablero, 'ndjson'), 'application/x-ndjson')
+
+
 @tableros_bp.route("/mover_lista", methods=["POST"])
 def mover_lista():
     """Reordenar listas en el tablero (Drag & Drop)"""
@@ -1466,16 +1488,8 @@ def mover_lista():
         if not lista_id:
             return jsonify({'error': 'Lista ID requerido'}), 400
         
-        # Buscar la lista y el tablero
-        lista_encontrada = None
-        tablero_encontrado = None
-        
-        for tablero in storage.get_all_tableros():
-            lista = tablero.get_lista(lista_id)
-            if lista:
-                lista_encontrada = lista
-                tablero_encontrado = tablero
-                break
+        # Resolver la lista y su tablero con una sola consulta
+        tablero_encontrado, lista_encontrada, _ = storage.resolver(lista_id=lista_id)
         
         if not lista_encontrada or not tablero_encontrado:
             return jsonify({'error': 'Lista no encontrada'}), 404
@@ -1531,24 +1545,20 @@ def deshacer_accion():
             tarjeta_id = undo_data['tarjeta_id']
             lista_origen_id = undo_data['lista_origen_id']
             lista_destino_id = undo_data['lista_destino_id']
-            nueva_posicion = undo_data['nueva_posicion']
             
             # Buscar tarjeta y listas
             tarjeta = None
             lista_origen = tablero.get_lista(lista_origen_id)
             lista_destino = tablero.get_lista(lista_destino_id)
             
-            # Buscar tarjeta en cualquier lista (debería estar en lista_origen actual, que es la destino original)
-            for l in tablero.listas:
-                t = l.get_tarjeta(tarjeta_id)
-                if t:
-                    tarjeta = t
-                    # Remover de donde esté
-                    l.tarjetas.remove(t)
-                    break
+            # Buscar tarjeta en cualquier lista del tablero (debería estar en lista_origen actual, que es la destino original)
+            tablero_tarjeta, _, t = storage.resolver(tarjeta_id=tarjeta_id)
+            if t and tablero_tarjeta.id == tablero.id:
+                tarjeta = t
             
             if tarjeta and lista_destino:
-                lista_destino.tarjetas.insert(nueva_posicion, tarjeta)
+                # Mover actualizando la foreign key (sacarla de la colección la borraría como huérfana)
+                tarjeta.lista_id = lista_destino.id
                 
         elif action_type == 'eliminar_tarjeta':
             tarjeta_data = undo_data['tarjeta_data']
@@ -1591,6 +1601,9 @@ def deshacer_accion():
             
         elif action_type == 'bulk_move':
             moves = undo_data['moves']
+            # Cargar de una vez las tarjetas movidas y las listas del tablero
+            tarjetas = storage.get_tarjetas_tablero(tablero.id, [m['tarjeta_id'] for m in moves])
+            listas = {l.id for l in tablero.listas}
             # Revertir cada movimiento
             for move in moves:
                 tarjeta_id = move['tarjeta_id']
@@ -1598,23 +1611,10 @@ def deshacer_accion():
                 # lista_destino_id = move['lista_destino_id'] # No needed for undo
                 
                 # Mover tarjeta de vuelta a origen
-                tarjeta = None
-                # Buscar tarjeta
-                for l in tablero.listas:
-                    t = l.get_tarjeta(tarjeta_id)
-                    if t:
-                        tarjeta = t
-                        l.tarjetas.remove(t)
-                        break
-                
-                if tarjeta:
-                    lista_origen = tablero.get_lista(lista_origen_id)
-                    if lista_origen:
-                        index = move.get('index', -1)
-                        if index >= 0 and index <= len(lista_origen.tarjetas):
-                            lista_origen.tarjetas.insert(index, tarjeta)
-                        else:
-                            lista_origen.tarjetas.append(tarjeta)
+                tarjeta = tarjetas.get(tarjeta_id)
+                if tarjeta and lista_origen_id in listas:
+                    # Mover actualizando la foreign key (sacarla de la colección la borraría como huérfana)
+                    tarjeta.lista_id = lista_origen_id
 
         elif action_type == 'bulk_delete':
             deleted_cards = undo_data['deleted_cards']
@@ -1673,42 +1673,9 @@ def bulk_move():
         if not lista_destino:
             return jsonify({'error': 'Lista destino no encontrada'}), 404
             
-        moves_recorded = []
-        count = 0
-        
-        for tarjeta_id in tarjeta_ids:
-            # Buscar tarjeta y su lista actual
-            tarjeta = None
-            lista_origen = None
-            
-            for l in tablero.listas:
-                t = l.get_tarjeta(tarjeta_id)
-                if t:
-                    tarjeta = t
-                    lista_origen = l
-                    break
-            
-            if tarjeta and lista_origen:
-                # Si ya está en la lista destino, saltar
-                if lista_origen.id == lista_destino.id:
-                    continue
-                    
-                # Guardar índice original
-                try:
-                    index = lista_origen.tarjetas.index(tarjeta)
-                except ValueError:
-                    index = -1
-
-                # Mover actualizando foreign key
-                tarjeta.lista_id = lista_destino.id
-                
-                moves_recorded.append({
-                    'tarjeta_id': tarjeta.id,
-                    'lista_origen_id': lista_origen.id,
-                    'lista_destino_id': lista_destino.id,
-                    'index': index
-                })
-                count += 1
+        # Cargar, mover y registrar posiciones en operaciones de conjunto
+        moves_recorded = storage.bulk_move_tarjetas(tablero.id, tarjeta_ids, lista_destino.id)
+        count = len(moves_recorded)
         
         if count > 0:
             # Registrar historial
@@ -1752,29 +1719,9 @@ def bulk_delete():
         if not tablero:
             return jsonify({'error': 'Tablero no encontrado'}), 404
             
-        deleted_cards = []
-        count = 0
-        
-        for tarjeta_id in tarjeta_ids:
-            # Buscar tarjeta
-            for l in tablero.listas:
-                t = l.get_tarjeta(tarjeta_id)
-                if t:
-                    # Guardar datos para undo
-                    try:
-                        index = l.tarjetas.index(t)
-                    except ValueError:
-                        index = -1
-                        
-                    deleted_cards.append({
-                        'tarjeta_data': t.to_dict(),
-                        'lista_id': l.id,
-                        'index': index
-                    })
-                    # Eliminar
-                    l.tarjetas.remove(t)
-                    count += 1
-                    break
+        # Cargar y eliminar con un único DELETE, conservando datos para Undo
+        deleted_cards = storage.bulk_delete_tarjetas(tablero.id, tarjeta_ids)
+        count = len(deleted_cards)
         
         if count > 0:
             # Registrar historial
@@ -1,33 +1,152 @@
 import math
+import re
+import unicodedata
+import numpy as np
 import googlemaps
 from typing import List, Dict, Any, Tuple
-from app.models import Tarjeta
+from app.models import Tarjeta, GeocodeCache
+
+EARTH_RADIUS_MILES = 3958.8
+GEOCODE_CACHE_TTL_DAYS = 180
+
+# Abreviaturas de direcciones (es/en) plegadas a una forma canónica
+ABREVIATURAS_DIRECCION = {
+    'street': 'st', 'str': 'st',
+    'avenue': 'av', 'ave': 'av', 'avenida': 'av', 'avda': 'av',
+    'boulevard': 'blvd', 'bulevar': 'blvd', 'boulevar': 'blvd',
+    'road': 'rd', 'drive': 'dr', 'lane': 'ln', 'court': 'ct',
+    'place': 'pl', 'highway': 'hwy', 'parkway': 'pkwy', 'suite': 'ste',
+    'apartment': 'apt', 'apto': 'apt', 'departamento': 'apt', 'depto': 'apt', 'dpto': 'apt',
+    'cl': 'calle', 'colonia': 'col', 'carretera': 'carr',
+    'north': 'n', 'south': 's', 'east': 'e', 'west': 'w',
+    'norte': 'n', 'sur': 's', 'oriente': 'e', 'poniente': 'w',
+    'numero': 'no', 'num': 'no', 'nro': 'no',
+}
+
+
+def normalizar_direccion(direccion: str) -> str:
+    """
+    Normalizar una dirección para usarla como clave de caché:
+    sin tildes, minúsculas, sin puntuación, espacios colapsados y abreviaturas plegadas.
+    """
+    if not direccion:
+        return ""
+    texto = unicodedata.normalize('NFD', str(direccion))
+    texto = ''.join(c for c in texto if unicodedata.category(c) != 'Mn').lower()
+    tokens = re.sub(r'[^a-z0-9]+', ' ', texto).split()
+    return ' '.join(ABREVIATURAS_DIRECCION.get(t, t) for t in tokens)
+
+
+class GridIndex:
+    """
+    Índice espacial de rejilla lat/lng con celdas del tamaño del radio de búsqueda.
+    Guarda índices de la lista original; permite consultar solo las celdas que
+    pueden contener puntos dentro de max_distance_miles y eliminar en O(1).
+    """
+    def __init__(self, personas: List[Dict], max_distance_miles: float):
+        self.max_distance_miles = max(max_distance_miles, 0.0)
+        # Grados de latitud que cubre el radio (con un margen mínimo numérico)
+        self.step = max(math.degrees(self.max_distance_miles / EARTH_RADIUS_MILES), 1e-6) * 1.000001
+        self.n_cols = max(int(math.ceil(360.0 / self.step)), 1)
+        self.cells: Dict[Tuple[int, int], set] = {}
+        self._keys: Dict[int, Tuple[int, int]] = {}
+        
+        for idx, p in enumerate(personas):
+            key = self._cell(p['latitud'], p['longitud'])
+            self.cells.setdefault(key, set()).add(idx)
+            self._keys[idx] = key
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        row = int(math.floor(lat / self.step))
+        col = int(math.floor((lng + 180.0) / self.step)) % self.n_cols
+        return row, col
+
+    def contains(self, idx: int) -> bool:
+        return idx in self._keys
+
+    def remove(self, idx: int):
+        key = self._keys.pop(idx, None)
+        if key is not None:
+            self.cells[key].discard(idx)
+
+    def _col_span(self, lat: float) -> int:
+        """Número de columnas a cada lado que puede alcanzar el radio en esta latitud"""
+        delta = self.max_distance_miles / EARTH_RADIUS_MILES
+        cos_lat = math.cos(math.radians(lat))
+        if delta >= math.pi / 2 or math.sin(delta) >= cos_lat:
+            # Cerca de los polos el radio puede cubrir cualquier longitud
+            return self.n_cols
+        dlng = math.degrees(math.asin(math.sin(delta) / cos_lat))
+        return int(math.ceil(dlng / self.step)) + 1
+
+    def candidates(self, lat: float, lng: float) -> List[int]:
+        """Índices activos en las celdas vecinas, ordenados como la lista original"""
+        row, col = self._cell(lat, lng)
+        span = self._col_span(lat)
+        if 2 * span + 1 >= self.n_cols:
+            cols = range(self.n_cols)
+        else:
+            cols = {(col + d) % self.n_cols for d in range(-span, span + 1)}
+        
+        result = []
+        for r in (row - 1, row, row + 1):
+            for c in cols:
+                cell = self.cells.get((r, c))
+                if cell:
+                    result.extend(cell)
+        result.sort()
+        return result
+
 
 class ClusteringManager:
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, cache_ttl_days: int = GEOCODE_CACHE_TTL_DAYS):
         if api_key:
             self.gmaps = googlemaps.Client(key=api_key)
         else:
             self.gmaps = None
+        self.cache_ttl_days = cache_ttl_days
 
     def geocode_address(self, address: str) -> Tuple[float, float]:
-        """Geocodificar una dirección a coordenadas (lat, lng)"""
+        """Geocodificar una dirección a coordenadas (lat, lng), consultando primero la caché"""
+        clave = normalizar_direccion(address)
+        if not clave:
+            return None, None
+        
+        entrada = None
+        try:
+            entrada = GeocodeCache.query.get(clave)
+            if entrada and (not entrada.expirado(self.cache_ttl_days) or not self.gmaps):
+                # Hit (o entrada vencida pero sin cliente remoto disponible)
+                GeocodeCache.registrar_hit(clave)
+                return entrada.latitud, entrada.longitud
+        except Exception as e:
+            print(f"Error leyendo caché de geocodificación: {e}")
+        
         if not self.gmaps:
             print("Error: Google Maps Client not initialized (no API key)")
             return None, None
             
         try:
             geocode_result = self.gmaps.geocode(address)
-            if geocode_result:
-                location = geocode_result[0]['geometry']['location']
-                return location['lat'], location['lng']
         except Exception as e:
+            # Errores transitorios no se guardan en caché
             print(f"Error geocoding {address}: {e}")
-        return None, None
+            return None, None
+        
+        lat, lng = None, None
+        if geocode_result:
+            location = geocode_result[0]['geometry']['location']
+            lat, lng = location['lat'], location['lng']
+        
+        try:
+            GeocodeCache.guardar(clave, address, lat, lng)
+        except Exception as e:
+            print(f"Error guardando caché de geocodificación: {e}")
+        return lat, lng
 
     def calculate_distance(self, lat1: float, lng1: float, lat2: float, lng2: float) -> float:
         """Calcular distancia en millas entre dos puntos (Haversine)"""
-        R = 3958.8  # Radio de la Tierra en millas
+        R = EARTH_RADIUS_MILES  # Radio de la Tierra en millas
         
         dlat = math.radians(lat2 - lat1)
         dlng = math.radians(lng2 - lng1)
@@ -35,6 +154,34 @@ class ClusteringManager:
         c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
         return R * c
 
+    def distances_from(self, lat: float, lng: float, lats, lngs) -> np.ndarray:
+        """
+        Distancias en millas (Haversine vectorizado) desde un punto a un arreglo de puntos.
+        lats/lngs pueden ser listas o arreglos NumPy en grados.
+        """
+        lat1 = math.radians(lat)
+        lat2 = np.radians(np.asarray(lats, dtype=float))
+        dlat = lat2 - lat1
+        dlng = np.radians(np.asarray(lngs, dtype=float) - lng)
+        a = np.sin(dlat / 2)**2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2)**2
+        a = np.clip(a, 0.0, 1.0)
+        return EARTH_RADIUS_MILES * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    def pairwise_distances(self, lats1, lngs1, lats2=None, lngs2=None) -> np.ndarray:
+        """
+        Matriz de distancias en millas entre dos conjuntos de puntos (o del conjunto consigo mismo).
+        Retorna un arreglo de forma (len(lats1), len(lats2)).
+        """
+        if lats2 is None:
+            lats2, lngs2 = lats1, lngs1
+        lat1 = np.radians(np.asarray(lats1, dtype=float))[:, None]
+        lng1 = np.radians(np.asarray(lngs1, dtype=float))[:, None]
+        lat2 = np.radians(np.asarray(lats2, dtype=float))[None, :]
+        lng2 = np.radians(np.asarray(lngs2, dtype=float))[None, :]
+        a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2)**2
+        a = np.clip(a, 0.0, 1.0)
+        return EARTH_RADIUS_MILES * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
     def create_clusters(self, personas: List[Dict], max_distance_miles: float, min_size: int, max_size: int) -> List[Dict]:
         """
         Agrupar personas basadas en proximidad geográfica.
@@ -46,25 +193,31 @@ class ClusteringManager:
         unassigned = [p for p in personas if p.get('latitud') and p.get('longitud')]
         clusters = []
         
-        while unassigned:
-            seed = unassigned.pop(0)
+        # Índice espacial: solo se evalúan las celdas vecinas a la semilla
+        index = GridIndex(unassigned, max_distance_miles)
+        lats = np.array([p['latitud'] for p in unassigned], dtype=float)
+        lngs = np.array([p['longitud'] for p in unassigned], dtype=float)
+        
+        for seed_idx, seed in enumerate(unassigned):
+            if not index.contains(seed_idx):
+                continue
+            index.remove(seed_idx)
             cluster = [seed]
             
-            # Encontrar vecinos
-            neighbors = []
-            for p in unassigned:
-                dist = self.calculate_distance(seed['latitud'], seed['longitud'], p['latitud'], p['longitud'])
-                if dist <= max_distance_miles:
-                    neighbors.append((dist, p))
-            
-            # Ordenar por distancia
-            neighbors.sort(key=lambda x: x[0])
-            
-            # Agregar vecinos al cluster hasta max_size
-            for _, p in neighbors:
-                if len(cluster) < max_size:
-                    cluster.append(p)
-                    unassigned.remove(p)
+            # Encontrar vecinos (distancias vectorizadas sobre los candidatos)
+            candidates = np.array(index.candidates(seed['latitud'], seed['longitud']), dtype=np.intp)
+            if candidates.size:
+                dists = self.distances_from(seed['latitud'], seed['longitud'], lats[candidates], lngs[candidates])
+                within = dists <= max_distance_miles
+                candidates, dists = candidates[within], dists[within]
+                
+                # Ordenar por distancia (orden estable: desempate por orden original)
+                order = np.argsort(dists, kind='stable')
+                
+                # Agregar vecinos al cluster hasta max_size
+                for idx in candidates[order][:max(max_size - 1, 0)]:
+                    cluster.append(unassigned[idx])
+                    index.remove(int(idx))
             
             # Verificar tamaño mínimo
             if len(cluster) >= min_size:
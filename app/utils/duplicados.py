@@ -0,0 +1,414 @@
+"""
+Detección de personas duplicadas.
+Las claves se normalizan (email en minúsculas, dígitos del teléfono, nombre y
+dirección sin tildes ni puntuación) para que variaciones de formato del mismo
+dato coincidan.
+
+- IndiceDuplicados: coincidencias exactas de claves, para la importación.
+- detectar_duplicados: búsqueda aproximada entre todas las tarjetas. Para no
+  comparar todos contra todos (30k tarjetas son 450M pares), las tarjetas se
+  agrupan en bloques por claves baratas (código fonético del nombre, teléfono,
+  usuario del email, geohash) y solo se comparan dentro de cada bloque.
+"""
+
+import difflib
+import json
+import re
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.models import db, storage, DeteccionDuplicados
+from app.utils.clustering import normalizar_direccion
+from app.utils.trabajos import get_executor, reclamar, ids_disponibles
+
+# Qué hacer con una fila importada que coincide con una persona existente
+ACCIONES_DUPLICADOS = ('omitir', 'combinar', 'marcar')
+
+# Teléfonos con menos dígitos no se usan como clave (extensiones, datos incompletos)
+MIN_DIGITOS_TELEFONO = 7
+# Se comparan los últimos dígitos, así +1 (555) 010-1234 y 5550101234 coinciden
+DIGITOS_TELEFONO = 10
+
+MOTIVOS_DUPLICADO = {
+    'email': 'mismo email',
+    'telefono': 'mismo teléfono',
+    'nombre_direccion': 'mismo nombre y dirección'
+}
+
+
+def normalizar_texto(texto: str) -> str:
+    """Sin tildes, minúsculas y solo letras/números separados por un espacio"""
+    if not texto:
+        return ""
+    texto = unicodedata.normalize('NFD', str(texto))
+    texto = ''.join(c for c in texto if unicodedata.category(c) != 'Mn').lower()
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', texto).split())
+
+
+def normalizar_email(email: str) -> str:
+    email = str(email or '').strip().lower()
+    return email if '@' in email else ''
+
+
+def normalizar_telefono(telefono: str) -> str:
+    digitos = re.sub(r'\D', '', str(telefono or ''))
+    return digitos[-DIGITOS_TELEFONO:] if len(digitos) >= MIN_DIGITOS_TELEFONO else ''
+
+
+def claves_persona(persona) -> Dict[str, str]:
+    """
+    Claves de duplicado de una persona (dict o fila con nombre, apellido, email,
+    telefono, direccion). Solo se incluyen las claves con datos suficientes.
+    """
+    claves = {}
+    email = normalizar_email(persona.get('email'))
+    if email:
+        claves['email'] = email
+    telefono = normalizar_telefono(persona.get('telefono'))
+    if telefono:
+        claves['telefono'] = telefono
+    # nombre + apellido juntos: da igual si el apellido vino en su propia columna
+    nombre = normalizar_texto(f"{persona.get('nombre') or ''} {persona.get('apellido') or ''}")
+    direccion = normalizar_direccion(persona.get('direccion'))
+    if nombre and direccion:
+        claves['nombre_direccion'] = f'{nombre}|{direccion}'
+    return claves
+
+
+class IndiceDuplicados:
+    """
+    Índice hash de claves de duplicado -> id de tarjeta, para comprobar cada
+    fila importada en O(1). Las personas agregadas sin id (filas del mismo
+    archivo aún no insertadas) quedan registradas con id None.
+    """
+    def __init__(self, personas: Iterable = ()):
+        self.claves = {}
+        for persona in personas:
+            self.agregar(persona, persona.get('id'))
+
+    @classmethod
+    def del_tablero(cls, tablero_id: str) -> 'IndiceDuplicados':
+        """Índice con todas las tarjetas del tablero, cargado en una sola consulta"""
+        return cls(storage.iter_datos_duplicados(tablero_id))
+
+    def __len__(self):
+        return len(self.claves)
+
+    def agregar(self, persona, tarjeta_id: str = None):
+        for tipo, valor in claves_persona(persona).items():
+            # La primera persona con la clave es la que se reporta
+            self.claves.setdefault((tipo, valor), tarjeta_id)
+
+    def buscar(self, persona) -> Optional[Tuple[Optional[str], str]]:
+        """(id de la tarjeta coincidente, motivo) o None si no hay coincidencia"""
+        for tipo, valor in claves_persona(persona).items():
+            clave = (tipo, valor)
+            if clave in self.claves:
+                return self.claves[clave], tipo
+        return None
+
+
+# --- Detección por bloques ---
+
+# Puntaje mínimo (0-1) para reportar un par
+UMBRAL_DUPLICADO = 0.8
+# Bloques más grandes se descartan: una clave tan común (p.ej. el teléfono de la
+# iglesia) no distingue a nadie y compararlo todo sería cuadrático
+MAX_TAMANO_BLOQUE = 100
+# Precisión del geohash: celdas de ~150 m
+GEOHASH_PRECISION = 7
+
+# Peso de cada campo en el puntaje; los que faltan en alguna de las dos tarjetas no cuentan
+PESOS_SIMILITUD = {'nombre': 0.5, 'email': 0.2, 'telefono': 0.2, 'direccion': 0.1}
+# Similitud a partir de la cual un campo aparece como motivo del par
+SIMILITUD_MOTIVO = 0.9
+
+_GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Sonidos equivalentes en español, aplicados en orden
+_REGLAS_FONETICAS = [
+    (re.compile(r'ch'), 'x'),
+    (re.compile(r'h'), ''),
+    (re.compile(r'll'), 'y'),
+    (re.compile(r'qu'), 'k'),
+    (re.compile(r'g(?=[ei])'), 'j'),
+    (re.compile(r'gu(?=[ei])'), 'g'),
+    (re.compile(r'c(?=[ei])'), 's'),
+    (re.compile(r'z'), 's'),
+    (re.compile(r'[cq]'), 'k'),
+    (re.compile(r'[vw]'), 'b'),
+    (re.compile(r'y$'), 'i'),
+]
+
+
+def codigo_fonetico(palabra: str) -> str:
+    """
+    Código fonético de una palabra (ya normalizada): se unifican las letras que
+    suenan igual, se quitan las vocales salvo la inicial y las letras repetidas.
+    'Vásquez' y 'Basques' dan el mismo código.
+    """
+    for patron, reemplazo in _REGLAS_FONETICAS:
+        palabra = patron.sub(reemplazo, palabra)
+    if not palabra:
+        return ''
+    codigo = palabra[0] + re.sub(r'[aeiou]', '', palabra[1:])
+    return re.sub(r'(.)\1+', r'\1', codigo)
+
+
+def usuario_email(email: str) -> str:
+    """Parte local del email sin puntos ni sufijo +etiqueta"""
+    usuario = normalizar_email(email).split('@')[0]
+    usuario = usuario.split('+')[0].replace('.', '')
+    return usuario if len(usuario) >= 3 else ''
+
+
+def geohash(latitud: float, longitud: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Geohash estándar (base32) de unas coordenadas"""
+    rango_lat, rango_lng = [-90.0, 90.0], [-180.0, 180.0]
+    resultado, bits, valor, par = [], 0, 0, True
+    while len(resultado) < precision:
+        rango, coordenada = (rango_lng, longitud) if par else (rango_lat, latitud)
+        medio = (rango[0] + rango[1]) / 2
+        valor <<= 1
+        if coordenada >= medio:
+            valor |= 1
+            rango[0] = medio
+        else:
+            rango[1] = medio
+        par = not par
+        bits += 1
+        if bits == 5:
+            resultado.append(_GEOHASH_BASE32[valor])
+            bits, valor = 0, 0
+    return ''.join(resultado)
+
+
+def _preparar(persona) -> Dict:
+    """Datos normalizados de una tarjeta para comparar, y sus claves de bloque"""
+    nombre_completo = f"{persona.get('nombre') or ''} {persona.get('apellido') or ''}".strip()
+    nombre = normalizar_texto(nombre_completo)
+    tokens = nombre.split()
+    direccion = normalizar_direccion(persona.get('direccion'))
+    telefono = normalizar_telefono(persona.get('telefono'))
+    usuario = usuario_email(persona.get('email'))
+    latitud, longitud = persona.get('latitud'), persona.get('longitud')
+
+    bloques = []
+    if tokens:
+        # Primer y último token: 'Juan Carlos Pérez' y 'Juan Pérez' caen juntos
+        bloques.append(('nombre', f'{codigo_fonetico(tokens[0])} {codigo_fonetico(tokens[-1])}'))
+    if telefono:
+        bloques.append(('telefono', telefono))
+    if usuario:
+        bloques.append(('email', usuario))
+    if latitud is not None and longitud is not None:
+        bloques.append(('geohash', geohash(latitud, longitud)))
+
+    return {
+        'id': persona.get('id'),
+        'nombre_completo': nombre_completo,
+        'nombre': nombre,
+        'nombre_ordenado': ' '.join(sorted(tokens)),
+        'email': normalizar_email(persona.get('email')),
+        'telefono': telefono,
+        'direccion': direccion,
+        # Letras de cada texto, para la cota rápida de similitud
+        'letras_nombre': Counter(nombre),
+        'letras_direccion': Counter(direccion),
+        'bloques': bloques
+    }
+
+
+def _similitud(a: str, b: str) -> float:
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+
+def _cota_similitud(a: Dict, b: Dict, campo: str) -> float:
+    """
+    Cota superior de _similitud: letras en común sin importar el orden (lo mismo
+    que SequenceMatcher.quick_ratio, pero con los conteos ya calculados).
+    """
+    comunes = sum((a[f'letras_{campo}'] & b[f'letras_{campo}']).values())
+    return 2.0 * comunes / (len(a[campo]) + len(b[campo]))
+
+
+def comparar_personas(a: Dict, b: Dict, umbral: float = 0.0) -> Tuple[float, List[str]]:
+    """
+    Puntaje (0-1) de que dos tarjetas preparadas sean la misma persona y los
+    campos que coinciden. Email y teléfono cuentan por igualdad; nombre y
+    dirección por similitud de texto (el nombre también con los tokens
+    ordenados, para 'Pérez Juan' vs 'Juan Pérez').
+    Si con cotas superiores baratas el puntaje no puede llegar a `umbral`, se
+    retorna (0.0, []) sin calcular la similitud exacta.
+    """
+    similitudes = {}
+    for campo in ('email', 'telefono'):
+        if a[campo] and b[campo]:
+            similitudes[campo] = 1.0 if a[campo] == b[campo] else 0.0
+    textos = [campo for campo in ('nombre', 'direccion') if a[campo] and b[campo]]
+
+    peso_total = sum(PESOS_SIMILITUD[campo] for campo in list(similitudes) + textos)
+    if not peso_total:
+        return 0.0, []
+
+    if umbral > 0:
+        cota = sum(PESOS_SIMILITUD[campo] * valor for campo, valor in similitudes.items())
+        cota += sum(PESOS_SIMILITUD[campo] * _cota_similitud(a, b, campo) for campo in textos)
+        if cota / peso_total < umbral:
+            return 0.0, []
+
+    if 'nombre' in textos:
+        similitudes['nombre'] = max(_similitud(a['nombre'], b['nombre']),
+                                    _similitud(a['nombre_ordenado'], b['nombre_ordenado']))
+    if 'direccion' in textos:
+        similitudes['direccion'] = _similitud(a['direccion'], b['direccion'])
+
+    score = sum(PESOS_SIMILITUD[campo] * valor for campo, valor in similitudes.items()) / peso_total
+    motivos = [campo for campo in PESOS_SIMILITUD if similitudes.get(campo, 0) >= SIMILITUD_MOTIVO]
+    return score, motivos
+
+
+def detectar_duplicados(personas: Iterable, umbral: float = UMBRAL_DUPLICADO,
+                        max_tamano_bloque: int = MAX_TAMANO_BLOQUE,
+                        latido: Optional[Callable[[], None]] = None) -> Tuple[List[Dict], Dict]:
+    """
+    Buscar pares de tarjetas que probablemente son la misma persona.
+    `personas` son dicts/filas con id, nombre, apellido, email, telefono,
+    direccion, latitud y longitud. Cada par se compara una sola vez aunque
+    comparta varios bloques. `latido`, si se pasa, se llama después de cada bloque.
+    Retorna (pares ordenados de mayor a menor puntaje, estadísticas).
+    """
+    preparadas = [_preparar(persona) for persona in personas]
+    bloques = defaultdict(list)
+    for i, persona in enumerate(preparadas):
+        for clave in persona['bloques']:
+            bloques[clave].append(i)
+
+    comparados = set()
+    pares = []
+    bloques_descartados = 0
+    for miembros in bloques.values():
+        if latido:
+            latido()
+        if len(miembros) < 2:
+            continue
+        if len(miembros) > max_tamano_bloque:
+            bloques_descartados += 1
+            continue
+        for posicion, i in enumerate(miembros):
+            for j in miembros[posicion + 1:]:
+                if (i, j) in comparados:
+                    continue
+                comparados.add((i, j))
+                score, motivos = comparar_personas(preparadas[i], preparadas[j], umbral)
+                if score >= umbral:
+                    a, b = preparadas[i], preparadas[j]
+                    pares.append({
+                        'tarjeta_a': a['id'], 'nombre_a': a['nombre_completo'],
+                        'tarjeta_b': b['id'], 'nombre_b': b['nombre_completo'],
+                        'score': round(score, 3), 'motivos': motivos
+                    })
+
+    pares.sort(key=lambda par: par['score'], reverse=True)
+    estadisticas = {
+        'tarjetas': len(preparadas),
+        'bloques': sum(1 for miembros in bloques.values() if len(miembros) > 1),
+        'bloques_descartados': bloques_descartados,
+        'comparaciones': len(comparados)
+    }
+    return pares, estadisticas
+
+
+# --- Trabajo en segundo plano ---
+
+# Una detección 'en_proceso' sin latido en este tiempo se considera abandonada
+DETECCION_STALE_SECONDS = 300
+# Cada cuánto se renueva el latido mientras se comparan los bloques
+DETECCION_HEARTBEAT_SECONDS = 15
+
+
+def ejecutar_deteccion(job_id: str, umbral: float = UMBRAL_DUPLICADO,
+                       stale_seconds: int = DETECCION_STALE_SECONDS):
+    """
+    Procesar un trabajo de detección de duplicados (requiere app context).
+    Retomar un trabajo es empezarlo de nuevo: la detección no tiene efectos parciales.
+    """
+    if not reclamar(DeteccionDuplicados, job_id, stale_seconds):
+        return
+    job = db.session.get(DeteccionDuplicados, job_id)
+    # Siempre bastante por debajo del límite de abandono
+    intervalo_latido = min(DETECCION_HEARTBEAT_SECONDS, stale_seconds / 3)
+    ultimo = time.monotonic()
+
+    def latido():
+        # Solo durante las comparaciones: la lectura ya terminó y no hay cursor abierto
+        nonlocal ultimo
+        if time.monotonic() - ultimo >= intervalo_latido:
+            job.fecha_actualizacion = datetime.utcnow()
+            db.session.commit()
+            ultimo = time.monotonic()
+
+    try:
+        pares, estadisticas = detectar_duplicados(storage.iter_datos_duplicados(job.tablero_id),
+                                                  umbral=umbral, latido=latido)
+        job.tarjetas = estadisticas['tarjetas']
+        job.bloques = estadisticas['bloques']
+        job.comparaciones = estadisticas['comparaciones']
+        job.total_pares = len(pares)
+        job.pares = json.dumps(pares[:DeteccionDuplicados.MAX_PARES], ensure_ascii=False)
+        job.estado = 'completado'
+        print(f"🔁 Detección de duplicados: {len(pares)} pares en {estadisticas['comparaciones']} comparaciones "
+              f"({estadisticas['tarjetas']} tarjetas, {estadisticas['bloques_descartados']} bloques descartados)")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error en detección de duplicados {job_id}: {e}")
+        job.estado = 'error'
+        job.mensaje = str(e)
+    finally:
+        job.fecha_fin = datetime.utcnow()
+        db.session.commit()
+
+
+def _lanzar(app, job_id: str, background: bool = True):
+    umbral = app.config.get('DUPLICADOS_UMBRAL', UMBRAL_DUPLICADO)
+    stale_seconds = app.config.get('DUPLICADOS_STALE_SECONDS', DETECCION_STALE_SECONDS)
+
+    def _run():
+        with app.app_context():
+            ejecutar_deteccion(job_id, umbral=umbral, stale_seconds=stale_seconds)
+
+    if background:
+        # Un solo hilo: las detecciones son pesadas y no hace falta correrlas en paralelo
+        get_executor('duplicados').submit(_run)
+    else:
+        _run()
+
+
+def lanzar_deteccion(app, usuario_id: str = None, tablero_id: str = None,
+                     background: bool = True) -> DeteccionDuplicados:
+    """Registrar un trabajo de detección (de un tablero o de todas las tarjetas) y encolarlo"""
+    job = DeteccionDuplicados(usuario_id=usuario_id, tablero_id=tablero_id)
+    db.session.add(job)
+    db.session.commit()
+    _lanzar(app, job.id, background=background)
+    return job
+
+
+def reanudar_detecciones(app, background: bool = True) -> int:
+    """
+    Volver a encolar detecciones pendientes o abandonadas (p. ej. tras un reinicio).
+    Lo llama el proceso web después de las migraciones (run.py). Requiere app context.
+    """
+    ids = ids_disponibles(DeteccionDuplicados, app.config.get('DUPLICADOS_STALE_SECONDS', DETECCION_STALE_SECONDS))
+    for job_id in ids:
+        _lanzar(app, job_id, background=background)
+    if ids:
+        print(f"🔁 Retomando {len(ids)} detecciones de duplicados pendientes")
+    return len(ids)
+
+
+def get_deteccion(job_id: str) -> Optional[DeteccionDuplicados]:
+    return db.session.get(DeteccionDuplicados, job_id)
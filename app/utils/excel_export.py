@@ -0,0 +1,56 @@
+"""
+Escritura de archivos Excel (.xlsx) para exportaciones.
+Usa el modo write-only de openpyxl: las filas se escriben a disco a medida que
+llegan, sin armar la hoja en memoria ni pasar por pandas.
+"""
+
+import tempfile
+from itertools import chain, islice
+from typing import Iterable, List, Sequence
+
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Filas que se miran para calcular el ancho de las columnas
+FILAS_MUESTRA_ANCHO = 200
+ANCHO_MAXIMO = 50
+
+
+def calcular_anchos(encabezados: Sequence[str], muestra: List[Sequence]) -> List[int]:
+    """Ancho de cada columna según el texto más largo del encabezado y la muestra"""
+    anchos = [len(str(e)) if e is not None else 0 for e in encabezados]
+    for fila in muestra:
+        for i, valor in enumerate(fila[:len(anchos)]):
+            if valor is not None and valor != '':
+                anchos[i] = max(anchos[i], len(str(valor)))
+    return [min(ancho + 2, ANCHO_MAXIMO) for ancho in anchos]
+
+
+def escribir_xlsx(encabezados: Sequence[str], filas: Iterable[Sequence], titulo: str = 'Datos',
+                  filas_muestra: int = FILAS_MUESTRA_ANCHO):
+    """
+    Escribir encabezados + filas en un .xlsx y devolver el archivo temporal
+    (posicionado al inicio, listo para send_file).
+
+    `filas` puede ser un generador: solo se retienen en memoria las primeras
+    `filas_muestra` para calcular el ancho de columnas (en write-only los anchos
+    deben fijarse antes de escribir la primera fila).
+    """
+    filas = iter(filas)
+    muestra = list(islice(filas, filas_muestra))
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title=titulo)
+    for i, ancho in enumerate(calcular_anchos(encabezados, muestra), start=1):
+        worksheet.column_dimensions[get_column_letter(i)].width = ancho
+
+    worksheet.append(list(encabezados))
+    for fila in chain(muestra, filas):
+        worksheet.append(list(fila))
+
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
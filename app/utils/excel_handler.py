@@ -8,7 +8,16 @@ import openpyxl
 import csv
 import io
 import re
-from typing import List, Dict, Tuple, Optional
+from collections import Counter
+from datetime import date, datetime
+from functools import lru_cache
+from itertools import chain, islice
+from typing import List, Dict, Tuple, Optional, Iterator, Iterable
+
+# Filas iniciales donde se busca la fila de encabezados
+HEADER_SCAN_ROWS = 5
+# Bytes iniciales de un CSV usados para detectar encoding y delimitador
+CSV_SNIFF_BYTES = 64 * 1024
 
 
 def normalizar_nombre_columna(nombre: str) -> str:
@@ -46,19 +55,32 @@ def normalizar_nombre_columna(nombre: str) -> str:
     # Convertir a minúsculas y quitar espacios/caracteres especiales
     nombre_normalizado = re.sub(r'[^a-z0-9]', '', nombre_sin_tildes.lower())
     
-    nombre_normalizado = re.sub(r'[^a-z0-9]', '', nombre_sin_tildes.lower())
-    
     return nombre_normalizado
 
-def parse_date(date_val) -> Optional[object]:
+# Formatos de fecha aceptados, en orden de preferencia. Ninguna cadena encaja en
+# dos de ellos, así que probar primero el formato de la columna da el mismo
+# resultado que recorrerlos todos.
+FORMATOS_FECHA = (
+    '%Y-%m-%d',           # 2023-12-25
+    '%d/%m/%Y',           # 25/12/2023
+    '%d-%m-%Y',           # 25-12-2023
+    '%Y/%m/%d',           # 2023/12/25
+    '%d/%m/%y',           # 25/12/23
+    '%Y-%m-%d %H:%M:%S',  # Timestamp string (celdas de fecha de Excel)
+)
+# Valores de la columna que se miran para inferir su formato
+FECHA_SAMPLE_SIZE = 200
+
+
+def parse_date(date_val, formato: str = None) -> Optional[date]:
     """
     Intenta convertir un valor a objeto date de Python.
-    Soporta strings (YYYY-MM-DD, DD/MM/YYYY) y objetos datetime/date.
+    Soporta strings (ver FORMATOS_FECHA) y objetos datetime/date.
+    Si se pasa `formato` (ver inferir_formato_fecha) se prueba ese primero y
+    los demás solo si no encaja.
     """
     if not date_val:
         return None
-        
-    from datetime import datetime, date
     
     # Si ya es date o datetime
     if isinstance(date_val, datetime):
@@ -69,18 +91,16 @@ def parse_date(date_val) -> Optional[object]:
     date_str = str(date_val).strip()
     if not date_str:
         return None
-        
-    # Intentar varios formatos
-    formats = [
-        '%Y-%m-%d',       # 2023-12-25
-        '%d/%m/%Y',       # 25/12/2023
-        '%d-%m-%Y',       # 25-12-2023
-        '%Y/%m/%d',       # 2023/12/25
-        '%d/%m/%y',       # 25/12/23
-        '%Y-%m-%d %H:%M:%S' # Timestamp string
-    ]
     
-    for fmt in formats:
+    if formato:
+        try:
+            return datetime.strptime(date_str, formato).date()
+        except ValueError:
+            pass
+    
+    for fmt in FORMATOS_FECHA:
+        if fmt == formato:
+            continue
         try:
             return datetime.strptime(date_str, fmt).date()
         except ValueError:
@@ -89,152 +109,204 @@ def parse_date(date_val) -> Optional[object]:
     return None
 
 
-def mapear_columnas(headers: List[str]) -> Dict[str, str]:
+def inferir_formato_fecha(valores: Iterable) -> Optional[str]:
     """
-    Mapear headers del archivo a nombres estándar de columnas.
-    Retorna un diccionario: {nombre_estandar: nombre_real_en_archivo}
+    Formato de FORMATOS_FECHA que acepta más valores entre los primeros
+    FECHA_SAMPLE_SIZE no vacíos (None si ninguno es una fecha en texto).
     """
-    # Definir todas las variaciones posibles para cada campo
-    mapeo_campos = {
-        'nombre': [
-            'nombre', 'name', 'nombrecompleto', 'nombreyfamiliar', 
-            'nombrepersona', 'titulo', 'persona', 'fullname',
-            'nombres', 'nombreyapellido', 'nombreyapellidos'
-        ],
-        'apellido': [
-            'apellido', 'lastname', 'surname', 'apellidopersona',
-            'apellidodelconyuge', 'apellidodel', 'apellidos'
-        ],
-        'direccion': [
-            'direccion', 'address', 'ubicacion', 'domicilio', 
-            'calle', 'residencia', 'descripcion', 'direccionderesidencia',
-            'direccionresidencia', 'direccioncompl', 'direccionderesidenciacompl',
-            'direcci', 'direc', 'domicili', 'residenci',
-            'direcciondecasa', 'direccionhabitacion', 'lugar', 'dondevive'
-        ],
-        'codigo_postal': [
-            'codigopostal', 'cp', 'zip', 'zipcode', 'postalcode', 
-            'codigop', 'postal', 'zona'
-        ],
-        'telefono': [
-            'telefono', 'phone', 'tel', 'celular', 'movil', 
-            'telefonopersonal', 'telefonocelular', 'contacto',
-            'numerodetelefono', 'numerotel', 'telno', 'numtelefono',
-            'numerodtel', 'telef', 'numerodetlf', 'numerodetel',
-            'numerodeteleno', 'numdetel', 'teleno',
-            'telefonomovil', 'telefonocasa', 'whatsapp'
-        ],
-        'edad': [
-            'edad', 'age', 'anos', 'years', 'edadactual'
-        ],
-        'estado_civil': [
-            'estadocivil', 'maritalstatus', 'estadomarital', 
-            'civilstatus', 'estatus', 'estadocivilactual',
-            'estado', 'situacioncivil', 'condicioncivil', 'civil'
-        ],
-        'num_hijos': [
-            'numerohijos', 'numerodehijos', 'cantidadhijos', 'nohijos',
-            'children', 'cuantoshijos', 'cuantos', 'numhijos', 'nohijos'
-        ],
-        'edades_hijos': [
-            'edadeshijos', 'edadesdehijos', 'edadeshijo', 
-            'childrenages', 'edadesdeloshijos'
-        ],
-        'nombre_conyuge': [
-            'nombreconyuge', 'conyuge', 'esposo', 'esposa', 
-            'spouse', 'nombreesposo', 'nombreesposa', 'pareja',
-            'spousename', 'nombredeesposo', 'nombredeesposa',
-            'nombredelconyuge', 'nombredeconyuge', 'nombredelesposo',
-            'nombrepareja'
-        ],
-        'apellido_conyuge': [
-            'apellidoconyuge', 'apellidodelconyuge', 'apellidodeesposo',
-            'apellidodeesposa', 'apellidodel', 'surnamesp spouse'
-        ],
-        'edad_conyuge': [
-            'edadconyuge', 'edadesposo', 'edadesposa', 
-            'spouseage', 'edaddeesposo', 'edaddeesposa'
-        ],
-        'telefono_conyuge': [
-            'telefonoconyuge', 'telefonoesposo', 'telefonoesposa',
-            'spousephone', 'telconyuge', 'celularconyuge',
-            'telefonodeesposo', 'telefonodeesposa',
-            'numerodetelfonodelconyuge', 'numerotelefonoconyuge',
-            'numerodelconyuge', 'numerodetelefonodelconyuge',
-            'telefonodelconyuge', 'numtelconyuge'
-        ],
-        'trabajo_conyuge': [
-            'trabajoconyuge', 'ocupacionconyuge', 'empleoconyuge',
-            'spousework', 'spousejob', 'trabajoesposo', 'trabajoesposa',
-            'profesionesposo', 'profesionesposa', 'ocupacionesposo'
-        ],
-        'fecha_matrimonio': [
-            'fechamatrimonio', 'matrimonio', 'fechadeboda', 
-            'marriagedate', 'fechacasamiento', 'aniomatrimonio'
-        ],
-        'ocupacion': [
-            'ocupacion', 'trabajo', 'empleo', 'profession', 
-            'job', 'profesion', 'oficio', 'carrera',
-            'profesionoficio', 'prof', 'profesionooficio'
-        ],
-
-        'email_conyuge': [
-            'emailconyuge', 'correoconyuge', 'correodelconyuge', 
-            'emaildelconyuge', 'correoelectronicodelconyuge', 
-            'correoelectronicoconyuge', 'mailconyuge'
-        ],
-        'email': [
-            'email', 'correo', 'correoelectronico', 'mail', 
-            'emailaddress', 'electronico', 'correoe', 'emailpersonal'
-        ],
-        'responsable': [
-            'responsable', 'registradopor', 'capturo', 
-            'registrador', 'ingresadopor', 'responsible'
-        ],
-        'notas': [
-            'notas', 'observaciones', 'comentarios', 'notes', 
-            'observacion', 'comentario', 'remarks', 'adicional'
-        ]
-    }
-    
+    muestra = (str(valor).strip() for valor in valores
+               if valor and not isinstance(valor, date))
+    conteo = Counter()
+    for date_str in islice((v for v in muestra if v), FECHA_SAMPLE_SIZE):
+        for fmt in FORMATOS_FECHA:
+            try:
+                datetime.strptime(date_str, fmt)
+            except ValueError:
+                continue
+            conteo[fmt] += 1
+            break
+    return conteo.most_common(1)[0][0] if conteo else None
+
+
+# Todas las variaciones posibles de encabezado para cada campo (en orden de preferencia)
+MAPEO_CAMPOS = {
+    'nombre': [
+        'nombre', 'name', 'nombrecompleto', 'nombreyfamiliar',
+        'nombrepersona', 'titulo', 'persona', 'fullname',
+        'nombres', 'nombreyapellido', 'nombreyapellidos'
+    ],
+    'apellido': [
+        'apellido', 'lastname', 'surname', 'apellidopersona',
+        'apellidodelconyuge', 'apellidodel', 'apellidos'
+    ],
+    'direccion': [
+        'direccion', 'address', 'ubicacion', 'domicilio',
+        'calle', 'residencia', 'descripcion', 'direccionderesidencia',
+        'direccionresidencia', 'direccioncompl', 'direccionderesidenciacompl',
+        'direcci', 'direc', 'domicili', 'residenci',
+        'direcciondecasa', 'direccionhabitacion', 'lugar', 'dondevive'
+    ],
+    'codigo_postal': [
+        'codigopostal', 'cp', 'zip', 'zipcode', 'postalcode',
+        'codigop', 'postal', 'zona'
+    ],
+    'telefono': [
+        'telefono', 'phone', 'tel', 'celular', 'movil',
+        'telefonopersonal', 'telefonocelular', 'contacto',
+        'numerodetelefono', 'numerotel', 'telno', 'numtelefono',
+        'numerodtel', 'telef', 'numerodetlf', 'numerodetel',
+        'numerodeteleno', 'numdetel', 'teleno',
+        'telefonomovil', 'telefonocasa', 'whatsapp'
+    ],
+    'edad': [
+        'edad', 'age', 'anos', 'years', 'edadactual'
+    ],
+    'estado_civil': [
+        'estadocivil', 'maritalstatus', 'estadomarital',
+        'civilstatus', 'estatus', 'estadocivilactual',
+        'estado', 'situacioncivil', 'condicioncivil', 'civil'
+    ],
+    'num_hijos': [
+        'numerohijos', 'numerodehijos', 'cantidadhijos', 'nohijos',
+        'children', 'cuantoshijos', 'cuantos', 'numhijos', 'nohijos'
+    ],
+    'edades_hijos': [
+        'edadeshijos', 'edadesdehijos', 'edadeshijo',
+        'childrenages', 'edadesdeloshijos'
+    ],
+    'nombre_conyuge': [
+        'nombreconyuge', 'conyuge', 'esposo', 'esposa',
+        'spouse', 'nombreesposo', 'nombreesposa', 'pareja',
+        'spousename', 'nombredeesposo', 'nombredeesposa',
+        'nombredelconyuge', 'nombredeconyuge', 'nombredelesposo',
+        'nombrepareja'
+    ],
+    'apellido_conyuge': [
+        'apellidoconyuge', 'apellidodelconyuge', 'apellidodeesposo',
+        'apellidodeesposa', 'apellidodel', 'surnamesp spouse'
+    ],
+    'edad_conyuge': [
+        'edadconyuge', 'edadesposo', 'edadesposa',
+        'spouseage', 'edaddeesposo', 'edaddeesposa'
+    ],
+    'telefono_conyuge': [
+        'telefonoconyuge', 'telefonoesposo', 'telefonoesposa',
+        'spousephone', 'telconyuge', 'celularconyuge',
+        'telefonodeesposo', 'telefonodeesposa',
+        'numerodetelfonodelconyuge', 'numerotelefonoconyuge',
+        'numerodelconyuge', 'numerodetelefonodelconyuge',
+        'telefonodelconyuge', 'numtelconyuge'
+    ],
+    'trabajo_conyuge': [
+        'trabajoconyuge', 'ocupacionconyuge', 'empleoconyuge',
+        'spousework', 'spousejob', 'trabajoesposo', 'trabajoesposa',
+        'profesionesposo', 'profesionesposa', 'ocupacionesposo'
+    ],
+    'fecha_matrimonio': [
+        'fechamatrimonio', 'matrimonio', 'fechadeboda',
+        'marriagedate', 'fechacasamiento', 'aniomatrimonio'
+    ],
+    'ocupacion': [
+        'ocupacion', 'trabajo', 'empleo', 'profession',
+        'job', 'profesion', 'oficio', 'carrera',
+        'profesionoficio', 'prof', 'profesionooficio'
+    ],
+
+    'email_conyuge': [
+        'emailconyuge', 'correoconyuge', 'correodelconyuge',
+        'emaildelconyuge', 'correoelectronicodelconyuge',
+        'correoelectronicoconyuge', 'mailconyuge'
+    ],
+    'email': [
+        'email', 'correo', 'correoelectronico', 'mail',
+        'emailaddress', 'electronico', 'correoe', 'emailpersonal'
+    ],
+    'responsable': [
+        'responsable', 'registradopor', 'capturo',
+        'registrador', 'ingresadopor', 'responsible'
+    ],
+    'notas': [
+        'notas', 'observaciones', 'comentarios', 'notes',
+        'observacion', 'comentario', 'remarks', 'adicional'
+    ]
+}
+
+# Precompilado al importar: variación normalizada -> [(prioridad, campo)]
+_CAMPOS_POR_VARIACION: Dict[str, List[Tuple[int, str]]] = {}
+_VARIACIONES_NORMALIZADAS: Dict[str, List[str]] = {}
+for _campo, _variaciones in MAPEO_CAMPOS.items():
+    _normalizadas = list(dict.fromkeys(normalizar_nombre_columna(v) for v in _variaciones))
+    _VARIACIONES_NORMALIZADAS[_campo] = _normalizadas
+    for _prioridad, _variacion in enumerate(_normalizadas):
+        _CAMPOS_POR_VARIACION.setdefault(_variacion, []).append((_prioridad, _campo))
+
+# Similitud mínima para aceptar una coincidencia aproximada
+FUZZY_CUTOFF = 0.8
+
+
+def _mejor_coincidencia(variaciones: List[str], columnas: List[str]) -> Optional[str]:
+    """Columna con mayor similitud (>= FUZZY_CUTOFF) a cualquiera de las variaciones"""
+    import difflib
+    mejor, mejor_score = None, FUZZY_CUTOFF
+    matcher = difflib.SequenceMatcher()
+    for variacion in variaciones:
+        matcher.set_seq2(variacion)
+        for columna in columnas:
+            matcher.set_seq1(columna)
+            # Mismos filtros baratos que difflib.get_close_matches antes de ratio()
+            if (matcher.real_quick_ratio() >= mejor_score and
+                    matcher.quick_ratio() >= mejor_score):
+                score = matcher.ratio()
+                # Empate: se queda la primera encontrada (variación de mayor prioridad)
+                if score > mejor_score or (mejor is None and score >= mejor_score):
+                    mejor, mejor_score = columna, score
+    return mejor
+
+
+@lru_cache(maxsize=256)
+def _mapear_columnas_cache(headers: Tuple) -> Tuple[Dict[str, str], Tuple[Tuple[str, str], ...]]:
+    # Retorna (mapeo, coincidencias aproximadas como pares (header, campo)); sin efectos
+    # secundarios, porque solo se ejecuta la primera vez que se ve cada tupla de headers
     # Normalizar headers
     headers_normalizados = {normalizar_nombre_columna(h): h for h in headers if h}
     
-    # Encontrar coincidencias
-    resultado = {}
-    import difflib
+    # 1. Coincidencia exacta: buscar cada header en la tabla inversa y quedarse,
+    # por campo, con la variación de mayor prioridad
+    exactas = {}
+    for header_normalizado in headers_normalizados:
+        for prioridad, campo in _CAMPOS_POR_VARIACION.get(header_normalizado, ()):
+            if campo not in exactas or prioridad < exactas[campo][0]:
+                exactas[campo] = (prioridad, header_normalizado)
     
-    # 1. Intentar coincidencia exacta primero
-    for campo_estandar, variaciones in mapeo_campos.items():
-        match_found = False
-        for variacion in variaciones:
-            variacion_normalizada = normalizar_nombre_columna(variacion)
-            if variacion_normalizada in headers_normalizados:
-                resultado[campo_estandar] = headers_normalizados[variacion_normalizada]
-                match_found = True
-                break
+    resultado = {}
+    aproximadas = []
+    # Las columnas ya tomadas por una coincidencia exacta no compiten en el fuzzy
+    tomadas = {header_normalizado for _, header_normalizado in exactas.values()}
+    columnas_archivo = [h for h in headers_normalizados if h not in tomadas]
+    for campo_estandar in MAPEO_CAMPOS:
+        if campo_estandar in exactas:
+            resultado[campo_estandar] = headers_normalizados[exactas[campo_estandar][1]]
+            continue
         
-        # 2. Si no hay coincidencia exacta, usar fuzzy matching
-        if not match_found:
-            # Crear lista de posibles nombres de columna normalizados del archivo
-            columnas_archivo = list(headers_normalizados.keys())
-            
-            # Buscar la mejor coincidencia para cada variación
-            mejores_coincidencias = []
-            for variacion in variaciones:
-                variacion_normalizada = normalizar_nombre_columna(variacion)
-                matches = difflib.get_close_matches(variacion_normalizada, columnas_archivo, n=1, cutoff=0.8)
-                if matches:
-                    mejores_coincidencias.append((matches[0], variacion))
-            
-            # Si encontramos alguna coincidencia fuzzy
-            if mejores_coincidencias:
-                # Usar la primera (podríamos mejorar esto eligiendo la de mayor score)
-                mejor_match = mejores_coincidencias[0][0]
-                resultado[campo_estandar] = headers_normalizados[mejor_match]
-                print(f"✨ Coincidencia inteligente: '{headers_normalizados[mejor_match]}' -> {campo_estandar}")
+        # 2. Si no hay coincidencia exacta, usar la coincidencia aproximada de mayor score
+        mejor_match = _mejor_coincidencia(_VARIACIONES_NORMALIZADAS[campo_estandar], columnas_archivo)
+        if mejor_match:
+            resultado[campo_estandar] = headers_normalizados[mejor_match]
+            aproximadas.append((headers_normalizados[mejor_match], campo_estandar))
     
-    return resultado
+    return resultado, tuple(aproximadas)
+
+
+def mapear_columnas(headers: List[str]) -> Dict[str, str]:
+    """
+    Mapear headers del archivo a nombres estándar de columnas.
+    Retorna un diccionario: {nombre_estandar: nombre_real_en_archivo}
+    El resultado se memoiza por tupla de headers (imports repetidos de la misma plantilla).
+    """
+    resultado, aproximadas = _mapear_columnas_cache(tuple(headers))
+    for header, campo_estandar in aproximadas:
+        print(f"✨ Coincidencia inteligente: '{header}' -> {campo_estandar}")
+    return dict(resultado)
 
 
 def obtener_valor_flexible(fila: Dict, mapeo: Dict[str, str], campo: str) -> str:
@@ -247,74 +319,67 @@ def obtener_valor_flexible(fila: Dict, mapeo: Dict[str, str], campo: str) -> str
     return ''
 
 
-def process_excel_file(archivo) -> Tuple[List[Dict], List[str]]:
+def iter_excel_rows(archivo, errores: List[str]) -> Iterator[Dict]:
     """
-    Procesar archivo Excel (.xlsx, .xls) con detección automática de fila de headers.
-    
-    Args:
-        archivo: FileStorage object del archivo
-        
-    Returns:
-        Tuple con (lista de filas procesadas, lista de errores)
+    Leer un Excel (.xlsx) fila por fila en modo read_only, con detección de la
+    fila de headers dentro de las primeras HEADER_SCAN_ROWS filas.
+    Genera un diccionario {header: valor} por fila con datos; los errores se
+    agregan a `errores` en vez de lanzarse.
     """
-    filas_datos = []
-    errores = []
-    
+    workbook = None
     try:
-        workbook = openpyxl.load_workbook(archivo)
+        # read_only no carga estilos ni la hoja completa; data_only devuelve
+        # el valor calculado de las fórmulas en vez del texto "=..."
+        workbook = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
         sheet = workbook.active
+        rows = sheet.iter_rows(values_only=True)
         
         # Detectar qué fila tiene los headers
         # Los headers suelen tener texto, no números, y en múltiples columnas
-        header_row = 1
-        max_rows_to_check = min(5, sheet.max_row)
-        
-        for row_num in range(1, max_rows_to_check + 1):
-            row_values = [cell.value for cell in sheet[row_num]]
-            
+        prefijo = list(islice(rows, HEADER_SCAN_ROWS))
+        header_index = 0
+        header_keywords = ['nombre', 'name', 'direccion', 'address', 'telefono', 'phone', 
+                         'edad', 'age', 'email', 'correo']
+        for i, row_values in enumerate(prefijo):
             # Contar cuántas celdas tienen texto (no None, no números puros)
-            text_cells = 0
-            for val in row_values:
-                if val and isinstance(val, str) and len(val.strip()) > 0:
-                    text_cells += 1
+            text_cells = sum(1 for val in row_values if val and isinstance(val, str) and val.strip())
             
             # Si esta fila tiene 3+ celdas con texto, probablemente son headers
             if text_cells >= 3:
                 # Verificar que no sea una fila de datos mirando si tiene palabras comunes de headers
                 row_text = ' '.join([str(v).lower() for v in row_values if v])
-                header_keywords = ['nombre', 'name', 'direccion', 'address', 'telefono', 'phone', 
-                                 'edad', 'age', 'email', 'correo']
-                
                 if any(keyword in row_text for keyword in header_keywords):
-                    header_row = row_num
+                    header_index = i
                     break
         
-        # Extraer headers de la fila detectada
-        headers = [cell.value for cell in sheet[header_row]]
+        if not prefijo:
+            return
         
-        print(f"🔍 Headers detectados en fila {header_row}")
+        headers = prefijo[header_index]
+        print(f"🔍 Headers detectados en fila {header_index + 1}")
         
-        # Procesar cada fila de datos (después de los headers)
-        for row_num, row in enumerate(sheet.iter_rows(min_row=header_row + 1, values_only=True), start=header_row + 1):
+        # Procesar cada fila de datos (después de los headers), sin materializar la hoja
+        for row_num, row in enumerate(chain(prefijo[header_index + 1:], rows), start=header_index + 2):
             fila_dict = {}
-            for i, value in enumerate(row):
-                if i < len(headers) and headers[i]:
-                    fila_dict[headers[i]] = str(value) if value else ''
+            for header, value in zip(headers, row):
+                if header:
+                    fila_dict[header] = value if value else ''
             
-            # Solo agregar si tiene algún dato
+            # Solo generar si tiene algún dato
             if any(fila_dict.values()):
                 fila_dict['_row_num'] = row_num
-                filas_datos.append(fila_dict)
+                yield fila_dict
         
     except Exception as e:
         errores.append(f'Error procesando Excel: {str(e)}')
-    
-    return filas_datos, errores
+    finally:
+        if workbook is not None:
+            workbook.close()
 
 
-def process_csv_file(archivo) -> Tuple[List[Dict], List[str]]:
+def process_excel_file(archivo) -> Tuple[List[Dict], List[str]]:
     """
-    Procesar archivo CSV
+    Procesar archivo Excel (.xlsx, .xls) con detección automática de fila de headers.
     
     Args:
         archivo: FileStorage object del archivo
@@ -322,101 +387,143 @@ def process_csv_file(archivo) -> Tuple[List[Dict], List[str]]:
     Returns:
         Tuple con (lista de filas procesadas, lista de errores)
     """
-    filas_datos = []
     errores = []
-    
+    filas_datos = list(iter_excel_rows(archivo, errores))
+    return filas_datos, errores
+
+
+def _detectar_encoding(prefijo: bytes) -> str:
+    """Encoding del CSV según su prefijo: UTF-8 (con o sin BOM) o Latin-1"""
+    import codecs
     try:
-        # Leer el archivo como bytes
-        content_bytes = archivo.read()
-        archivo_contenido = None
+        # Decodificador incremental: tolera un carácter multibyte cortado al final del prefijo
+        codecs.getincrementaldecoder('utf-8-sig')().decode(prefijo, final=False)
+        return 'utf-8-sig'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+def _filas_csv(texto, delimiter: str) -> Iterator[Dict]:
+    """Filas {header: valor} de un CSV ya decodificado, detectando la fila de headers"""
+    reader = csv.reader(texto, delimiter=delimiter)
+    
+    # Detectar fila de headers en las primeras filas
+    header_keywords = ['nombre', 'name', 'direccion', 'address', 'telefono', 'phone', 
+                     'edad', 'age', 'email', 'correo', 'apellido']
+    prefijo_filas = list(islice(reader, HEADER_SCAN_ROWS))
+    header_row_index = 0
+    for i, row in enumerate(prefijo_filas):
+        # Si encontramos al menos 2 keywords, asumimos que es el header (sin importar tildes)
+        row_text = ' '.join([normalizar_nombre_columna(v) for v in row if v])
+        if sum(1 for k in header_keywords if k in row_text) >= 2:
+            header_row_index = i
+            print(f"🔍 Headers detectados en fila CSV {i+1}")
+            break
+    
+    if not prefijo_filas:
+        return
+    
+    headers = prefijo_filas[header_row_index]
+    
+    # Procesar datos
+    for row_num, row_values in enumerate(chain(prefijo_filas[header_row_index + 1:], reader),
+                                         start=header_row_index + 2):
+        if not row_values:
+            continue
         
-        # Intentar decodificar con diferentes encodings
-        encodings = ['utf-8', 'latin-1', 'cp1252']
-        for encoding in encodings:
-            try:
-                archivo_contenido = content_bytes.decode(encoding)
-                print(f"✅ Archivo CSV decodificado con {encoding}")
-                break
-            except UnicodeDecodeError:
-                continue
-                
-        if archivo_contenido is None:
-            errores.append('Error de codificación: El archivo no es UTF-8 ni Latin-1 válido.')
-            return filas_datos, errores
+        # Crear diccionario manual para evitar problemas con DictReader y líneas vacías previas
+        fila = {header: val for header, val in zip(headers, row_values) if header}
+        
+        if any(fila.values()): # Solo si tiene datos
+            fila['_row_num'] = row_num
+            yield fila
+
+
+def iter_csv_rows(archivo, errores: List[str]) -> Iterator[Dict]:
+    """
+    Leer un CSV fila por fila. Encoding y delimitador se detectan sobre los
+    primeros CSV_SNIFF_BYTES y el resto se decodifica de forma incremental con
+    un TextIOWrapper estricto. Si un prefijo ASCII resultó no ser UTF-8 más
+    adelante, el archivo se relee como Latin-1 desde la fila siguiente a la
+    última entregada. Genera un diccionario {header: valor} por fila con datos;
+    los errores se agregan a `errores` en vez de lanzarse.
+    """
+    stream = getattr(archivo, 'stream', archivo)
+    texto = None
+    try:
+        prefijo = stream.read(CSV_SNIFF_BYTES)
+        stream.seek(0)
+        encoding = _detectar_encoding(prefijo)
+        print(f"✅ Archivo CSV decodificado con {encoding}")
+        muestra = prefijo.decode(encoding, errors='ignore')
         
         # Validar mínimo de líneas
-        lineas = archivo_contenido.strip().split('\n')
+        lineas = muestra.strip().split('\n')
         if len(lineas) < 2:
             errores.append('El archivo debe tener al menos una fila de encabezados y una fila de datos')
-            return filas_datos, errores
+            return
         
         # Detectar delimitador
+        # Tomar una muestra representativa (primeras 5 líneas)
+        sample = '\n'.join(lineas[:5])
         try:
-            # Tomar una muestra representativa (primeras 5 líneas)
-            sample = '\n'.join(lineas[:5])
-            dialect = csv.Sniffer().sniff(sample)
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
             delimiter = dialect.delimiter
         except:
-            # Fallback si falla la detección
-            # Contar comas vs punto y coma en la primera línea
-            header = lineas[0]
-            delimiter = ';' if header.count(';') > header.count(',') else ','
+            # Fallback si falla la detección (p.ej. una fila de título antes de los headers)
+            # Contar comas vs punto y coma en la muestra
+            delimiter = ';' if sample.count(';') > sample.count(',') else ','
             
         print(f"🔍 Delimitador CSV detectado: '{delimiter}'")
         
-        print(f"🔍 Delimitador CSV detectado: '{delimiter}'")
-        
-        # Detectar fila de headers
-        header_row_index = 0
-        header_keywords = ['nombre', 'name', 'direccion', 'address', 'telefono', 'phone', 
-                         'edad', 'age', 'email', 'correo', 'apellido']
-        
-        # Buscar la primera fila que parezca tener headers
-        csv_reader_temp = csv.reader(io.StringIO(archivo_contenido), delimiter=delimiter)
-        rows_temp = list(csv_reader_temp)
-        
-        for i, row in enumerate(rows_temp):
-            # Convertir fila a string para buscar keywords
-            row_text = ' '.join([str(v).lower() for v in row if v])
-            
-            # Si encontramos al menos 2 keywords, asumimos que es el header
-            matches = sum(1 for k in header_keywords if k in row_text)
-            if matches >= 2:
-                header_row_index = i
-                print(f"🔍 Headers detectados en fila CSV {i+1}")
-                break
-        
-        # Reconstruir contenido desde la fila de headers
-        # Usamos rows_temp[header_row_index:]
-        if not rows_temp:
-             return filas_datos, errores
-
-        # Obtener los headers de la fila detectada
-        headers = rows_temp[header_row_index]
-        
-        # Procesar datos
-        for row_num, row_values in enumerate(rows_temp[header_row_index+1:], start=header_row_index+2):
-            if not row_values: continue
-            
-            # Crear diccionario manual para evitar problemas con DictReader y líneas vacías previas
-            fila = {}
-            for i, val in enumerate(row_values):
-                if i < len(headers):
-                    header = headers[i]
-                    if header: # Solo si el header tiene nombre
-                        fila[header] = val
-            
-            if any(fila.values()): # Solo si tiene datos
-                fila['_row_num'] = row_num
-                filas_datos.append(fila)
+        ultima_fila = 0
+        while True:
+            texto = io.TextIOWrapper(stream, encoding=encoding, errors='strict', newline='')
+            try:
+                for fila in _filas_csv(texto, delimiter):
+                    # Al releer, saltar las filas que ya se entregaron
+                    if fila['_row_num'] > ultima_fila:
+                        ultima_fila = fila['_row_num']
+                        yield fila
+                return
+            except UnicodeDecodeError:
+                if encoding == 'latin-1' or not prefijo.isascii():
+                    # UTF-8 con acentos al principio y bytes inválidos después: no adivinar
+                    errores.append(f'El archivo no es UTF-8 válido a partir de la fila {ultima_fila + 1}; '
+                                   f'guárdelo como "CSV UTF-8" e impórtelo de nuevo')
+                    return
+                # Hasta aquí todo era ASCII, idéntico en Latin-1: releer sin perder filas
+                print(f"⚠️ Byte no UTF-8 después de la fila {ultima_fila}: releyendo el CSV como latin-1")
+                encoding = 'latin-1'
+                texto.detach()
+                texto = None
+                stream.seek(0)
     
     except Exception as e:
         errores.append(f'Error procesando CSV: {str(e)}')
+    finally:
+        if texto is not None:
+            # No cerrar el archivo subido al descartar el wrapper
+            texto.detach()
+
+
+def process_csv_file(archivo) -> Tuple[List[Dict], List[str]]:
+    """
+    Procesar archivo CSV
     
+    Args:
+        archivo: FileStorage object del archivo
+        
+    Returns:
+        Tuple con (lista de filas procesadas, lista de errores)
+    """
+    errores = []
+    filas_datos = list(iter_csv_rows(archivo, errores))
     return filas_datos, errores
 
 
-def extract_person_data(fila: Dict, row_num: int = None, mapeo: Dict[str, str] = None) -> Tuple[Dict, List[str]]:
+def extract_person_data(fila: Dict, row_num: int = None, mapeo: Dict[str, str] = None,
+                        formato_fecha: str = None) -> Tuple[Dict, List[str]]:
     """
     Extraer y validar datos de una persona desde una fila usando mapeo inteligente.
     
@@ -424,6 +531,7 @@ def extract_person_data(fila: Dict, row_num: int = None, mapeo: Dict[str, str] =
         fila: Diccionario con los datos de la fila
         row_num: Número de fila (opcional, para mensajes de error)
         mapeo: Diccionario de mapeo de columnas (opcional)
+        formato_fecha: Formato de la columna de fechas (opcional, ver inferir_formato_fecha)
         
     Returns:
         Tuple con (diccionario de datos de persona, lista de errores)
@@ -487,7 +595,7 @@ def extract_person_data(fila: Dict, row_num: int = None, mapeo: Dict[str, str] =
     
     # Parsear fechas
     fecha_matrimonio_raw = obtener_valor_flexible(fila, mapeo, 'fecha_matrimonio')
-    fecha_matrimonio = parse_date(fecha_matrimonio_raw)
+    fecha_matrimonio = parse_date(fecha_matrimonio_raw, formato_fecha)
     
     ocupacion = obtener_valor_flexible(fila, mapeo, 'ocupacion')
     email = obtener_valor_flexible(fila, mapeo, 'email')
@@ -498,7 +606,7 @@ def extract_person_data(fila: Dict, row_num: int = None, mapeo: Dict[str, str] =
     if edad_str:
         try:
             edad = int(float(edad_str))
-        except ValueError:
+        except (ValueError, OverflowError):
             errores.append(f'Fila {row_num}: Edad "{edad_str}" no es un número válido')
     
     # Convertir edad del cónyuge
@@ -506,7 +614,7 @@ def extract_person_data(fila: Dict, row_num: int = None, mapeo: Dict[str, str] =
     if edad_conyuge_str:
         try:
             edad_conyuge = int(float(edad_conyuge_str))
-        except ValueError:
+        except (ValueError, OverflowError):
             pass  # No es crítico
     
     # Convertir número de hijos
@@ -514,7 +622,7 @@ def extract_person_data(fila: Dict, row_num: int = None, mapeo: Dict[str, str] =
     if hijos_str:
         try:
             numero_hijos = int(float(hijos_str))
-        except ValueError:
+        except (ValueError, OverflowError):
             errores.append(f'Fila {row_num}: Número de hijos "{hijos_str}" no es válido')
     
     # Construir diccionario de datos
@@ -542,42 +650,212 @@ def extract_person_data(fila: Dict, row_num: int = None, mapeo: Dict[str, str] =
     return persona_data, errores
 
 
-def process_import_file(archivo, filename: str) -> Tuple[List[Dict], List[str], str, List[str]]:
+# Filas por bloque enviado a cada proceso en la extracción paralela
+EXTRACT_CHUNK_SIZE = 2000
+
+
+def _extraer_bloque(bloque: List[Dict], mapeo: Dict[str, str],
+                    formato_fecha: str = None) -> List[Tuple[Dict, List[str]]]:
+    """Extraer un bloque de filas (se ejecuta en un proceso del pool)"""
+    return [extract_person_data(fila, mapeo=mapeo, formato_fecha=formato_fecha) for fila in bloque]
+
+
+def iter_extraer_personas(filas: Iterator[Dict], mapeo: Dict[str, str], workers: int = None,
+                          chunk_size: int = EXTRACT_CHUNK_SIZE) -> Iterator[Tuple[Dict, List[str]]]:
     """
-    Procesar archivo de importación (Excel o CSV) con mapeo inteligente de columnas.
+    Aplicar extract_person_data a cada fila, en orden.
+    Con workers > 1 las filas se reparten en bloques de `chunk_size` a un
+    ProcessPoolExecutor; como máximo hay 2 bloques por proceso en vuelo, así que
+    la memoria no depende del tamaño del archivo. Archivos de un solo bloque
+    se procesan en el proceso actual (arrancar el pool no compensa).
+    El formato de la columna de fechas se infiere del primer bloque.
+    """
+    filas = iter(filas)
+    primer_bloque = list(islice(filas, chunk_size))
+    formato_fecha = inferir_formato_fecha(
+        obtener_valor_flexible(fila, mapeo, 'fecha_matrimonio') for fila in primer_bloque
+    )
+    if not workers or workers <= 1 or len(primer_bloque) < chunk_size:
+        for fila in chain(primer_bloque, filas):
+            yield extract_person_data(fila, mapeo=mapeo, formato_fecha=formato_fecha)
+        return
+    
+    import multiprocessing
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    
+    # spawn: hacer fork desde un servidor con hilos (gunicorn, pool de importación) no es seguro
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        pendientes = deque([executor.submit(_extraer_bloque, primer_bloque, mapeo, formato_fecha)])
+        while pendientes:
+            while len(pendientes) < workers * 2:
+                bloque = list(islice(filas, chunk_size))
+                if not bloque:
+                    break
+                pendientes.append(executor.submit(_extraer_bloque, bloque, mapeo, formato_fecha))
+            # Los resultados se toman en el orden de envío
+            yield from pendientes.popleft().result()
+
+
+def _convertir_enteros(serie) -> Tuple[List[Optional[int]], List[bool]]:
+    """
+    int(float(valor)) vectorizado para una columna de strings ya limpios.
+    Retorna (enteros o None, inválidos). Lo que to_numeric no resuelve de forma
+    segura (texto, nan/inf, números muy grandes) se convierte con float() como
+    en extract_person_data, así el resultado es idéntico.
+    """
+    import numpy as np
+    import pandas as pd
+    
+    vacios = (serie == '').to_numpy()
+    numeros = pd.to_numeric(serie.where(~vacios), errors='coerce').astype(float).to_numpy()
+    with np.errstate(invalid='ignore'):
+        rapidos = ~vacios & np.isfinite(numeros) & (np.abs(numeros) < 2 ** 53)
+    
+    enteros = np.full(len(serie), None, dtype=object)
+    enteros[rapidos] = np.trunc(numeros[rapidos]).astype(np.int64).tolist()
+    invalidos = np.zeros(len(serie), dtype=bool)
+    valores = serie.to_numpy()
+    for i in np.flatnonzero(~vacios & ~rapidos):
+        try:
+            enteros[i] = int(float(valores[i]))
+        except (ValueError, OverflowError):
+            invalidos[i] = True
+    return enteros, invalidos
+
+
+def extraer_personas_vectorizado(filas, mapeo: Dict[str, str]) -> Tuple[List[Dict], List[str]]:
+    """
+    Versión columnar de extract_person_data: carga las columnas mapeadas en un
+    DataFrame y aplica separación de nombre, conversión numérica, fechas (cada
+    valor distinto se parsea una sola vez) e inferencia de estado civil como
+    operaciones por columna. Retorna (personas_data, errores), con los mismos
+    datos y mensajes, en el mismo orden, que el camino fila por fila.
+    """
+    import numpy as np
+    import pandas as pd
+    
+    filas = list(filas)
+    if not filas:
+        return [], []
+    
+    # Igual que obtener_valor_flexible: str(valor).strip(), '' si el campo no está mapeado
+    df = pd.DataFrame(index=range(len(filas)))
+    for campo in MAPEO_CAMPOS:
+        columna = mapeo.get(campo)
+        if columna:
+            df[campo] = pd.Series([str(fila.get(columna, '')).strip() for fila in filas], dtype=object)
+        else:
+            df[campo] = ''
+    row_nums = [fila.get('_row_num', 0) for fila in filas]
+    
+    # Nombre y apellido: columna separada o primer espacio del nombre completo
+    partes = df['nombre'].str.split(' ', n=1, expand=True).reindex(columns=[0, 1])
+    con_apellido = df['apellido'] != ''
+    nombre = df['nombre'].where(con_apellido, partes[0])
+    apellido = df['apellido'].where(con_apellido, partes[1].fillna(''))
+    
+    # Cónyuge (nombre + apellido) e inferencia de estado civil
+    nombre_conyuge = df['nombre_conyuge'].where(
+        (df['apellido_conyuge'] == '') | (df['nombre_conyuge'] == ''),
+        df['nombre_conyuge'] + ' ' + df['apellido_conyuge']
+    )
+    estado_civil = df['estado_civil'].where(
+        df['estado_civil'] != '',
+        pd.Series(np.where(nombre_conyuge != '', 'Casado', 'Soltero'), dtype=object)
+    )
+    
+    # Números
+    hijos_str = df['num_hijos'].where(df['num_hijos'] != '', '0')
+    edad, edad_invalida = _convertir_enteros(df['edad'])
+    edad_conyuge, _ = _convertir_enteros(df['edad_conyuge'])
+    numero_hijos, hijos_invalidos = _convertir_enteros(hijos_str)
+    numero_hijos[hijos_invalidos] = 0
+    
+    # Fechas: parsear cada valor distinto una vez, con el formato de la columna
+    valores_fecha = df['fecha_matrimonio'].unique()
+    formato_fecha = inferir_formato_fecha(valores_fecha)
+    fechas = {valor: parse_date(valor, formato_fecha) for valor in valores_fecha}
+    fecha_matrimonio = df['fecha_matrimonio'].map(fechas).astype(object)
+    fecha_matrimonio = fecha_matrimonio.where(fecha_matrimonio.notna(), None)
+    
+    salida = {
+        'nombre': nombre,
+        'apellido': apellido,
+        'direccion': df['direccion'],
+        'codigo_postal': df['codigo_postal'],
+        'telefono': df['telefono'],
+        'edad': edad,
+        'estado_civil': estado_civil,
+        'numero_hijos': numero_hijos,
+        'edades_hijos': df['edades_hijos'],
+        'nombre_conyuge': nombre_conyuge,
+        'telefono_conyuge': df['telefono_conyuge'],
+        'email_conyuge': df['email_conyuge'],
+        'edad_conyuge': edad_conyuge,
+        'trabajo_conyuge': df['trabajo_conyuge'],
+        'fecha_matrimonio': fecha_matrimonio,
+        'ocupacion': df['ocupacion'],
+        'email': df['email'],
+        'notas': df['notas']
+    }
+    
+    # Errores, en el mismo orden que fila por fila (solo se recorren las filas con error)
+    sin_nombre = (df['nombre'] == '').to_numpy()
+    edad_valores = df['edad'].to_numpy()
+    hijos_valores = hijos_str.to_numpy()
+    errores = []
+    for i in np.flatnonzero(sin_nombre | edad_invalida | hijos_invalidos):
+        if sin_nombre[i]:
+            errores.append(f'Fila {row_nums[i]}: Nombre es obligatorio')
+            continue
+        if edad_invalida[i]:
+            errores.append(f'Fila {row_nums[i]}: Edad "{edad_valores[i]}" no es un número válido')
+        if hijos_invalidos[i]:
+            errores.append(f'Fila {row_nums[i]}: Número de hijos "{hijos_valores[i]}" no es válido')
+    
+    # Armar los dicts con zip sobre las columnas (DataFrame.to_dict convierte celda por celda)
+    con_nombre = ~sin_nombre
+    claves = list(salida)
+    columnas = [np.asarray(valores, dtype=object)[con_nombre].tolist() for valores in salida.values()]
+    personas_data = [dict(zip(claves, valores)) for valores in zip(*columnas)]
+    return personas_data, errores
+
+
+def iter_import_file(archivo, filename: str, errores: List[str], workers: int = None,
+                     engine: str = 'python') -> Tuple[str, List[str], Iterator[Tuple[Dict, List[str]]]]:
+    """
+    Versión en streaming de process_import_file: lee los encabezados y arma el
+    mapeo de columnas enseguida, y las personas se extraen a medida que se
+    consume el iterador, así la memoria no depende del tamaño del archivo
+    (salvo con engine='pandas', que carga todas las filas).
+    Los errores del archivo se agregan a `errores`.
     
-    Args:
-        archivo: FileStorage object
-        filename: Nombre del archivo
-        
     Returns:
-        Tuple con (lista de datos de personas, lista de errores, tipo de archivo, columnas faltantes)
+        Tuple con (tipo de archivo, columnas faltantes, iterador de (persona, errores de la fila))
     """
     filename_lower = filename.lower()
-    personas_data = []
-    all_errors = []
     file_type = 'unknown'
     columnas_faltantes = []
     
-    # Procesar según el tipo de archivo
+    # Procesar según el tipo de archivo. Las filas se leen en streaming.
     if filename_lower.endswith('.xlsx') or filename_lower.endswith('.xls'):
         file_type = 'excel'
-        filas, errores = process_excel_file(archivo)
-        all_errors.extend(errores)
+        filas = iter_excel_rows(archivo, errores)
     elif filename_lower.endswith('.csv'):
         file_type = 'csv'
-        filas, errores = process_csv_file(archivo)
-        all_errors.extend(errores)
+        filas = iter_csv_rows(archivo, errores)
     else:
-        all_errors.append('Formato de archivo no soportado. Use .xlsx, .xls o .csv')
-        return personas_data, all_errors, file_type, columnas_faltantes
+        errores.append('Formato de archivo no soportado. Use .xlsx, .xls o .csv')
+        return file_type, columnas_faltantes, iter(())
     
-    if not filas:
-        all_errors.append('No se encontraron datos en el archivo')
-        return personas_data, all_errors, file_type, columnas_faltantes
+    primera_fila = next(filas, None)
+    if primera_fila is None:
+        errores.append('No se encontraron datos en el archivo')
+        return file_type, columnas_faltantes, iter(())
     
     # Crear mapeo de columnas una vez usando la primera fila
-    headers = list(filas[0].keys()) if filas else []
+    headers = list(primera_fila.keys())
     mapeo = mapear_columnas(headers)
     
     # Log de columnas encontradas (útil para debugging)
@@ -594,8 +872,33 @@ def process_import_file(archivo, filename: str) -> Tuple[List[Dict], List[str],
         print(f"  ⚠️  Columnas no encontradas: {', '.join(columnas_faltantes)}")
     
     # Extraer datos de personas de cada fila usando el mismo mapeo
-    for fila in filas:
-        persona_data, errores = extract_person_data(fila, mapeo=mapeo)
+    if engine == 'pandas':
+        personas_data, errores_filas = extraer_personas_vectorizado(chain([primera_fila], filas), mapeo)
+        errores.extend(errores_filas)
+        return file_type, columnas_faltantes, ((persona, []) for persona in personas_data)
+    
+    return file_type, columnas_faltantes, iter_extraer_personas(chain([primera_fila], filas), mapeo, workers=workers)
+
+
+def process_import_file(archivo, filename: str, workers: int = None,
+                        engine: str = 'python') -> Tuple[List[Dict], List[str], str, List[str]]:
+    """
+    Procesar archivo de importación (Excel o CSV) con mapeo inteligente de columnas.
+    
+    Args:
+        archivo: FileStorage object
+        filename: Nombre del archivo
+        workers: Procesos para la extracción de filas (None = en el proceso actual)
+        engine: 'python' (fila por fila) o 'pandas' (columnar, ver extraer_personas_vectorizado)
+        
+    Returns:
+        Tuple con (lista de datos de personas, lista de errores, tipo de archivo, columnas faltantes)
+    """
+    personas_data = []
+    all_errors = []
+    file_type, columnas_faltantes, personas = iter_import_file(archivo, filename, all_errors,
+                                                               workers=workers, engine=engine)
+    for persona_data, errores in personas:
         if persona_data:
             personas_data.append(persona_data)
         all_errors.extend(errores)
@@ -0,0 +1,247 @@
+"""
+Geocodificación por lotes en el servidor.
+Un trabajo toma las tarjetas sin coordenadas de un tablero, resuelve primero lo
+que ya está en la caché y geocodifica el resto con un pool de hilos acotado y un
+limitador token-bucket. El backend es intercambiable (Google o uno local offline).
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.models import db, storage, GeocodeCache, GeocodingJob
+from app.utils.clustering import normalizar_direccion, GEOCODE_CACHE_TTL_DAYS
+from app.utils.trabajos import get_executor, reclamar, ids_disponibles
+
+
+class GoogleGeocoder:
+    """Backend de Google Maps"""
+    def __init__(self, api_key: str):
+        import googlemaps
+        self.client = googlemaps.Client(key=api_key)
+
+    def geocode(self, address: str) -> Tuple[Optional[float], Optional[float]]:
+        result = self.client.geocode(address)
+        if result:
+            location = result[0]['geometry']['location']
+            return location['lat'], location['lng']
+        return None, None
+
+
+class OfflineGeocoder:
+    """
+    Backend local sin red (para pruebas y desarrollo).
+    Resuelve solo las direcciones conocidas, comparando por dirección normalizada.
+    """
+    def __init__(self, direcciones: Dict[str, Tuple[float, float]] = None):
+        self.direcciones = {normalizar_direccion(k): v for k, v in (direcciones or {}).items()}
+        self.llamadas = 0
+
+    def geocode(self, address: str) -> Tuple[Optional[float], Optional[float]]:
+        self.llamadas += 1
+        return self.direcciones.get(normalizar_direccion(address), (None, None))
+
+
+def get_geocoder(config):
+    """
+    Elegir backend según config['GEOCODER_BACKEND']: 'google' (por defecto),
+    'offline', o directamente una instancia con método geocode().
+    """
+    backend = config.get('GEOCODER_BACKEND', 'google')
+    if hasattr(backend, 'geocode'):
+        return backend
+    if backend == 'offline':
+        return OfflineGeocoder()
+    return GoogleGeocoder(config.get('GOOGLE_MAPS_API_KEY'))
+
+
+class TokenBucket:
+    """Limitador de tasa token-bucket seguro para hilos"""
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(rate, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                espera = (1 - self.tokens) / self.rate
+            time.sleep(espera)
+
+
+# Un trabajo en proceso sin latido durante este tiempo se considera abandonado
+GEOCODING_JOB_STALE_SECONDS = 300
+# Cada cuánto se guardan coordenadas y progreso (también hace de latido)
+GEOCODING_PROGRESS_SECONDS = 2
+
+
+def _geocode_remoto(geocoder, bucket: TokenBucket, direccion: str):
+    bucket.acquire()
+    try:
+        return geocoder.geocode(direccion), None
+    except Exception as e:
+        return (None, None), e
+
+
+def _avanzar(job: GeocodingJob, **incrementos):
+    for campo, valor in incrementos.items():
+        setattr(job, campo, getattr(job, campo) + valor)
+
+
+def _escribir(job: GeocodingJob, pendientes: List[Dict], cache: List[Dict]):
+    """Guardar en una transacción las coordenadas y entradas de caché pendientes junto con el progreso"""
+    if pendientes:
+        storage.actualizar_coordenadas(pendientes)
+        pendientes.clear()
+    if cache:
+        GeocodeCache.guardar_lote(cache)
+        cache.clear()
+    job.fecha_actualizacion = datetime.utcnow()
+    db.session.commit()
+
+
+def ejecutar_geocodificacion(job_id: str, geocoder, max_workers: int = 4, rate: float = 10,
+                             chunk_size: int = 100, cache_ttl_days: int = GEOCODE_CACHE_TTL_DAYS,
+                             stale_seconds: int = GEOCODING_JOB_STALE_SECONDS):
+    """
+    Procesar un trabajo de geocodificación (requiere app context; el acceso a BD
+    ocurre solo en este hilo, el pool solo hace las llamadas remotas).
+    Retomar un trabajo es empezarlo de nuevo: solo se toman las tarjetas que siguen sin coordenadas.
+    """
+    if not reclamar(GeocodingJob, job_id, stale_seconds):
+        return
+    job = db.session.get(GeocodingJob, job_id)
+    job.total = job.procesadas = job.geocodificadas = job.desde_cache = job.fallidas = 0
+    job.fecha_inicio = datetime.utcnow()
+    job.fecha_fin = None
+    db.session.commit()
+
+    try:
+        tarjetas = storage.get_tarjetas_sin_coordenadas(job.tablero_id)
+        job.total = len(tarjetas)
+
+        # Agrupar tarjetas por dirección normalizada (hogares comparten dirección)
+        grupos: Dict[str, Dict] = {}
+        for t in tarjetas:
+            clave = normalizar_direccion(t.direccion)
+            grupo = grupos.setdefault(clave, {'direccion': t.direccion, 'ids': []})
+            grupo['ids'].append(t.id)
+
+        pendientes = []
+        cache = []
+
+        # 1. Resolver desde la caché en una sola consulta
+        cacheadas = GeocodeCache.query.filter(
+            GeocodeCache.direccion_normalizada.in_(list(grupos.keys()))
+        ).all() if grupos else []
+        for entrada in cacheadas:
+            if entrada.expirado(cache_ttl_days):
+                continue
+            grupo = grupos.pop(entrada.direccion_normalizada)
+            entrada.hits = (entrada.hits or 0) + 1
+            n = len(grupo['ids'])
+            if entrada.latitud is not None:
+                pendientes.extend({'id': i, 'lat': entrada.latitud, 'lng': entrada.longitud} for i in grupo['ids'])
+                _avanzar(job, procesadas=n, desde_cache=n, geocodificadas=n)
+            else:
+                _avanzar(job, procesadas=n, desde_cache=n, fallidas=n)
+        _escribir(job, pendientes, cache)
+
+        # 2. Geocodificar el resto en paralelo, con tasa limitada
+        bucket = TokenBucket(rate)
+        ultimo = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futuros = {
+                executor.submit(_geocode_remoto, geocoder, bucket, grupo['direccion']): (clave, grupo)
+                for clave, grupo in grupos.items()
+            }
+            for futuro in as_completed(futuros):
+                clave, grupo = futuros[futuro]
+                (lat, lng), error = futuro.result()
+                n = len(grupo['ids'])
+                if error is None:
+                    # Los errores transitorios no se guardan en caché
+                    cache.append({'clave': clave, 'direccion': grupo['direccion'], 'lat': lat, 'lng': lng})
+                else:
+                    print(f"Error geocoding {grupo['direccion']}: {error}")
+                if lat is not None and lng is not None:
+                    pendientes.extend({'id': i, 'lat': lat, 'lng': lng} for i in grupo['ids'])
+                    _avanzar(job, procesadas=n, geocodificadas=n)
+                else:
+                    _avanzar(job, procesadas=n, fallidas=n)
+                if max(len(pendientes), len(cache)) >= chunk_size or time.monotonic() - ultimo >= GEOCODING_PROGRESS_SECONDS:
+                    _escribir(job, pendientes, cache)
+                    ultimo = time.monotonic()
+
+        _escribir(job, pendientes, cache)
+        job.estado = 'completado'
+        print(f"📍 Geocodificación del tablero {job.tablero_id}: {job.geocodificadas}/{job.total} "
+              f"({job.desde_cache} desde caché, {job.fallidas} fallidas)")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error en trabajo de geocodificación {job_id}: {e}")
+        job.estado = 'error'
+        job.error = str(e)
+    finally:
+        job.fecha_fin = datetime.utcnow()
+        db.session.commit()
+
+
+def _lanzar(app, job_id: str, background: bool = True):
+    opciones = {
+        'max_workers': app.config.get('GEOCODING_MAX_WORKERS', 4),
+        'rate': app.config.get('GEOCODING_RATE_LIMIT', 10),
+        'cache_ttl_days': app.config.get('GEOCODE_CACHE_TTL_DAYS', GEOCODE_CACHE_TTL_DAYS)
+    }
+    geocoder = get_geocoder(app.config)
+
+    def _run():
+        with app.app_context():
+            ejecutar_geocodificacion(job_id, geocoder, **opciones)
+
+    if background:
+        # Un solo hilo: los trabajos van uno tras otro y así respetan entre todos el límite de tasa
+        get_executor('geocoding').submit(_run)
+    else:
+        _run()
+
+
+def iniciar_trabajo(app, tablero_id: str, usuario_id: str = None, background: bool = True) -> GeocodingJob:
+    """Registrar un trabajo de geocodificación para el tablero y encolarlo"""
+    job = GeocodingJob(tablero_id=tablero_id, usuario_id=usuario_id)
+    db.session.add(job)
+    db.session.commit()
+    _lanzar(app, job.id, background=background)
+    if not background:
+        # Se procesó en otra sesión: recargar el progreso final
+        db.session.refresh(job)
+    return job
+
+
+def reanudar_geocodificaciones(app, background: bool = True,
+                               stale_seconds: int = GEOCODING_JOB_STALE_SECONDS) -> int:
+    """
+    Volver a encolar trabajos pendientes o abandonados (p. ej. tras un reinicio).
+    Lo llama el proceso web después de las migraciones (run.py), junto con las importaciones.
+    Requiere app context.
+    """
+    ids = ids_disponibles(GeocodingJob, stale_seconds)
+    for job_id in ids:
+        _lanzar(app, job_id, background=background)
+    if ids:
+        print(f"📍 Retomando {len(ids)} geocodificaciones pendientes")
+    return len(ids)
+
+
+def get_trabajo(job_id: str) -> Optional[GeocodingJob]:
+    return db.session.get(GeocodingJob, job_id)
@@ -0,0 +1,221 @@
+"""
+Importación de Excel/CSV en segundo plano.
+El upload se guarda en disco y se registra un ImportJob en la base de datos; un
+pool de hilos lo procesa en streaming (iter_import_file -> storage.importar_personas,
+de a bloques) y va guardando el progreso. Antes del insert, cada fila se compara contra un índice
+de las personas del tablero (ver utils.duplicados) para no duplicar la lista al
+volver a subir el mismo archivo. Como el estado vive en la BD, cualquier worker puede
+responder la consulta de progreso y los trabajos interrumpidos por un reinicio
+se retoman desde la última fila confirmada.
+"""
+
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from itertools import islice
+from typing import Optional
+
+from app.models import db, storage, ImportJob, Lista
+from app.utils.duplicados import IndiceDuplicados, MOTIVOS_DUPLICADO
+from app.utils.excel_handler import iter_import_file
+from app.utils.trabajos import get_executor, reclamar, ids_disponibles
+
+# Un trabajo 'en_proceso' sin latido en este tiempo se considera abandonado
+IMPORT_JOB_STALE_SECONDS = 300
+# Cada cuánto se renueva el latido mientras se lee el archivo
+IMPORT_HEARTBEAT_SECONDS = 15
+
+
+def _carpeta_uploads(app) -> str:
+    carpeta = app.config.get('IMPORT_UPLOAD_FOLDER') or os.path.join(app.instance_path, 'imports')
+    os.makedirs(carpeta, exist_ok=True)
+    return carpeta
+
+
+def _con_latido(items, job: ImportJob, intervalo: float):
+    """
+    Renovar job.fecha_actualizacion cada `intervalo` segundos mientras se consume
+    `items`, para que un archivo que tarda en leerse no parezca abandonado.
+    """
+    ultimo = time.monotonic()
+    for item in items:
+        yield item
+        if time.monotonic() - ultimo >= intervalo:
+            job.fecha_actualizacion = datetime.utcnow()
+            db.session.commit()
+            ultimo = time.monotonic()
+
+
+def _filtrar_duplicados(personas, indice: IndiceDuplicados, accion: str, resumen: dict):
+    """
+    Dejar pasar al insert solo lo que corresponde según `accion`:
+    - omitir: las filas duplicadas no se insertan
+    - combinar: no se insertan; se acumulan en resumen['combinar'] para completar
+      los campos vacíos de la tarjeta existente
+    - marcar: se insertan igual, se cuentan en resumen['marcadas'] y se agrega
+      un aviso a resumen['avisos']
+    Un duplicado dentro del mismo archivo (la tarjeta aún no existe) se omite salvo
+    con 'marcar'. resumen['duplicados'] cuenta las filas que no llegan al insert.
+    """
+    for persona in personas:
+        coincidencia = indice.buscar(persona)
+        if coincidencia is None:
+            indice.agregar(persona)
+            yield persona
+            continue
+        
+        tarjeta_id, motivo = coincidencia
+        if accion == 'marcar':
+            nombre = f"{persona.get('nombre', '')} {persona.get('apellido') or ''}".strip()
+            resumen['marcadas'] += 1
+            resumen['avisos'].append(f'Posible duplicado: {nombre} ({MOTIVOS_DUPLICADO[motivo]})')
+            yield persona
+            continue
+        if accion == 'combinar' and tarjeta_id:
+            resumen['combinar'].append((tarjeta_id, persona))
+        resumen['duplicados'] += 1
+
+
+def ejecutar_importacion(job_id: str, chunk_size: int = 500, stale_seconds: int = IMPORT_JOB_STALE_SECONDS,
+                         workers: int = None, engine: str = 'python'):
+    """Procesar un trabajo de importación (requiere app context)"""
+    if not reclamar(ImportJob, job_id, stale_seconds):
+        return
+    job = db.session.get(ImportJob, job_id)
+    # Siempre bastante por debajo del límite de abandono
+    intervalo_latido = min(IMPORT_HEARTBEAT_SECONDS, stale_seconds / 3)
+
+    try:
+        errores = []
+        # Reanudar: las primeras `procesadas` filas ya pasaron por el insert antes del reinicio
+        ya_procesadas = job.procesadas
+        base_insertadas = job.insertadas
+        base_fallidas = job.fallidas
+        base_duplicados = job.duplicados
+        base_marcadas = job.marcadas
+        job.filas_leidas = 0
+
+        # Índice de duplicados del tablero (una consulta); incluye lo insertado antes de un reinicio
+        tablero_id = db.session.get(Lista, job.lista_id).tablero_id
+        indice = IndiceDuplicados.del_tablero(tablero_id)
+        resumen = {'duplicados': 0, 'marcadas': 0, 'rechazadas': 0, 'combinar': [], 'avisos': []}
+
+        def progreso(insertadas, errores_insercion):
+            storage.combinar_personas(resumen['combinar'])
+            resumen['combinar'] = []
+            mensajes = errores + errores_insercion
+            job.insertadas = base_insertadas + insertadas
+            # Fallidas: filas rechazadas al extraer/validar más las que fallaron al insertar
+            job.fallidas = base_fallidas + resumen['rechazadas'] + len(errores_insercion)
+            job.duplicados = base_duplicados + resumen['duplicados']
+            job.marcadas = base_marcadas + resumen['marcadas']
+            job.procesadas = (ya_procesadas + insertadas + len(errores_insercion)
+                              + resumen['duplicados'] + resumen['rechazadas'])
+            job.total_errores = len(mensajes)
+            job.errores = json.dumps(mensajes[:ImportJob.MAX_ERRORES], ensure_ascii=False)
+            job.avisos = json.dumps(resumen['avisos'][:ImportJob.MAX_ERRORES], ensure_ascii=False)
+            job.fecha_actualizacion = datetime.utcnow()
+            db.session.commit()
+
+        with open(job.ruta_archivo, 'rb') as archivo:
+            file_type, columnas_faltantes, filas = iter_import_file(
+                archivo, job.filename, errores, workers=workers, engine=engine
+            )
+            job.columnas_faltantes = json.dumps(columnas_faltantes)
+            job.fecha_actualizacion = datetime.utcnow()
+            db.session.commit()
+
+            def leer_filas():
+                for persona_data, errores_fila in filas:
+                    errores.extend(errores_fila)
+                    job.filas_leidas += 1
+                    yield persona_data
+
+            def descartar_rechazadas(filas_leidas):
+                # Filas sin persona válida (p. ej. sin nombre): cuentan como fallidas
+                for persona_data in filas_leidas:
+                    if persona_data:
+                        yield persona_data
+                    else:
+                        resumen['rechazadas'] += 1
+
+            # Todo en streaming: las filas pasan de la lectura al insert de a bloques,
+            # sin juntarlas en una lista
+            personas = islice(_con_latido(leer_filas(), job, intervalo_latido), ya_procesadas, None)
+            personas = descartar_rechazadas(personas)
+            personas = _filtrar_duplicados(personas, indice, job.accion_duplicados, resumen)
+            insertadas, errores_insercion = storage.importar_personas(
+                job.lista_id, personas, chunk_size=chunk_size, on_progress=progreso
+            )
+        # Duplicados después del último bloque (o todas las filas, si ninguna se insertó)
+        progreso(insertadas, errores_insercion)
+
+        job.estado = 'completado'
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error en trabajo de importación {job_id}: {e}")
+        job.estado = 'error'
+        job.mensaje = str(e)
+    finally:
+        job.fecha_fin = datetime.utcnow()
+        db.session.commit()
+
+    # El archivo ya no hace falta
+    try:
+        os.remove(job.ruta_archivo)
+    except OSError:
+        pass
+
+
+def _lanzar(app, job_id: str, background: bool):
+    def _run():
+        with app.app_context():
+            ejecutar_importacion(
+                job_id,
+                chunk_size=app.config.get('IMPORT_CHUNK_SIZE', 500),
+                stale_seconds=app.config.get('IMPORT_JOB_STALE_SECONDS', IMPORT_JOB_STALE_SECONDS),
+                workers=app.config.get('IMPORT_EXTRACT_WORKERS'),
+                engine=app.config.get('IMPORT_ENGINE', 'python')
+            )
+
+    if background:
+        get_executor('importacion', app.config.get('IMPORT_MAX_WORKERS', 2)).submit(_run)
+    else:
+        _run()
+
+
+def encolar_importacion(app, lista_id: str, archivo, usuario_id: str = None, background: bool = True,
+                        accion_duplicados: str = 'omitir') -> ImportJob:
+    """Guardar el upload, registrar el trabajo y encolarlo. Retorna el ImportJob"""
+    job_id = str(uuid.uuid4())
+    # El nombre en disco es el id del trabajo (el nombre original solo se usa para detectar el tipo)
+    ruta = os.path.join(_carpeta_uploads(app), job_id)
+    archivo.save(ruta)
+
+    job = ImportJob(id=job_id, lista_id=lista_id, usuario_id=usuario_id,
+                    filename=archivo.filename, ruta_archivo=ruta, accion_duplicados=accion_duplicados)
+    db.session.add(job)
+    db.session.commit()
+
+    _lanzar(app, job.id, background)
+    return job
+
+
+def reanudar_importaciones(app, background: bool = True) -> int:
+    """
+    Encolar los trabajos pendientes o abandonados (p.ej. tras un reinicio).
+    Lo llama el proceso web después de las migraciones (run.py) o el comando
+    `flask reanudar-importaciones` (background=False); el UPDATE condicional de
+    reclamar evita que dos workers procesen el mismo trabajo.
+    Requiere app context.
+    """
+    ids = ids_disponibles(ImportJob, app.config.get('IMPORT_JOB_STALE_SECONDS', IMPORT_JOB_STALE_SECONDS))
+    for job_id in ids:
+        _lanzar(app, job_id, background=background)
+    return len(ids)
+
+
+def get_importacion(job_id: str) -> Optional[ImportJob]:
+    return db.session.get(ImportJob, job_id)
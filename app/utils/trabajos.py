@@ -0,0 +1,56 @@
+"""
+Piezas comunes de los trabajos en segundo plano guardados en la BD
+(ImportJob, GeocodingJob, DeteccionDuplicados).
+Cada modelo tiene `id`, `estado` ('pendiente', 'en_proceso', ...) y
+`fecha_actualizacion`, que hace de latido mientras el trabajo está en proceso.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy import and_, or_
+
+from app.models import db
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(nombre: str, max_workers: int = 1) -> ThreadPoolExecutor:
+    """Pool de hilos del tipo de trabajo `nombre`, creado la primera vez que se pide"""
+    with _executors_lock:
+        if nombre not in _executors:
+            _executors[nombre] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=nombre)
+        return _executors[nombre]
+
+
+def _disponibles(modelo, stale_seconds: int, ahora: datetime):
+    # Pendientes, o en proceso pero sin latido reciente (su worker murió)
+    limite = ahora - timedelta(seconds=stale_seconds)
+    return or_(
+        modelo.estado == 'pendiente',
+        and_(modelo.estado == 'en_proceso', modelo.fecha_actualizacion < limite)
+    )
+
+
+def reclamar(modelo, job_id: str, stale_seconds: int) -> bool:
+    """
+    Marcar el trabajo como 'en_proceso' con un UPDATE condicional, para que solo
+    un worker lo tome. Hace commit.
+    """
+    ahora = datetime.utcnow()
+    tomado = modelo.query.filter(
+        modelo.id == job_id,
+        _disponibles(modelo, stale_seconds, ahora)
+    ).update({'estado': 'en_proceso', 'fecha_actualizacion': ahora}, synchronize_session=False)
+    db.session.commit()
+    return tomado == 1
+
+
+def ids_disponibles(modelo, stale_seconds: int) -> List[str]:
+    """Ids de los trabajos pendientes o abandonados (p.ej. tras un reinicio)"""
+    return [job_id for (job_id,) in db.session.query(modelo.id).filter(
+        _disponibles(modelo, stale_seconds, datetime.utcnow())
+    )]
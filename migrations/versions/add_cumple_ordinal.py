@@ -0,0 +1,49 @@
+"""Add cumple_ordinal to tarjetas for upcoming-birthday range scans
+
+Revision ID: add_cumple_ordinal
+Revises: add_lookup_indexes
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_cumple_ordinal'
+down_revision = 'add_lookup_indexes'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    columns = [col['name'] for col in inspector.get_columns('tarjetas')]
+    
+    if 'cumple_ordinal' not in columns:
+        with op.batch_alter_table('tarjetas', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('cumple_ordinal', sa.Integer(), nullable=True))
+    
+    # Backfill (mes*100 + día) de forma portable entre SQLite y PostgreSQL
+    tarjetas = sa.table('tarjetas',
+        sa.column('id', sa.String),
+        sa.column('fecha_nacimiento', sa.Date),
+        sa.column('cumple_ordinal', sa.Integer)
+    )
+    filas = conn.execute(
+        sa.select(tarjetas.c.id, tarjetas.c.fecha_nacimiento).where(tarjetas.c.fecha_nacimiento != None)
+    ).fetchall()
+    if filas:
+        conn.execute(
+            tarjetas.update().where(tarjetas.c.id == sa.bindparam('b_id')).values(cumple_ordinal=sa.bindparam('b_ordinal')),
+            [{'b_id': f.id, 'b_ordinal': f.fecha_nacimiento.month * 100 + f.fecha_nacimiento.day} for f in filas]
+        )
+    
+    indexes = [ix['name'] for ix in inspector.get_indexes('tarjetas')]
+    if 'ix_tarjetas_cumple_ordinal' not in indexes:
+        op.create_index('ix_tarjetas_cumple_ordinal', 'tarjetas', ['cumple_ordinal'])
+
+
+def downgrade():
+    op.drop_index('ix_tarjetas_cumple_ordinal', table_name='tarjetas')
+    with op.batch_alter_table('tarjetas', schema=None) as batch_op:
+        batch_op.drop_column('cumple_ordinal')
@@ -0,0 +1,43 @@
+"""Add deteccion_duplicados table for batch duplicate detection
+
+Revision ID: add_deteccion_duplicados
+Revises: add_import_duplicados
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_deteccion_duplicados'
+down_revision = 'add_import_duplicados'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Create table cautiously (db.create_all may have created it already)
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    
+    if 'deteccion_duplicados' not in inspector.get_table_names():
+        op.create_table(
+            'deteccion_duplicados',
+            sa.Column('id', sa.String(length=36), primary_key=True),
+            sa.Column('usuario_id', sa.String(length=36), sa.ForeignKey('usuarios.id'), nullable=True),
+            sa.Column('tablero_id', sa.String(length=36), sa.ForeignKey('tableros.id', ondelete='CASCADE'), nullable=True),
+            sa.Column('estado', sa.String(length=20), nullable=False, server_default='pendiente'),
+            sa.Column('tarjetas', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('bloques', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('comparaciones', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('total_pares', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('pares', sa.Text(), nullable=True),
+            sa.Column('mensaje', sa.Text(), nullable=True),
+            sa.Column('fecha_creacion', sa.DateTime(), nullable=True),
+            sa.Column('fecha_fin', sa.DateTime(), nullable=True),
+        )
+        op.create_index('ix_deteccion_duplicados_estado', 'deteccion_duplicados', ['estado'])
+
+
+def downgrade():
+    op.drop_index('ix_deteccion_duplicados_estado', table_name='deteccion_duplicados')
+    op.drop_table('deteccion_duplicados')
@@ -0,0 +1,33 @@
+"""Add heartbeat column to deteccion_duplicados
+
+Revision ID: add_deteccion_latido
+Revises: add_geocoding_jobs
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_deteccion_latido'
+down_revision = 'add_geocoding_jobs'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    columns = [col['name'] for col in inspector.get_columns('deteccion_duplicados')]
+    
+    with op.batch_alter_table('deteccion_duplicados', schema=None) as batch_op:
+        if 'fecha_actualizacion' not in columns:
+            batch_op.add_column(sa.Column('fecha_actualizacion', sa.DateTime(), nullable=True))
+    
+    # Detecciones anteriores: sin latido propio, tomar la fecha de creación para que
+    # las que quedaron colgadas en 'en_proceso' se puedan retomar
+    op.execute("UPDATE deteccion_duplicados SET fecha_actualizacion = fecha_creacion WHERE fecha_actualizacion IS NULL")
+
+
+def downgrade():
+    with op.batch_alter_table('deteccion_duplicados', schema=None) as batch_op:
+        batch_op.drop_column('fecha_actualizacion')
@@ -0,0 +1,39 @@
+"""Add geocode_cache table
+
+Revision ID: add_geocode_cache
+Revises: add_tarjeta_fields
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_geocode_cache'
+down_revision = 'add_tarjeta_fields'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Create geocode cache table cautiously (db.create_all may have created it already)
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    
+    if 'geocode_cache' not in inspector.get_table_names():
+        op.create_table(
+            'geocode_cache',
+            sa.Column('direccion_normalizada', sa.String(length=300), primary_key=True),
+            sa.Column('direccion', sa.String(length=300), nullable=True),
+            sa.Column('latitud', sa.Float(), nullable=True),
+            sa.Column('longitud', sa.Float(), nullable=True),
+            sa.Column('hits', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('misses', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('fecha_creacion', sa.DateTime(), nullable=True),
+            sa.Column('fecha_actualizacion', sa.DateTime(), nullable=True),
+        )
+        op.create_index('ix_geocode_cache_fecha_actualizacion', 'geocode_cache', ['fecha_actualizacion'])
+
+
+def downgrade():
+    op.drop_index('ix_geocode_cache_fecha_actualizacion', table_name='geocode_cache')
+    op.drop_table('geocode_cache')
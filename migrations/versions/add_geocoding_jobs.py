@@ -0,0 +1,45 @@
+"""Add geocoding_jobs table for persistent batch geocoding
+
+Revision ID: add_geocoding_jobs
+Revises: add_import_avisos
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_geocoding_jobs'
+down_revision = 'add_import_avisos'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Create table cautiously (db.create_all may have created it already)
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    
+    if 'geocoding_jobs' not in inspector.get_table_names():
+        op.create_table(
+            'geocoding_jobs',
+            sa.Column('id', sa.String(length=36), primary_key=True),
+            sa.Column('tablero_id', sa.String(length=36), sa.ForeignKey('tableros.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('usuario_id', sa.String(length=36), sa.ForeignKey('usuarios.id'), nullable=True),
+            sa.Column('estado', sa.String(length=20), nullable=False, server_default='pendiente'),
+            sa.Column('total', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('procesadas', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('geocodificadas', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('desde_cache', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('fallidas', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('fecha_creacion', sa.DateTime(), nullable=True),
+            sa.Column('fecha_actualizacion', sa.DateTime(), nullable=True),
+            sa.Column('fecha_inicio', sa.DateTime(), nullable=True),
+            sa.Column('fecha_fin', sa.DateTime(), nullable=True),
+        )
+        op.create_index('ix_geocoding_jobs_estado', 'geocoding_jobs', ['estado'])
+
+
+def downgrade():
+    op.drop_index('ix_geocoding_jobs_estado', table_name='geocoding_jobs')
+    op.drop_table('geocoding_jobs')
@@ -0,0 +1,32 @@
+"""Add flagged-duplicate counter and warnings to import_jobs
+
+Revision ID: add_import_avisos
+Revises: add_deteccion_duplicados
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_import_avisos'
+down_revision = 'add_deteccion_duplicados'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    columns = [col['name'] for col in inspector.get_columns('import_jobs')]
+    
+    with op.batch_alter_table('import_jobs', schema=None) as batch_op:
+        if 'marcadas' not in columns:
+            batch_op.add_column(sa.Column('marcadas', sa.Integer(), nullable=False, server_default='0'))
+        if 'avisos' not in columns:
+            batch_op.add_column(sa.Column('avisos', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('import_jobs', schema=None) as batch_op:
+        batch_op.drop_column('avisos')
+        batch_op.drop_column('marcadas')
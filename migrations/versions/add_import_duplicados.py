@@ -0,0 +1,32 @@
+"""Add duplicate-handling columns to import_jobs
+
+Revision ID: add_import_duplicados
+Revises: add_import_jobs
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_import_duplicados'
+down_revision = 'add_import_jobs'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    columns = [col['name'] for col in inspector.get_columns('import_jobs')]
+    
+    with op.batch_alter_table('import_jobs', schema=None) as batch_op:
+        if 'accion_duplicados' not in columns:
+            batch_op.add_column(sa.Column('accion_duplicados', sa.String(length=20), nullable=False, server_default='omitir'))
+        if 'duplicados' not in columns:
+            batch_op.add_column(sa.Column('duplicados', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('import_jobs', schema=None) as batch_op:
+        batch_op.drop_column('duplicados')
+        batch_op.drop_column('accion_duplicados')
@@ -0,0 +1,48 @@
+"""Add import_jobs table for background imports
+
+Revision ID: add_import_jobs
+Revises: add_cumple_ordinal
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_import_jobs'
+down_revision = 'add_cumple_ordinal'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Create import jobs table cautiously (db.create_all may have created it already)
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    
+    if 'import_jobs' not in inspector.get_table_names():
+        op.create_table(
+            'import_jobs',
+            sa.Column('id', sa.String(length=36), primary_key=True),
+            sa.Column('lista_id', sa.String(length=36), sa.ForeignKey('listas.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('usuario_id', sa.String(length=36), sa.ForeignKey('usuarios.id'), nullable=True),
+            sa.Column('filename', sa.String(length=255), nullable=False),
+            sa.Column('ruta_archivo', sa.String(length=500), nullable=False),
+            sa.Column('estado', sa.String(length=20), nullable=False, server_default='pendiente'),
+            sa.Column('filas_leidas', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('procesadas', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('insertadas', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('fallidas', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('total_errores', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('errores', sa.Text(), nullable=True),
+            sa.Column('columnas_faltantes', sa.Text(), nullable=True),
+            sa.Column('mensaje', sa.Text(), nullable=True),
+            sa.Column('fecha_creacion', sa.DateTime(), nullable=True),
+            sa.Column('fecha_actualizacion', sa.DateTime(), nullable=True),
+            sa.Column('fecha_fin', sa.DateTime(), nullable=True),
+        )
+        op.create_index('ix_import_jobs_estado', 'import_jobs', ['estado'])
+
+
+def downgrade():
+    op.drop_index('ix_import_jobs_estado', table_name='import_jobs')
+    op.drop_table('import_jobs')
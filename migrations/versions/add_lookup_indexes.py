@@ -0,0 +1,41 @@
+"""Add indexes for hot foreign keys and lookup columns
+
+Revision ID: add_lookup_indexes
+Revises: add_uncoded_index
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_lookup_indexes'
+down_revision = 'add_uncoded_index'
+branch_labels = None
+depends_on = None
+
+# (nombre, tabla, columnas)
+INDEXES = [
+    ('ix_listas_tablero_id', 'listas', ['tablero_id']),
+    ('ix_tableros_creador_id', 'tableros', ['creador_id']),
+    ('ix_tableros_fecha_creacion', 'tableros', ['fecha_creacion']),
+    ('ix_tarjetas_email', 'tarjetas', ['email']),
+    ('ix_tarjetas_fecha_nacimiento', 'tarjetas', ['fecha_nacimiento']),
+    ('ix_tarjetas_fecha_creacion', 'tarjetas', ['fecha_creacion']),
+    ('ix_usuarios_stripe_customer_id', 'usuarios', ['stripe_customer_id']),
+]
+
+def upgrade():
+    # Create indexes cautiously (db.create_all may have created them already)
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    
+    for name, table, columns in INDEXES:
+        existing = [ix['name'] for ix in inspector.get_indexes(table)]
+        if name not in existing:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,27 @@
+"""Add composite index for uncoded people lookup
+
+Revision ID: add_uncoded_index
+Revises: add_geocode_cache
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_uncoded_index'
+down_revision = 'add_geocode_cache'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    indexes = [ix['name'] for ix in inspector.get_indexes('tarjetas')]
+    
+    if 'ix_tarjetas_lista_coords' not in indexes:
+        op.create_index('ix_tarjetas_lista_coords', 'tarjetas', ['lista_id', 'latitud', 'longitud'])
+
+
+def downgrade():
+    op.drop_index('ix_tarjetas_lista_coords', table_name='tarjetas')
@@ -27,6 +27,25 @@ try:
         except Exception as e:
             print(f"❌ Automatic migration failed: {e}", file=sys.stderr, flush=True)
             # We don't exit here, hoping the app might still work or shows the error later
+        
+        # Retomar importaciones, geocodificaciones y detecciones de duplicados pendientes
+        # o interrumpidas por un reinicio (solo el proceso web, ya con el esquema migrado)
+        if app.config.get('IMPORT_RESUME_ON_START'):
+            try:
+                from app.utils.importacion import reanudar_importaciones
+                reanudar_importaciones(app)
+            except Exception as e:
+                print(f"❌ Error retomando importaciones: {e}", file=sys.stderr, flush=True)
+            try:
+                from app.utils.geocoding import reanudar_geocodificaciones
+                reanudar_geocodificaciones(app)
+            except Exception as e:
+                print(f"❌ Error retomando geocodificaciones: {e}", file=sys.stderr, flush=True)
+            try:
+                from app.utils.duplicados import reanudar_detecciones
+                reanudar_detecciones(app)
+            except Exception as e:
+                print(f"❌ Error retomando detecciones de duplicados: {e}", file=sys.stderr, flush=True)
             
     print("App created successfully!", file=sys.stderr, flush=True)
     
@@ -0,0 +1,44 @@
+"""
+Benchmark de parse_date sobre una columna de 100k fechas: probar los formatos en
+orden (comportamiento anterior) vs inferir el formato de la columna una vez.
+
+    python -m tests.benchmark_fechas
+"""
+import random
+import time
+from datetime import date, timedelta
+
+from app.utils.excel_handler import FORMATOS_FECHA, parse_date, inferir_formato_fecha
+
+N_FECHAS = 100_000
+
+
+def _columna(formato: str, n: int = N_FECHAS):
+    rng = random.Random(42)
+    inicio = date(1970, 1, 1)
+    return [(inicio + timedelta(days=rng.randrange(20000))).strftime(formato) for _ in range(n)]
+
+
+def _medir(funcion):
+    inicio = time.perf_counter()
+    resultado = funcion()
+    return time.perf_counter() - inicio, resultado
+
+
+def main():
+    print(f"{'formato':22s} {'en orden':>10s} {'inferido':>10s} {'mejora':>8s}")
+    for formato in FORMATOS_FECHA:
+        columna = _columna(formato)
+        t_orden, esperado = _medir(lambda: [parse_date(v) for v in columna])
+
+        def inferido():
+            fmt = inferir_formato_fecha(columna)
+            return [parse_date(v, fmt) for v in columna]
+        t_inferido, obtenido = _medir(inferido)
+
+        assert obtenido == esperado
+        print(f"{formato:22s} {t_orden:9.2f}s {t_inferido:9.2f}s {t_orden / t_inferido:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import unittest
+import random
+from app.utils.clustering import ClusteringManager, GridIndex
+
+
+class ClusteringTestCase(unittest.TestCase):
+    def setUp(self):
+        self.manager = ClusteringManager("")
+        random.seed(42)
+        centros = [(25.76, -80.19), (40.71, -74.0), (0.5, 179.99), (0.5, -179.99)]
+        self.personas = []
+        for i in range(400):
+            lat, lng = random.choice(centros)
+            lng = ((lng + random.gauss(0, 0.03) + 180) % 360) - 180
+            self.personas.append({'id': i, 'latitud': lat + random.gauss(0, 0.03), 'longitud': lng})
+
+    def test_grid_candidates_cover_all_neighbors(self):
+        max_distance = 2.0
+        index = GridIndex(self.personas, max_distance)
+        for seed in self.personas[:50]:
+            candidatos = set(index.candidates(seed['latitud'], seed['longitud']))
+            for idx, p in enumerate(self.personas):
+                dist = self.manager.calculate_distance(seed['latitud'], seed['longitud'], p['latitud'], p['longitud'])
+                if dist <= max_distance:
+                    self.assertIn(idx, candidatos)
+
+    def test_grid_remove(self):
+        index = GridIndex(self.personas, 2.0)
+        seed = self.personas[0]
+        index.remove(0)
+        self.assertFalse(index.contains(0))
+        self.assertNotIn(0, index.candidates(seed['latitud'], seed['longitud']))
+
+    def test_vectorized_distances_match_scalar(self):
+        lats = [p['latitud'] for p in self.personas[:30]]
+        lngs = [p['longitud'] for p in self.personas[:30]]
+        seed = self.personas[0]
+
+        desde_seed = self.manager.distances_from(seed['latitud'], seed['longitud'], lats, lngs)
+        matriz = self.manager.pairwise_distances(lats, lngs)
+        self.assertEqual(matriz.shape, (30, 30))
+
+        for j in range(30):
+            esperado = self.manager.calculate_distance(seed['latitud'], seed['longitud'], lats[j], lngs[j])
+            self.assertAlmostEqual(desde_seed[j], esperado, places=9)
+            self.assertAlmostEqual(matriz[0, j], esperado, places=9)
+
+    def test_create_clusters_respects_sizes(self):
+        clusters = self.manager.create_clusters(self.personas, 2.0, 3, 12)
+        miembros = [m['id'] for c in clusters for m in c['members']]
+        self.assertEqual(sorted(miembros), list(range(400)))
+        for c in clusters:
+            self.assertLessEqual(c['count'], 12)
+            self.assertEqual(c.get('is_outlier', False), c['count'] < 3)
+
+    def test_clusters_across_antimeridian(self):
+        personas = [
+            {'id': 'a', 'latitud': 0.5, 'longitud': 179.999},
+            {'id': 'b', 'latitud': 0.5, 'longitud': -179.999},
+        ]
+        clusters = self.manager.create_clusters(personas, 1.0, 2, 12)
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(clusters[0]['count'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db
+from app.models import Usuario, Tablero, Lista, Tarjeta, DeteccionDuplicados
+from app.utils.duplicados import (codigo_fonetico, geohash, usuario_email, detectar_duplicados,
+                                  ejecutar_deteccion, reanudar_detecciones)
+
+
+class DeteccionBloquesTestCase(unittest.TestCase):
+    def test_blocking_keys(self):
+        self.assertEqual(codigo_fonetico('vasquez'), codigo_fonetico('basques'))
+        self.assertEqual(codigo_fonetico('gonzalez'), codigo_fonetico('gonsales'))
+        self.assertNotEqual(codigo_fonetico('perez'), codigo_fonetico('lopez'))
+        self.assertEqual(usuario_email('Juan.Perez+iglesia@gmail.com'), 'juanperez')
+        self.assertEqual(geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+
+    def test_scored_pairs_within_blocks(self):
+        personas = [
+            {'id': 'a', 'nombre': 'Juan', 'apellido': 'Vásquez', 'telefono': '555-010-1234', 'direccion': 'Calle 1'},
+            {'id': 'b', 'nombre': 'Juan', 'apellido': 'Basques', 'telefono': '', 'direccion': 'calle 1'},
+            # Mismo teléfono y dirección, otra persona (cónyuge)
+            {'id': 'c', 'nombre': 'María', 'apellido': 'López', 'telefono': '5550101234', 'direccion': 'Calle 1'},
+            # Mismo usuario de email con otro dominio
+            {'id': 'd', 'nombre': 'Ana Ruiz', 'email': 'ana.ruiz@gmail.com'},
+            {'id': 'e', 'nombre': 'Ana Ruíz', 'email': 'anaruiz@hotmail.com'},
+            # Sin ninguna clave en común con el resto
+            {'id': 'f', 'nombre': 'Pedro Gómez', 'latitud': 10.0, 'longitud': 10.0},
+        ]
+        pares, estadisticas = detectar_duplicados(personas)
+        encontrados = {(par['tarjeta_a'], par['tarjeta_b']) for par in pares}
+        self.assertIn(('a', 'b'), encontrados)
+        self.assertNotIn(('a', 'c'), encontrados)
+        self.assertEqual(estadisticas['tarjetas'], 6)
+        # a-b (nombre), a-c (teléfono), d-e (email): 3 comparaciones en vez de 15
+        self.assertEqual(estadisticas['comparaciones'], 3)
+        par = next(p for p in pares if p['tarjeta_a'] == 'a')
+        self.assertIn('direccion', par['motivos'])
+
+    def test_oversized_blocks_are_skipped(self):
+        # Apellidos de una letra con distinto código fonético: solo comparten el teléfono
+        personas = [{'id': letra, 'nombre': f'Persona {letra}', 'telefono': '5550000000'} for letra in 'ABDFGJLMNPRT']
+        _, estadisticas = detectar_duplicados(personas, max_tamano_bloque=10)
+        self.assertEqual(estadisticas['bloques_descartados'], 1)
+        self.assertEqual(estadisticas['comparaciones'], 0)
+
+
+class DeteccionJobTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+            user = Usuario(username='dupuser', email='dup@example.com')
+            user.set_password('password')
+            db.session.add(user)
+            db.session.commit()
+            self.user_id = user.id
+
+            tableros = [Tablero(nombre=f"Tablero {i}", creador_id=user.id) for i in range(2)]
+            db.session.add_all(tableros)
+            db.session.commit()
+            self.tablero_id = tableros[0].id
+            for tablero in tableros:
+                lista = Lista(nombre="Miembros", tablero_id=tablero.id)
+                db.session.add(lista)
+                db.session.flush()
+                db.session.add(Tarjeta(nombre='José', apellido='Hernández', email='jose@example.com', lista_id=lista.id))
+            db.session.commit()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def login(self):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = self.user_id
+            sess['username'] = 'dupuser'
+
+    def test_job_across_all_cards(self):
+        self.login()
+        response = self.client.post('/tableros/api/duplicados', json={})
+        self.assertEqual(response.status_code, 202)
+
+        deteccion = self.client.get(response.json['status_url']).json['deteccion']
+        self.assertEqual(deteccion['estado'], 'completado')
+        self.assertEqual(deteccion['tarjetas'], 2)
+        self.assertEqual(deteccion['total_pares'], 1)
+        self.assertEqual(deteccion['pares'][0]['score'], 1.0)
+        self.assertEqual(sorted(deteccion['pares'][0]['motivos']), ['email', 'nombre'])
+
+    def test_job_limited_to_board(self):
+        self.login()
+        response = self.client.post('/tableros/api/duplicados', json={'tablero_id': self.tablero_id})
+        deteccion = self.client.get(response.json['status_url']).json['deteccion']
+        self.assertEqual((deteccion['tarjetas'], deteccion['total_pares']), (1, 0))
+
+        response = self.client.post('/tableros/api/duplicados', json={'tablero_id': 'no-existe'})
+        self.assertEqual(response.status_code, 404)
+
+    def _deteccion(self, latido):
+        job = DeteccionDuplicados(usuario_id=self.user_id, estado='en_proceso', fecha_actualizacion=latido)
+        db.session.add(job)
+        db.session.commit()
+        return job.id
+
+    def test_abandoned_job_is_resumed(self):
+        with self.app.app_context():
+            viva = self._deteccion(datetime.utcnow())
+            colgada = self._deteccion(datetime.utcnow() - timedelta(hours=1))
+
+            self.assertEqual(reanudar_detecciones(self.app, background=False), 1)
+            db.session.expire_all()
+            self.assertEqual(db.session.get(DeteccionDuplicados, colgada).estado, 'completado')
+            self.assertEqual(db.session.get(DeteccionDuplicados, colgada).total_pares, 1)
+            # Otro worker la tiene: no se toma dos veces
+            ejecutar_deteccion(viva)
+            self.assertEqual(db.session.get(DeteccionDuplicados, viva).estado, 'en_proceso')
+
+    def test_heartbeat_while_comparing(self):
+        from unittest import mock
+        with self.app.app_context():
+            job_id = self._deteccion(datetime.utcnow() - timedelta(hours=1))
+            latidos = []
+            original = detectar_duplicados
+
+            def registrar(*args, latido, **kwargs):
+                # intervalo 0: cada bloque renueva el latido en la BD
+                def contar():
+                    latido()
+                    latidos.append(db.session.get(DeteccionDuplicados, job_id).fecha_actualizacion)
+                return original(*args, latido=contar, **kwargs)
+
+            with mock.patch('app.utils.duplicados.detectar_duplicados', side_effect=registrar):
+                ejecutar_deteccion(job_id, stale_seconds=0)
+            self.assertGreater(len(latidos), 1)
+            self.assertEqual(latidos, sorted(latidos))
+            self.assertEqual(db.session.get(DeteccionDuplicados, job_id).estado, 'completado')
+
+if __name__ == '__main__':
+    unittest.main()
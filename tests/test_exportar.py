@@ -0,0 +1,127 @@
+import unittest
+import csv
+import io
+import json
+from datetime import date
+from app import create_app, db
+from app.models import Usuario, Tablero, Lista, Tarjeta
+
+
+class ExportarTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+            user = Usuario(username='exportuser', email='export@example.com')
+            user.set_password('password')
+            db.session.add(user)
+            db.session.commit()
+            self.user_id = user.id
+
+            tablero = Tablero(nombre="Célula Norte", creador_id=user.id)
+            vacio = Tablero(nombre="Vacío", creador_id=user.id)
+            db.session.add_all([tablero, vacio])
+            db.session.commit()
+            self.tablero_id = tablero.id
+            self.vacio_id = vacio.id
+
+            for i in range(3):
+                lista = Lista(nombre=f"Lista {i}", tablero_id=tablero.id, orden=i)
+                db.session.add(lista)
+                db.session.flush()
+                for j in range(50):
+                    db.session.add(Tarjeta(
+                        nombre=f"P{i}-{j}", apellido="Pérez" if j % 2 else None, lista_id=lista.id, orden=j,
+                        telefono="555-0101", fecha_matrimonio=date(2010, 5, 1) if j == 0 else None
+                    ))
+            db.session.commit()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def login(self):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = self.user_id
+            sess['username'] = 'exportuser'
+
+    def test_csv_streamed(self):
+        self.login()
+        response = self.client.get(f'/tableros/exportar_datos/{self.tablero_id}/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertIn("filename*=UTF-8''C%C3%A9lula%20Norte_datos_", response.headers['Content-Disposition'])
+
+        filas = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual(len(filas), 150)
+        self.assertEqual(filas[0]['Lista'], 'Lista 0')
+        self.assertEqual(filas[0]['Nombre'], 'P0-0')
+        self.assertEqual(filas[0]['Fecha Matrimonio'], '2010-05-01')
+        self.assertEqual(filas[1]['Nombre'], 'P0-1 Pérez')
+        self.assertEqual(filas[-1]['Lista'], 'Lista 2')
+        self.assertEqual(filas[0]['Responsable'], '')
+
+    def test_json_document(self):
+        self.login()
+        response = self.client.get(f'/tableros/exportar_datos/{self.tablero_id}/json')
+        self.assertTrue(response.is_streamed)
+        data = json.loads(response.get_data(as_text=True))
+        self.assertEqual(data['tablero'], 'Célula Norte')
+        self.assertEqual(data['total_personas'], 150)
+        self.assertEqual(len(data['datos']), 150)
+        self.assertEqual(data['datos'][0]['Fecha Matrimonio'], '2010-05-01')
+
+    def test_ndjson_lines(self):
+        self.login()
+        response = self.client.get(f'/tableros/exportar_datos/{self.tablero_id}/ndjson')
+        lineas = response.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lineas), 150)
+        self.assertEqual(json.loads(lineas[50])['Lista'], 'Lista 1')
+
+    def test_excel_write_only(self):
+        import openpyxl
+        self.login()
+        response = self.client.get(f'/tableros/exportar_datos/{self.tablero_id}/excel')
+        self.assertEqual(response.status_code, 200)
+
+        sheet = openpyxl.load_workbook(io.BytesIO(response.data)).active
+        self.assertEqual(sheet.title, 'Datos')
+        self.assertEqual(sheet.max_row, 151)
+        self.assertEqual(sheet['A1'].value, 'Lista')
+        self.assertEqual(sheet['B3'].value, 'P0-1 Pérez')
+        # Ancho: encabezado 'Fecha Matrimonio' (16) + 2
+        self.assertEqual(sheet.column_dimensions['M'].width, 18)
+
+    def test_column_widths_from_sample(self):
+        from app.utils.excel_export import escribir_xlsx
+        import openpyxl
+        filas = ([str(i), 'x' * (80 if i == 500 else 5)] for i in range(1000))
+        sheet = openpyxl.load_workbook(escribir_xlsx(['id', 'texto'], filas, filas_muestra=100)).active
+        self.assertEqual(sheet.max_row, 1001)
+        # La fila 500 queda fuera de la muestra
+        self.assertEqual(sheet.column_dimensions['B'].width, 7)
+
+    def test_plantilla_excel(self):
+        import openpyxl
+        self.login()
+        response = self.client.get('/tableros/descargar_plantilla')
+        self.assertEqual(response.status_code, 200)
+        sheet = openpyxl.load_workbook(io.BytesIO(response.data)).active
+        self.assertEqual(sheet.title, 'Plantilla')
+        self.assertEqual(sheet.max_row, 6)
+        self.assertEqual(sheet['L2'].value, 'maria.perez@example.com')
+
+    def test_empty_board_redirects(self):
+        self.login()
+        response = self.client.get(f'/tableros/exportar_datos/{self.vacio_id}/csv')
+        self.assertEqual(response.status_code, 302)
+
+
+if __name__ == '__main__':
+    unittest.main()
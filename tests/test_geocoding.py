@@ -0,0 +1,248 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+from app import create_app, db
+from app.models import GeocodeCache, GeocodingJob, Usuario, Tablero, Lista, Tarjeta
+from app.utils.clustering import ClusteringManager, normalizar_direccion
+from app.utils.geocoding import OfflineGeocoder, TokenBucket, reanudar_geocodificaciones
+
+
+class GeocodingCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.manager = ClusteringManager("")
+        self.manager.gmaps = MagicMock()
+        self.manager.gmaps.geocode.return_value = [{'geometry': {'location': {'lat': 25.7, 'lng': -80.2}}}]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_normalizar_direccion(self):
+        self.assertEqual(
+            normalizar_direccion("  123 Main Street,  Apt. 4 "),
+            normalizar_direccion("123 main st apartment 4")
+        )
+        self.assertEqual(normalizar_direccion("Avenida Bolívar #45"), "av bolivar 45")
+        self.assertEqual(normalizar_direccion("Av. Bolivar 45"), "av bolivar 45")
+
+    def test_cache_hit_skips_remote_call(self):
+        self.assertEqual(self.manager.geocode_address("123 Main Street"), (25.7, -80.2))
+        self.assertEqual(self.manager.geocode_address("123 MAIN ST."), (25.7, -80.2))
+        self.assertEqual(self.manager.gmaps.geocode.call_count, 1)
+
+        stats = GeocodeCache.stats()
+        self.assertEqual(stats, {'entradas': 1, 'hits': 1, 'misses': 1})
+
+    def test_not_found_is_cached(self):
+        self.manager.gmaps.geocode.return_value = []
+        self.assertEqual(self.manager.geocode_address("Nowhere 1"), (None, None))
+        self.assertEqual(self.manager.geocode_address("nowhere 1"), (None, None))
+        self.assertEqual(self.manager.gmaps.geocode.call_count, 1)
+
+    def test_expired_entry_is_refreshed(self):
+        self.manager.geocode_address("123 Main Street")
+        entrada = db.session.get(GeocodeCache, normalizar_direccion("123 Main Street"))
+        entrada.fecha_actualizacion = datetime.utcnow() - timedelta(days=400)
+        db.session.commit()
+
+        self.manager.geocode_address("123 Main Street")
+        self.assertEqual(self.manager.gmaps.geocode.call_count, 2)
+
+        self.assertEqual(GeocodeCache.purgar_expirados(30), 0)
+
+
+class GeocodingJobTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.geocoder = OfflineGeocoder({
+            '10 Oak Street': (25.70, -80.20),
+            '22 Pine Ave': (25.71, -80.21),
+        })
+        self.app.config['GEOCODER_BACKEND'] = self.geocoder
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+            user = Usuario(username='testuser', email='test@example.com')
+            user.set_password('password')
+            db.session.add(user)
+            db.session.commit()
+            self.user_id = user.id
+
+            tablero = Tablero(nombre="Geo Board", creador_id=user.id)
+            db.session.add(tablero)
+            db.session.flush()
+            lista = Lista(nombre="Inbox", tablero_id=tablero.id)
+            db.session.add(lista)
+            db.session.flush()
+            self.tablero_id = tablero.id
+
+            db.session.add_all([
+                Tarjeta(nombre="A", lista_id=lista.id, direccion="10 Oak Street"),
+                Tarjeta(nombre="B", lista_id=lista.id, direccion="10 OAK ST."),
+                Tarjeta(nombre="C", lista_id=lista.id, direccion="22 Pine Avenue", latitud=0, longitud=0),
+                Tarjeta(nombre="D", lista_id=lista.id, direccion="Unknown 1"),
+                Tarjeta(nombre="E", lista_id=lista.id, direccion="10 Oak Street", latitud=1.0, longitud=1.0),
+                Tarjeta(nombre="F", lista_id=lista.id, direccion="   "),
+            ])
+            db.session.commit()
+
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = self.user_id
+            sess['username'] = 'testuser'
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_batch_job_geocodes_uncoded_cards(self):
+        response = self.client.post('/tableros/api/geocoding/batch', json={'tablero_id': self.tablero_id})
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json['job_id']
+
+        progreso = self.client.get(f'/tableros/api/geocoding/batch/{job_id}').json['progreso']
+        self.assertEqual(progreso['estado'], 'completado')
+        self.assertEqual(progreso['total'], 4)
+        self.assertEqual(progreso['geocodificadas'], 3)
+        self.assertEqual(progreso['fallidas'], 1)
+        # Dos tarjetas comparten dirección normalizada: 3 llamadas para 4 tarjetas
+        self.assertEqual(self.geocoder.llamadas, 3)
+
+        with self.app.app_context():
+            b = Tarjeta.query.filter_by(nombre="B").first()
+            self.assertEqual((b.latitud, b.longitud), (25.70, -80.20))
+            e = Tarjeta.query.filter_by(nombre="E").first()
+            self.assertEqual((e.latitud, e.longitud), (1.0, 1.0))
+
+        # Segunda pasada: lo que falló sale de la caché, sin llamadas remotas
+        response = self.client.post('/tableros/api/geocoding/batch', json={'tablero_id': self.tablero_id})
+        self.assertEqual(response.json['progreso']['desde_cache'], 1)
+        self.assertEqual(self.geocoder.llamadas, 3)
+
+    def test_cache_written_in_batches(self):
+        from sqlalchemy import event
+        with self.app.app_context():
+            # Entrada vencida: se refresca con UPDATE, las demás se insertan
+            db.session.add(GeocodeCache(direccion_normalizada=normalizar_direccion("22 Pine Avenue"),
+                                        direccion="22 Pine Avenue", hits=0, misses=1,
+                                        fecha_actualizacion=datetime.utcnow() - timedelta(days=400)))
+            db.session.commit()
+            engine = db.engine
+
+        escrituras = []
+
+        def capturar(conn, cursor, statement, *args):
+            if 'geocode_cache' in statement and not statement.lstrip().upper().startswith('SELECT'):
+                escrituras.append(statement.split()[0].upper())
+
+        event.listen(engine, 'before_cursor_execute', capturar)
+        try:
+            self.client.post('/tableros/api/geocoding/batch', json={'tablero_id': self.tablero_id})
+        finally:
+            event.remove(engine, 'before_cursor_execute', capturar)
+
+        self.assertEqual(sorted(escrituras), ['INSERT', 'UPDATE'])
+        with self.app.app_context():
+            self.assertEqual(GeocodeCache.stats(), {'entradas': 3, 'hits': 0, 'misses': 4})
+            entrada = db.session.get(GeocodeCache, normalizar_direccion("22 Pine Avenue"))
+            self.assertEqual((entrada.latitud, entrada.misses), (25.71, 2))
+
+    def test_update_coords_bulk(self):
+        with self.app.app_context():
+            ids = {t.nombre: t.id for t in Tarjeta.query.all()}
+
+        response = self.client.post('/tableros/api/personas/update_coords_bulk', json={
+            'tablero_id': self.tablero_id,
+            'coords': [
+                {'id': ids['A'], 'lat': 1.5, 'lng': 2.5},
+                {'id': ids['D'], 'lat': '3.5', 'lng': '4.5'},
+                {'id': 'otra-tarjeta', 'lat': 1, 'lng': 1},
+                {'id': ids['B'], 'lat': 'x', 'lng': 1},
+            ]
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['updated'], 2)
+        self.assertEqual(len(response.json['rejected']), 2)
+
+        with self.app.app_context():
+            d = db.session.get(Tarjeta, ids['D'])
+            self.assertEqual((d.latitud, d.longitud), (3.5, 4.5))
+            self.assertIsNone(db.session.get(Tarjeta, ids['B']).latitud)
+
+    def test_get_uncoded_paginated(self):
+        response = self.client.post('/tableros/api/geocoding/get_uncoded',
+                                    json={'tablero_id': self.tablero_id, 'limit': 3})
+        primera = response.json
+        self.assertEqual(primera['total'], 4)
+        self.assertEqual(primera['count'], 3)
+        self.assertIsNotNone(primera['next_cursor'])
+
+        response = self.client.post('/tableros/api/geocoding/get_uncoded',
+                                    json={'tablero_id': self.tablero_id, 'limit': 3,
+                                          'cursor': primera['next_cursor']})
+        segunda = response.json
+        self.assertEqual(segunda['count'], 1)
+        self.assertIsNone(segunda['next_cursor'])
+        self.assertNotIn('total', segunda)
+
+        nombres = {p['nombre'] for p in primera['personas'] + segunda['personas']}
+        self.assertEqual(nombres, {'A', 'B', 'C', 'D'})
+
+    def test_unknown_job(self):
+        response = self.client.get('/tableros/api/geocoding/batch/no-existe')
+        self.assertEqual(response.status_code, 404)
+
+    def test_job_belongs_to_its_owner(self):
+        response = self.client.post('/tableros/api/geocoding/batch', json={'tablero_id': self.tablero_id})
+        job_id = response.json['job_id']
+
+        with self.app.app_context():
+            job = db.session.get(GeocodingJob, job_id)
+            self.assertEqual((job.usuario_id, job.estado), (self.user_id, 'completado'))
+            otro = Usuario(username='otro', email='otro@example.com')
+            otro.set_password('password')
+            db.session.add(otro)
+            db.session.commit()
+            otro_id = otro.id
+
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = otro_id
+        response = self.client.get(f'/tableros/api/geocoding/batch/{job_id}')
+        self.assertEqual(response.status_code, 404)
+
+    def test_interrupted_job_is_resumed(self):
+        with self.app.app_context():
+            job = GeocodingJob(tablero_id=self.tablero_id, usuario_id=self.user_id, estado='en_proceso',
+                               procesadas=2, fecha_actualizacion=datetime.utcnow() - timedelta(hours=1))
+            db.session.add(job)
+            db.session.commit()
+            job_id = job.id
+
+            self.assertEqual(reanudar_geocodificaciones(self.app, background=False), 1)
+            db.session.expire_all()
+            job = db.session.get(GeocodingJob, job_id)
+            self.assertEqual((job.estado, job.total, job.geocodificadas), ('completado', 4, 3))
+            self.assertEqual(reanudar_geocodificaciones(self.app, background=False), 0)
+
+    def test_token_bucket_limits_rate(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+        import time
+        inicio = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - inicio, 0.09)
+
+
+if __name__ == '__main__':
+    unittest.main()
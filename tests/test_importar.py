@@ -0,0 +1,480 @@
+import unittest
+import io
+import os
+import tempfile
+from datetime import datetime, timedelta
+import openpyxl
+from app import create_app, db
+from app.models import Usuario, Tablero, Lista, Tarjeta, ImportJob
+from app.utils.excel_handler import (iter_excel_rows, iter_csv_rows, process_import_file, CSV_SNIFF_BYTES,
+                                     mapear_columnas, _mapear_columnas_cache, _mejor_coincidencia,
+                                     iter_extraer_personas, extraer_personas_vectorizado,
+                                     parse_date, inferir_formato_fecha)
+
+
+def _xlsx(filas):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    for fila in filas:
+        sheet.append(fila)
+    output = io.BytesIO()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+class ExcelImportTestCase(unittest.TestCase):
+    def test_header_detected_after_title_rows(self):
+        archivo = _xlsx([
+            ['Registro de visitas'],
+            [],
+            ['Nombre', 'Dirección', 'Teléfono', 'Edad'],
+            ['Juan Pérez', 'Calle 1', '555-0101', 35],
+            [None, None, None, None],
+            ['Ana López', 'Calle 2', '555-0102', '=30+1'],
+        ])
+        errores = []
+        filas = list(iter_excel_rows(archivo, errores))
+        self.assertEqual(errores, [])
+        self.assertEqual([f['_row_num'] for f in filas], [4, 6])
+        self.assertEqual(filas[0]['Nombre'], 'Juan Pérez')
+        self.assertEqual(filas[0]['Edad'], 35)
+
+    def test_rows_are_lazy(self):
+        archivo = _xlsx([['Nombre', 'Dirección', 'Teléfono']] + [[f'P{i}', 'Calle', '555'] for i in range(1000)])
+        filas = iter_excel_rows(archivo, [])
+        self.assertEqual(next(filas)['Nombre'], 'P0')
+        filas.close()
+
+    def test_process_import_file_excel(self):
+        archivo = _xlsx([
+            ['Nombre', 'Dirección', 'Teléfono', 'Email', 'Estado Civil', 'Edad', 'Fecha Matrimonio'],
+            ['Juan Pérez', 'Calle 1', '555-0101', 'juan@example.com', 'Casado', 35, '2018-06-15'],
+            ['María', 'Calle 2', '555-0102', '', '', 'abc', ''],
+        ])
+        personas, errores, file_type, faltantes = process_import_file(archivo, 'personas.xlsx')
+        self.assertEqual(file_type, 'excel')
+        self.assertEqual(faltantes, [])
+        self.assertEqual(len(personas), 2)
+        self.assertEqual(personas[0]['apellido'], 'Pérez')
+        self.assertEqual(personas[0]['edad'], 35)
+        self.assertEqual(str(personas[0]['fecha_matrimonio']), '2018-06-15')
+        self.assertEqual(errores, ['Fila 3: Edad "abc" no es un número válido'])
+
+    def test_invalid_file_reports_error(self):
+        personas, errores, _, _ = process_import_file(io.BytesIO(b'no es un excel'), 'roto.xlsx')
+        self.assertEqual(personas, [])
+        self.assertTrue(errores[0].startswith('Error procesando Excel'))
+
+
+class CsvImportTestCase(unittest.TestCase):
+    def test_latin1_semicolon_with_title_row(self):
+        contenido = "Lista de la célula\nNombre;Dirección;Teléfono\nJosé Núñez;Calle 1;555\n\nAna;Calle 2;556\n"
+        archivo = io.BytesIO(contenido.encode('latin-1'))
+        errores = []
+        filas = list(iter_csv_rows(archivo, errores))
+        self.assertEqual(errores, [])
+        self.assertEqual([f['Nombre'] for f in filas], ['José Núñez', 'Ana'])
+        self.assertEqual(filas[0]['Dirección'], 'Calle 1')
+        self.assertEqual(filas[1]['_row_num'], 5)
+        # El archivo subido sigue abierto para quien lo llamó
+        self.assertFalse(archivo.closed)
+
+    def test_utf8_bom_and_multibyte_across_prefix(self):
+        relleno = 'á' * (CSV_SNIFF_BYTES // 2 - 10)
+        contenido = f"Nombre,Dirección,Teléfono\nJuan,Calle {relleno},555\nMaría Ñandú,Calle 2,556\n"
+        archivo = io.BytesIO(contenido.encode('utf-8-sig'))
+        errores = []
+        filas = list(iter_csv_rows(archivo, errores))
+        self.assertEqual(errores, [])
+        self.assertEqual(list(filas[0].keys())[0], 'Nombre')
+        self.assertEqual(filas[0]['Dirección'], f'Calle {relleno}')
+        self.assertEqual(filas[1]['Nombre'], 'María Ñandú')
+
+    def test_latin1_byte_after_prefix_is_not_replaced(self):
+        # Todo ASCII dentro del prefijo: se detecta UTF-8 y el primer acento llega después
+        relleno = ''.join(f"Persona {i},Calle {i},555\n" for i in range(CSV_SNIFF_BYTES // 20))
+        contenido = f"Nombre,Direccion,Telefono\n{relleno}José Núñez,Peñalolén 1,556\nAna,Calle 2,557\n"
+        archivo = io.BytesIO(contenido.encode('latin-1'))
+        errores = []
+        filas = list(iter_csv_rows(archivo, errores))
+        self.assertEqual(errores, [])
+        self.assertEqual(len(filas), CSV_SNIFF_BYTES // 20 + 2)
+        self.assertEqual(len({f['_row_num'] for f in filas}), len(filas))
+        self.assertEqual((filas[-2]['Nombre'], filas[-2]['Direccion']), ('José Núñez', 'Peñalolén 1'))
+        self.assertFalse(any('\ufffd' in f['Nombre'] for f in filas))
+
+    def test_invalid_utf8_after_utf8_prefix_is_reported(self):
+        relleno = ''.join(f"Persona {i},Calle {i},555\n" for i in range(CSV_SNIFF_BYTES // 20))
+        contenido = f"Nombre,Dirección,Teléfono\n{relleno}".encode('utf-8') + "José,Calle 1,556\n".encode('latin-1')
+        errores = []
+        filas = list(iter_csv_rows(io.BytesIO(contenido), errores))
+        self.assertFalse(any('\ufffd' in f['Nombre'] for f in filas))
+        self.assertEqual(len(errores), 1)
+        self.assertIn('no es UTF-8 válido', errores[0])
+
+    def test_single_line_rejected(self):
+        personas, errores, file_type, _ = process_import_file(io.BytesIO(b'Nombre,Telefono\n'), 'vacio.csv')
+        self.assertEqual(file_type, 'csv')
+        self.assertEqual(personas, [])
+        self.assertIn('El archivo debe tener al menos una fila de encabezados y una fila de datos', errores)
+
+    def test_process_import_file_csv(self):
+        contenido = "Nombre,Direccion,Telefono,Email,Estado Civil\nJuan Pérez,Calle 1,555,juan@example.com,Casado\n"
+        personas, errores, _, faltantes = process_import_file(io.BytesIO(contenido.encode('utf-8')), 'p.csv')
+        self.assertEqual(errores, [])
+        self.assertEqual(faltantes, [])
+        self.assertEqual(personas[0]['nombre'], 'Juan')
+        self.assertEqual(personas[0]['email'], 'juan@example.com')
+
+
+class MapeoColumnasTestCase(unittest.TestCase):
+    def test_exact_match_with_accents_and_priority(self):
+        mapeo = mapear_columnas(['Nombres', 'Apellidos', 'Dirección', 'Teléfono Cónyuge', 'Teléfono'])
+        self.assertEqual(mapeo['nombre'], 'Nombres')
+        self.assertEqual(mapeo['apellido'], 'Apellidos')
+        self.assertEqual(mapeo['direccion'], 'Dirección')
+        self.assertEqual(mapeo['telefono'], 'Teléfono')
+        self.assertEqual(mapeo['telefono_conyuge'], 'Teléfono Cónyuge')
+
+    def test_mapping_memoized_by_headers(self):
+        headers = ['Nombre', 'Direccion', 'Telefono', 'Columna Rara']
+        mapear_columnas(headers)
+        hits = _mapear_columnas_cache.cache_info().hits
+        mapeo = mapear_columnas(headers)
+        self.assertEqual(_mapear_columnas_cache.cache_info().hits, hits + 1)
+        # Se devuelve una copia: modificarla no altera la caché
+        mapeo['nombre'] = 'otro'
+        self.assertEqual(mapear_columnas(headers)['nombre'], 'Nombre')
+
+    def test_fuzzy_picks_best_score(self):
+        self.assertEqual(_mejor_coincidencia(['abcdefghij', 'xyz12345'], ['abcdefghxx', 'xyz1234']), 'xyz1234')
+        self.assertIsNone(_mejor_coincidencia(['telefono'], ['direccion']))
+
+    def test_fuzzy_skips_columns_taken_by_exact_matches(self):
+        mapeo = mapear_columnas(['name', 'phone', 'children', 'spouse', 'Telefno'])
+        self.assertEqual(mapeo['num_hijos'], 'children')
+        self.assertNotIn('edades_hijos', mapeo)
+        self.assertNotIn('edad_conyuge', mapeo)
+
+    def test_fuzzy_match_logged_on_every_call(self):
+        from contextlib import redirect_stdout
+        headers = ['Nombre', 'Telefno', 'Direccion']
+        for _ in range(2):
+            salida = io.StringIO()
+            with redirect_stdout(salida):
+                mapeo = mapear_columnas(headers)
+            self.assertEqual(mapeo['telefono'], 'Telefno')
+            self.assertIn("Coincidencia inteligente: 'Telefno' -> telefono", salida.getvalue())
+
+
+class ExtraccionParalelaTestCase(unittest.TestCase):
+    def test_process_pool_preserves_order_and_errors(self):
+        headers = ['Nombre', 'Teléfono', 'Edad', 'Fecha Matrimonio']
+        filas = [{'Nombre': '' if i == 150 else f'Persona {i}', 'Teléfono': str(i), 'Edad': 'x' if i % 50 == 7 else '30',
+                  'Fecha Matrimonio': '15/06/2018', '_row_num': i + 2} for i in range(300)]
+        mapeo = mapear_columnas(headers)
+
+        serial = list(iter_extraer_personas(filas, mapeo))
+        paralelo = list(iter_extraer_personas(iter(filas), mapeo, workers=2, chunk_size=40))
+        self.assertEqual(paralelo, serial)
+        self.assertEqual(paralelo[150], ({}, ['Fila 152: Nombre es obligatorio']))
+        self.assertEqual(paralelo[7][1], ['Fila 9: Edad "x" no es un número válido'])
+        self.assertEqual(paralelo[299][0]['apellido'], '299')
+
+
+class FormatoFechaTestCase(unittest.TestCase):
+    def test_infers_most_common_format(self):
+        valores = ['', None, '15/06/2018', '2018-06-15', '01/02/2003', '31/12/1999', 'no es fecha']
+        self.assertEqual(inferir_formato_fecha(valores), '%d/%m/%Y')
+        self.assertIsNone(inferir_formato_fecha(['', 'x', datetime(2020, 1, 1)]))
+
+    def test_falls_back_on_miss(self):
+        self.assertEqual(parse_date('15/06/2018', '%d/%m/%Y'), datetime(2018, 6, 15).date())
+        self.assertEqual(parse_date('2018-06-15', '%d/%m/%Y'), datetime(2018, 6, 15).date())
+        self.assertEqual(parse_date('2018-06-15 00:00:00', '%d/%m/%Y'), datetime(2018, 6, 15).date())
+        self.assertIsNone(parse_date('31/02/2018', '%d/%m/%Y'))
+
+    def test_extraction_uses_column_format(self):
+        headers = ['Nombre', 'Fecha Matrimonio']
+        filas = [{'Nombre': f'P{i}', 'Fecha Matrimonio': '2010-01-02' if i == 3 else '03/04/05', '_row_num': i + 2}
+                 for i in range(10)]
+        personas = [persona for persona, _ in iter_extraer_personas(filas, mapear_columnas(headers))]
+        self.assertEqual(personas[0]['fecha_matrimonio'], datetime(2005, 4, 3).date())
+        self.assertEqual(personas[3]['fecha_matrimonio'], datetime(2010, 1, 2).date())
+
+
+class VectorizadoTestCase(unittest.TestCase):
+    def test_same_output_as_row_by_row(self):
+        headers = ['Nombre', 'Apellido', 'Edad', 'Hijos', 'Cónyuge', 'Fecha Matrimonio', 'Estado Civil']
+        filas = [
+            {'Nombre': ' Juan Pérez ', 'Apellido': '', 'Edad': '30.7', 'Hijos': '', 'Cónyuge': 'Ana',
+             'Fecha Matrimonio': '15/06/2018', 'Estado Civil': ''},
+            {'Nombre': 'Luis', 'Apellido': 'Gómez', 'Edad': 'treinta', 'Hijos': 'x', 'Cónyuge': '',
+             'Fecha Matrimonio': '', 'Estado Civil': ''},
+            {'Nombre': '', 'Apellido': 'Sin nombre', 'Edad': '40', 'Hijos': '2', 'Cónyuge': '',
+             'Fecha Matrimonio': '', 'Estado Civil': ''},
+            {'Nombre': 'Marta', 'Apellido': None, 'Edad': 'inf', 'Hijos': 3, 'Cónyuge': '',
+             'Fecha Matrimonio': '2001-02-03', 'Estado Civil': 'Viuda'},
+        ]
+        for i, fila in enumerate(filas):
+            fila['_row_num'] = i + 2
+        mapeo = mapear_columnas(headers)
+
+        serial_personas, serial_errores = [], []
+        for persona, errores in iter_extraer_personas(filas, mapeo):
+            if persona:
+                serial_personas.append(persona)
+            serial_errores.extend(errores)
+
+        personas, errores = extraer_personas_vectorizado(filas, mapeo)
+        self.assertEqual(personas, serial_personas)
+        self.assertEqual(errores, serial_errores)
+        self.assertEqual(len(personas), 3)
+        self.assertEqual((personas[0]['nombre'], personas[0]['apellido'], personas[0]['edad']), ('Juan', 'Pérez', 30))
+        self.assertIs(type(personas[0]['edad']), int)
+        self.assertEqual(personas[0]['estado_civil'], 'Casado')
+        self.assertIsNone(personas[1]['edad'])
+        self.assertEqual(personas[1]['numero_hijos'], 0)
+
+    def test_process_import_file_pandas_engine(self):
+        contenido = 'Nombre,Telefono,Edad\nJuan Perez,555,30\nAna,556,x\n'.encode('utf-8')
+        personas, errores, file_type, _ = process_import_file(io.BytesIO(contenido), 'p.csv', engine='pandas')
+        self.assertEqual(file_type, 'csv')
+        self.assertEqual([p['nombre'] for p in personas], ['Juan', 'Ana'])
+        self.assertEqual(errores, ['Fila 3: Edad "x" no es un número válido'])
+
+
+class ImportJobTestCase(unittest.TestCase):
+    CSV = "Nombre,Direccion,Telefono\nJuan Pérez,Calle 1,555\nAna López,Calle 2,556\nLuis Gómez,Calle 3,557\n"
+
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.uploads = tempfile.TemporaryDirectory()
+        self.app.config['IMPORT_UPLOAD_FOLDER'] = self.uploads.name
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+            user = Usuario(username='importuser', email='import@example.com')
+            user.set_password('password')
+            db.session.add(user)
+            db.session.commit()
+            self.user_id = user.id
+
+            tablero = Tablero(nombre="Import Board", creador_id=user.id)
+            db.session.add(tablero)
+            db.session.commit()
+            lista = Lista(nombre="Nuevos", tablero_id=tablero.id)
+            db.session.add(lista)
+            db.session.commit()
+            self.lista_id = lista.id
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+        self.uploads.cleanup()
+
+    def login(self, user_id=None):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = user_id or self.user_id
+            sess['username'] = 'importuser'
+
+    def test_upload_returns_job_and_status(self):
+        self.login()
+        response = self.client.post(
+            f'/tableros/importar_excel/{self.lista_id}',
+            data={'archivo': (io.BytesIO(self.CSV.encode('utf-8')), 'personas.csv')},
+            content_type='multipart/form-data',
+            headers={'Accept': 'application/json'}
+        )
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json['job_id']
+
+        estado = self.client.get(response.json['status_url'])
+        progreso = estado.json['progreso']
+        self.assertEqual(progreso['estado'], 'completado')
+        self.assertEqual(progreso['filas_leidas'], 3)
+        self.assertEqual(progreso['insertadas'], 3)
+        self.assertEqual(progreso['fallidas'], 0)
+        self.assertEqual(os.listdir(self.uploads.name), [])
+
+        with self.app.app_context():
+            self.assertEqual(Tarjeta.query.filter_by(lista_id=self.lista_id).count(), 3)
+
+        # Otro usuario no ve el trabajo
+        with self.app.app_context():
+            otro = Usuario(username='otro', email='otro@example.com')
+            otro.set_password('password')
+            db.session.add(otro)
+            db.session.commit()
+            otro_id = otro.id
+        self.login(user_id=otro_id)
+        self.assertEqual(self.client.get(f'/tableros/api/importaciones/{job_id}').status_code, 404)
+
+    def test_form_post_redirects(self):
+        self.login()
+        response = self.client.post(
+            f'/tableros/importar_excel/{self.lista_id}',
+            data={'archivo': (io.BytesIO(self.CSV.encode('utf-8')), 'personas.csv')},
+            content_type='multipart/form-data'
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/tableros/', response.headers['Location'])
+
+    def _job_interrumpido(self, latido):
+        from app.utils.importacion import _carpeta_uploads
+        ruta = os.path.join(_carpeta_uploads(self.app), 'interrumpido')
+        with open(ruta, 'wb') as f:
+            f.write(self.CSV.encode('utf-8'))
+        # La primera fila ya se había insertado antes del "reinicio"
+        db.session.add(Tarjeta(nombre='Juan', apellido='Pérez', lista_id=self.lista_id))
+        job = ImportJob(lista_id=self.lista_id, usuario_id=self.user_id, filename='personas.csv',
+                        ruta_archivo=ruta, estado='en_proceso', procesadas=1, insertadas=1,
+                        fecha_actualizacion=latido)
+        db.session.add(job)
+        db.session.commit()
+        return job.id
+
+    def test_stale_job_resumes_from_last_chunk(self):
+        from app.utils.importacion import ejecutar_importacion
+        with self.app.app_context():
+            job_id = self._job_interrumpido(datetime.utcnow() - timedelta(hours=1))
+            ejecutar_importacion(job_id)
+
+            job = db.session.get(ImportJob, job_id)
+            self.assertEqual(job.estado, 'completado')
+            self.assertEqual(job.insertadas, 3)
+            nombres = sorted(t.nombre for t in Tarjeta.query.filter_by(lista_id=self.lista_id))
+            self.assertEqual(nombres, ['Ana', 'Juan', 'Luis'])
+
+    def test_rows_stream_into_insert_chunks(self):
+        from unittest import mock
+        from app.models import storage
+        from app.utils.importacion import ejecutar_importacion, _carpeta_uploads
+        ruta = os.path.join(_carpeta_uploads(self.app), 'streaming')
+        with open(ruta, 'wb') as f:
+            f.write(self.CSV.encode('utf-8'))
+
+        leidas_por_bloque = []
+        with self.app.app_context():
+            job = ImportJob(lista_id=self.lista_id, usuario_id=self.user_id, filename='personas.csv', ruta_archivo=ruta)
+            db.session.add(job)
+            db.session.commit()
+            job_id = job.id
+
+            def registrar(combinaciones):
+                leidas_por_bloque.append(db.session.get(ImportJob, job_id).filas_leidas)
+
+            with mock.patch.object(storage, 'combinar_personas', side_effect=registrar):
+                ejecutar_importacion(job_id, chunk_size=1)
+            self.assertEqual(db.session.get(ImportJob, job_id).insertadas, 3)
+        # Cada bloque se inserta antes de leer las filas siguientes
+        self.assertEqual(leidas_por_bloque, [1, 2, 3, 3])
+
+    def test_heartbeat_while_reading(self):
+        from app.utils.importacion import _con_latido
+        with self.app.app_context():
+            latido = datetime.utcnow() - timedelta(hours=1)
+            job = db.session.get(ImportJob, self._job_interrumpido(latido))
+            filas = _con_latido(iter(range(3)), job, intervalo=0)
+            next(filas)
+            next(filas)
+            self.assertGreater(job.fecha_actualizacion, latido + timedelta(minutes=59))
+
+    def test_app_factory_does_not_resume_jobs(self):
+        with self.app.app_context():
+            job_id = self._job_interrumpido(datetime.utcnow() - timedelta(hours=1))
+        create_app()
+        with self.app.app_context():
+            self.assertEqual(db.session.get(ImportJob, job_id).estado, 'en_proceso')
+
+        resultado = self.app.test_cli_runner().invoke(args=['reanudar-importaciones'])
+        self.assertIn('1 importaciones retomadas', resultado.output)
+        with self.app.app_context():
+            self.assertEqual(db.session.get(ImportJob, job_id).estado, 'completado')
+
+    def test_live_job_not_claimed_twice(self):
+        from app.utils.importacion import ejecutar_importacion
+        with self.app.app_context():
+            job_id = self._job_interrumpido(datetime.utcnow())
+            ejecutar_importacion(job_id)
+            self.assertEqual(db.session.get(ImportJob, job_id).insertadas, 1)
+            self.assertEqual(Tarjeta.query.filter_by(lista_id=self.lista_id).count(), 1)
+
+
+    def _subir(self, csv_texto, duplicados=None):
+        data = {'archivo': (io.BytesIO(csv_texto.encode('utf-8')), 'personas.csv')}
+        if duplicados:
+            data['duplicados'] = duplicados
+        response = self.client.post(f'/tableros/importar_excel/{self.lista_id}', data=data,
+                                    content_type='multipart/form-data', headers={'Accept': 'application/json'})
+        return self.client.get(response.json['status_url']).json['progreso']
+
+    def test_reupload_skips_duplicates(self):
+        self.login()
+        self._subir(self.CSV)
+        # Mismas personas con otro formato de nombre/dirección, más una nueva
+        progreso = self._subir(self.CSV.replace('Calle 1', 'calle 1.') + "JUAN PEREZ,Calle 1,999\nEva Ruiz,Calle 9,558\n")
+        self.assertEqual(progreso['accion_duplicados'], 'omitir')
+        self.assertEqual(progreso['duplicados'], 4)
+        self.assertEqual(progreso['insertadas'], 1)
+        with self.app.app_context():
+            self.assertEqual(Tarjeta.query.filter_by(lista_id=self.lista_id).count(), 4)
+
+    def test_merge_fills_empty_fields(self):
+        self.login()
+        with self.app.app_context():
+            db.session.add(Tarjeta(nombre='Juan', apellido='Pérez', direccion='Calle 1', telefono='',
+                                   email='juan@example.com', lista_id=self.lista_id))
+            db.session.commit()
+        progreso = self._subir("Nombre,Direccion,Telefono,Email\nJuan Perez,Otra 5,5550101234,JUAN@example.com\n",
+                               duplicados='combinar')
+        self.assertEqual((progreso['duplicados'], progreso['insertadas']), (1, 0))
+        with self.app.app_context():
+            tarjeta = Tarjeta.query.filter_by(lista_id=self.lista_id).one()
+            self.assertEqual(tarjeta.telefono, '5550101234')
+            self.assertEqual(tarjeta.direccion, 'Calle 1')
+
+    def test_flag_inserts_and_warns(self):
+        self.login()
+        self._subir(self.CSV)
+        progreso = self._subir(self.CSV, duplicados='marcar')
+        self.assertEqual((progreso['marcadas'], progreso['insertadas'], progreso['duplicados']), (3, 3, 0))
+        # Los avisos no son errores, y cada fila cuenta una sola vez en el progreso
+        self.assertEqual((progreso['total_errores'], progreso['errores']), (0, []))
+        self.assertEqual(progreso['avisos'][0], 'Posible duplicado: Juan Pérez (mismo nombre y dirección)')
+        self.assertEqual(progreso['insertadas'] + progreso['fallidas'] + progreso['duplicados'], progreso['filas_leidas'])
+
+    def test_rejected_rows_count_as_failed(self):
+        self.login()
+        # Dos filas sin nombre: se rechazan al extraer, antes del insert
+        progreso = self._subir("Nombre,Direccion,Telefono\nJuan Pérez,Calle 1,555\n,Calle 2,556\n"
+                               "Ana López,Calle 3,557\n,Calle 4,558\n")
+        self.assertEqual(progreso['estado'], 'completado')
+        self.assertEqual((progreso['filas_leidas'], progreso['insertadas'], progreso['fallidas']), (4, 2, 2))
+        self.assertEqual(progreso['insertadas'] + progreso['fallidas'] + progreso['duplicados'], progreso['filas_leidas'])
+
+
+class IndiceDuplicadosTestCase(unittest.TestCase):
+    def test_normalized_keys(self):
+        from app.utils.duplicados import IndiceDuplicados
+        indice = IndiceDuplicados([
+            {'id': 't1', 'nombre': 'María José', 'apellido': 'Núñez', 'direccion': 'Av. Central #5',
+             'email': 'MJ@Example.com ', 'telefono': '+1 (555) 010-1234'},
+            {'id': 't2', 'nombre': 'Pedro', 'telefono': '123'},
+        ])
+        self.assertEqual(indice.buscar({'nombre': 'x', 'email': 'mj@example.com'}), ('t1', 'email'))
+        self.assertEqual(indice.buscar({'nombre': 'x', 'telefono': '555-010-1234'}), ('t1', 'telefono'))
+        self.assertEqual(indice.buscar({'nombre': 'maria jose nunez', 'direccion': 'av central 5'}),
+                         ('t1', 'nombre_direccion'))
+        # Teléfonos muy cortos no son clave
+        self.assertIsNone(indice.buscar({'nombre': 'Otro', 'telefono': '123'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+from datetime import datetime
+from app import create_app, db
+from app.models import Usuario, Tablero, Lista, Tarjeta
+
+
+class QueryPlanTestCase(unittest.TestCase):
+    """Regresión de planes de consulta: las consultas calientes deben usar índices"""
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def plan(self, query):
+        compiled = query.statement.compile(db.engine)
+        # El plan no depende del valor de los parámetros, solo de su posición
+        params = tuple(str(compiled.params[k]) for k in compiled.positiontup)
+        filas = db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).fetchall()
+        return ' | '.join(str(f[-1]) for f in filas)
+
+    def assertUsesIndex(self, query, index_name):
+        plan = self.plan(query)
+        self.assertIn(index_name, plan, f"Plan sin índice {index_name}: {plan}")
+        self.assertNotRegex(plan, r'SCAN (TABLE )?(tarjetas|listas|usuarios|tableros)\b(?! USING)')
+
+    def test_listas_by_tablero(self):
+        self.assertUsesIndex(Lista.query.filter_by(tablero_id='t'), 'ix_listas_tablero_id')
+
+    def test_tarjetas_by_lista(self):
+        self.assertUsesIndex(Tarjeta.query.filter_by(lista_id='l'), 'ix_tarjetas_lista_coords')
+
+    def test_tarjetas_by_email(self):
+        self.assertUsesIndex(Tarjeta.query.filter_by(email='a@b.com'), 'ix_tarjetas_email')
+
+    def test_tarjetas_by_fecha_creacion_range(self):
+        query = Tarjeta.query.filter(
+            Tarjeta.fecha_creacion >= datetime(2026, 1, 1),
+            Tarjeta.fecha_creacion < datetime(2026, 2, 1)
+        )
+        self.assertUsesIndex(query, 'ix_tarjetas_fecha_creacion')
+
+    def test_tarjetas_by_fecha_nacimiento(self):
+        query = Tarjeta.query.filter(Tarjeta.fecha_nacimiento == datetime(1990, 5, 1).date())
+        self.assertUsesIndex(query, 'ix_tarjetas_fecha_nacimiento')
+
+    def test_usuario_by_stripe_customer(self):
+        self.assertUsesIndex(Usuario.query.filter_by(stripe_customer_id='cus_1'), 'ix_usuarios_stripe_customer_id')
+
+    def test_recent_tableros(self):
+        query = Tablero.query.order_by(Tablero.fecha_creacion.desc()).limit(4)
+        self.assertUsesIndex(query, 'ix_tableros_fecha_creacion')
+
+
+if __name__ == '__main__':
+    unittest.main()
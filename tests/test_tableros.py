@@ -0,0 +1,301 @@
+import unittest
+from sqlalchemy import event
+from app import create_app, db
+from app.models import Usuario, Tablero, Lista, Tarjeta, storage
+
+
+class QueryCounter:
+    """Contar las sentencias SQL ejecutadas dentro de un bloque with"""
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _callback(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._callback)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._callback)
+
+
+class TablerosTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+            user = Usuario(username='testuser', email='test@example.com')
+            user.set_password('password')
+            db.session.add(user)
+            db.session.commit()
+            self.user_id = user.id
+
+            tablero = Tablero(nombre="Test Board", creador_id=user.id)
+            db.session.add(tablero)
+            db.session.commit()
+            self.tablero_id = tablero.id
+
+            self.lista_ids = []
+            for i in range(5):
+                lista = Lista(nombre=f"Lista {i}", tablero_id=tablero.id)
+                db.session.add(lista)
+                db.session.flush()
+                self.lista_ids.append(lista.id)
+                for j in range(4):
+                    db.session.add(Tarjeta(nombre=f"P{i}-{j}", lista_id=lista.id))
+            db.session.commit()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def login(self):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = self.user_id
+            sess['username'] = 'testuser'
+
+    def test_get_tablero_completo_bounded_queries(self):
+        with self.app.app_context():
+            with QueryCounter(db.engine) as counter:
+                tablero = storage.get_tablero_completo(self.tablero_id)
+                data = tablero.to_dict()
+
+            self.assertEqual(data['total_listas'], 5)
+            self.assertEqual(data['total_tarjetas'], 20)
+            # tablero + listas + tarjetas, independiente del número de listas
+            self.assertLessEqual(counter.count, 3)
+
+    def test_get_tablero_data_endpoint(self):
+        self.login()
+        response = self.client.get(f'/tableros/api/tablero/{self.tablero_id}/data')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['total_tarjetas'], 20)
+
+    def test_resolver_tarjeta_single_query(self):
+        with self.app.app_context():
+            tarjeta_id = Tarjeta.query.filter_by(lista_id=self.lista_ids[3]).first().id
+            db.session.expunge_all()
+            with QueryCounter(db.engine) as counter:
+                tablero, lista, tarjeta = storage.resolver(tarjeta_id=tarjeta_id)
+
+            self.assertEqual(counter.count, 1)
+            self.assertEqual(tablero.id, self.tablero_id)
+            self.assertEqual(lista.id, self.lista_ids[3])
+            self.assertEqual(tarjeta.id, tarjeta_id)
+
+    def test_resolver_lista_and_missing(self):
+        with self.app.app_context():
+            tablero, lista, tarjeta = storage.resolver(lista_id=self.lista_ids[0])
+            self.assertEqual(tablero.id, self.tablero_id)
+            self.assertEqual(lista.id, self.lista_ids[0])
+            self.assertIsNone(tarjeta)
+
+            self.assertEqual(storage.resolver(lista_id='no-existe'), (None, None, None))
+
+    def test_eliminar_tarjeta_records_undo(self):
+        self.login()
+        with self.app.app_context():
+            tarjeta_id = Tarjeta.query.filter_by(lista_id=self.lista_ids[1]).first().id
+
+        response = self.client.delete(f'/tableros/eliminar_tarjeta/{tarjeta_id}')
+        self.assertEqual(response.status_code, 200)
+
+        with self.app.app_context():
+            self.assertIsNone(db.session.get(Tarjeta, tarjeta_id))
+            undo = storage._runtime_data[self.tablero_id]['undo_stack'][-1]
+            self.assertEqual(undo['type'], 'eliminar_tarjeta')
+            self.assertEqual(undo['data']['lista_id'], self.lista_ids[1])
+
+    def test_bulk_move_single_update_and_undo_data(self):
+        self.login()
+        with self.app.app_context():
+            origen = Tarjeta.query.filter_by(lista_id=self.lista_ids[0]).all()
+            ids = [t.id for t in origen[1:3]]
+
+        response = self.client.post('/tableros/api/bulk/move', json={
+            'tablero_id': self.tablero_id,
+            'tarjeta_ids': ids + ['no-existe'],
+            'lista_destino_id': self.lista_ids[4]
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['count'], 2)
+
+        with self.app.app_context():
+            for tarjeta_id in ids:
+                self.assertEqual(db.session.get(Tarjeta, tarjeta_id).lista_id, self.lista_ids[4])
+            moves = storage._runtime_data[self.tablero_id]['undo_stack'][-1]['data']['moves']
+            self.assertEqual([m['index'] for m in moves], [1, 2])
+            self.assertTrue(all(m['lista_origen_id'] == self.lista_ids[0] for m in moves))
+
+    def test_undo_bulk_move_restores_cards(self):
+        self.login()
+        with self.app.app_context():
+            ids = [t.id for t in Tarjeta.query.filter_by(lista_id=self.lista_ids[0]).all()[:2]]
+        self.client.post('/tableros/api/bulk/move', json={
+            'tablero_id': self.tablero_id,
+            'tarjeta_ids': ids,
+            'lista_destino_id': self.lista_ids[4]
+        })
+
+        response = self.client.post('/tableros/api/deshacer', json={'tablero_id': self.tablero_id})
+        self.assertEqual(response.status_code, 200)
+        with self.app.app_context():
+            for tarjeta_id in ids:
+                self.assertEqual(db.session.get(Tarjeta, tarjeta_id).lista_id, self.lista_ids[0])
+
+    def test_apply_clustering_loads_cards_once(self):
+        self.login()
+        with self.app.app_context():
+            ids = [t.id for t in Tarjeta.query.order_by(Tarjeta.nombre).all()]
+            engine = db.engine
+        clusters = [
+            {'members': [{'id': i} for i in ids[:6]]},
+            {'members': [{'id': i} for i in ids[6:12]] + [{'id': 'no-existe'}]},
+            {'members': [{'id': ids[12]}], 'is_outlier': True},
+        ]
+
+        with QueryCounter(engine) as pocas:
+            response = self.client.post('/tableros/api/clustering/apply',
+                                        json={'tablero_id': self.tablero_id, 'clusters': clusters[:1]})
+        self.assertIn('6 personas', response.json['message'])
+        with QueryCounter(engine) as muchas:
+            response = self.client.post('/tableros/api/clustering/apply',
+                                        json={'tablero_id': self.tablero_id, 'clusters': clusters})
+        self.assertEqual(response.json['created_lists'], 2)
+        self.assertIn('12 personas', response.json['message'])
+        # Una lista más por grupo, pero la carga de tarjetas no crece con las listas del tablero
+        self.assertLessEqual(muchas.count - pocas.count, 5)
+
+        with self.app.app_context():
+            self.assertEqual(Lista.query.filter_by(tablero_id=self.tablero_id).count(), 8)
+            self.assertNotIn(db.session.get(Tarjeta, ids[12]).lista_id,
+                             [l.id for l in Lista.query.filter(Lista.nombre.like('Grupo%'))])
+
+    def test_bulk_delete(self):
+        self.login()
+        with self.app.app_context():
+            ids = [t.id for t in Tarjeta.query.filter_by(lista_id=self.lista_ids[2]).all()]
+
+        response = self.client.post('/tableros/api/bulk/delete', json={
+            'tablero_id': self.tablero_id,
+            'tarjeta_ids': ids
+        })
+        self.assertEqual(response.json['count'], 4)
+
+        with self.app.app_context():
+            self.assertEqual(Tarjeta.query.filter_by(lista_id=self.lista_ids[2]).count(), 0)
+            deleted = storage._runtime_data[self.tablero_id]['undo_stack'][-1]['data']['deleted_cards']
+            self.assertEqual([c['index'] for c in deleted], [0, 1, 2, 3])
+            self.assertEqual(deleted[0]['tarjeta_data']['nombre'], 'P2-0')
+
+    def test_user_loaded_once_per_request(self):
+        self.login()
+        with self.app.app_context():
+            engine = db.engine
+        statements = []
+
+        def capturar(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', capturar)
+        try:
+            response = self.client.get(f'/tableros/{self.tablero_id}')
+        finally:
+            event.remove(engine, 'before_cursor_execute', capturar)
+
+        self.assertEqual(response.status_code, 200)
+        consultas_usuario = [s for s in statements if 'FROM usuarios' in s]
+        self.assertEqual(len(consultas_usuario), 1)
+
+        # El idioma quedó cacheado en la sesión firmada
+        with self.client.session_transaction() as sess:
+            self.assertIn('user_language', sess)
+
+    def test_stats_cached_and_invalidated(self):
+        with self.app.app_context():
+            storage.invalidar_stats()
+            with QueryCounter(db.engine) as counter:
+                stats = storage.get_stats()
+                storage.get_stats()
+            self.assertEqual(counter.count, 1)
+            self.assertEqual(stats['total_listas'], 5)
+            self.assertEqual(stats['total_personas'], 20)
+            self.assertEqual(stats['nuevos_mes'], 20)
+
+            db.session.add(Tarjeta(nombre="Nueva", lista_id=self.lista_ids[0]))
+            db.session.commit()
+            self.assertEqual(storage.get_stats()['total_personas'], 21)
+
+            tarjeta_ids = [t.id for t in Tarjeta.query.filter_by(lista_id=self.lista_ids[1])]
+            storage.bulk_delete_tarjetas(self.tablero_id, tarjeta_ids)
+            db.session.commit()
+            self.assertEqual(storage.get_stats()['total_personas'], 17)
+
+    def test_upcoming_birthdays_wrap_year(self):
+        from datetime import date
+        with self.app.app_context():
+            tarjetas = Tarjeta.query.filter_by(lista_id=self.lista_ids[0]).order_by(Tarjeta.nombre).all()
+            fechas = [date(1990, 1, 5), date(1985, 12, 31), date(2000, 6, 15), date(1975, 12, 29)]
+            for tarjeta, fecha in zip(tarjetas, fechas):
+                tarjeta.fecha_nacimiento = fecha
+            db.session.commit()
+            self.assertEqual(tarjetas[1].cumple_ordinal, 1231)
+
+            proximos = storage.get_upcoming_birthdays(limit=3, desde=date(2025, 12, 30))
+            self.assertEqual([t.fecha_nacimiento for t in proximos], fechas[1:2] + fechas[0:1] + fechas[2:3])
+
+            # Cambiar o borrar la fecha actualiza el ordinal
+            tarjetas[2].fecha_nacimiento = None
+            db.session.commit()
+            self.assertIsNone(tarjetas[2].cumple_ordinal)
+
+    def test_recordatorios_shows_birthdays(self):
+        from datetime import date
+        self.login()
+        hoy = date.today()
+        with self.app.app_context():
+            tarjeta = Tarjeta.query.filter_by(lista_id=self.lista_ids[0]).first()
+            tarjeta.fecha_nacimiento = hoy.replace(year=1990) if (hoy.month, hoy.day) != (2, 29) else date(1992, 2, 29)
+            db.session.commit()
+
+        response = self.client.get('/recordatorios?filtro=hoy')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Cumpleaños de P0-', response.get_data(as_text=True))
+
+
+    def test_importar_personas_in_chunks(self):
+        from datetime import date
+        personas = [{'nombre': f'Imp{i}', 'apellido': 'X', 'responsable': 'testuser', 'codigo_postal': '1',
+                     'numero_hijos': 0, 'fecha_nacimiento': date(1990, 3, 4) if i == 0 else None}
+                    for i in range(1200)]
+        personas[700]['nombre'] = None  # nombre es obligatorio
+        progreso = []
+
+        with self.app.app_context():
+            insertadas, errores = storage.importar_personas(
+                self.lista_ids[0], iter(personas), chunk_size=500,
+                on_progress=lambda n, errs: progreso.append(n)
+            )
+            self.assertEqual(insertadas, 1199)
+            self.assertEqual(len(errores), 1)
+            self.assertEqual(progreso, [500, 999, 1199])
+            # Sin objetos ORM en el identity map
+            self.assertEqual(len(db.session.identity_map), 0)
+
+            self.assertEqual(Tarjeta.query.filter_by(lista_id=self.lista_ids[0]).count(), 1203)
+            primera = Tarjeta.query.filter_by(nombre='Imp0').one()
+            self.assertEqual(primera.cumple_ordinal, 304)
+            self.assertEqual(len(primera.id), 36)
+            self.assertEqual(storage.get_stats()['total_personas'], 1219)
+
+
+if __name__ == '__main__':
+    unittest.main()